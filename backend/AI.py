@@ -1,66 +1,464 @@
 
 ####################....... AI.py
 import modal
-from .common import app, image, vol, TABLE_NAME 
+from .common import app, image, vol, state, TABLE_NAME 
 from .database import Database
 import os
 import shutil
 from . import search_global
 # import cv2
 # Import modules
-from . import extract, index, search, search_global # Added search_global
+from . import compact, dedup, extract, index, jobs, media, metrics, search, search_global, thumbs # Added search_global
+from .encoder import get_encoder, BatchingEncoder
+from .store import write_lock, bump_generation, current_generation, changed_videos
+from .cache import ResultCache, LRUCache
+import threading
+import time
+from .ann import IndexManager
 
 # Paths
 VOLUME_DB_PATH = "/data/lancedb_stable"
-TEMP_DB_PATH = "/tmp/lancedb_workpad"
 TEMP_FRAMES_DIR = "/tmp/frames_buffer"
+FRAME_QUEUE_SIZE = 64 # ~44 MB of decoded 640px frames in flight, max
+EXTRACT_WORKERS = int(os.environ.get("CHRONO_EXTRACT_WORKERS", "4")) # decode processes for long videos (extract.py)
+GENERATION_CHECK_SECONDS = 1.0 # how stale a searcher's view of the store may get
+SEARCH_CONCURRENCY = 32 # requests one VideoSearcher container handles at once (they batch together)
+VIDEO_CACHE_MB = float(os.environ.get("CHRONO_VIDEO_CACHE_MB", "512")) # hot per-video matrices for Deep Search
+VIDEO_CACHE_DTYPE = os.environ.get("CHRONO_VIDEO_CACHE_DTYPE", "float32") # or float16 (2x more videos)
+# Query encoder of VideoSearcher: "" = full SigLIP on a T4; text-int8 / text-onnx / text-onnx-int8 / text-fp32
+# = text tower only on CPU containers (encoder.SiglipTextEncoder). Set at deploy time, baked into the image.
+SEARCH_ENCODER = os.environ.get("CHRONO_SEARCH_ENCODER", "")
+SEARCH_GPU = None if SEARCH_ENCODER.startswith("text-") else "T4"
+SEARCH_CPU = float(os.environ.get("CHRONO_SEARCH_CPU", "4")) # cores per CPU search container
+search_image = image.env({"CHRONO_SEARCH_ENCODER": SEARCH_ENCODER})
+INDEXER_TIMEOUT = 3600 # per call (Modal's default is 300 s); drain_queue stops starting batches well before it
+DRAIN_BUDGET = 2400    # then hands the rest of the queue to a freshly spawned drain_queue
 
-@app.cls(image=image, gpu="T4", volumes={"/data": vol}, scaledown_window=300)
+@app.cls(image=image, gpu="T4", cpu=float(EXTRACT_WORKERS), volumes={"/data": vol}, scaledown_window=300,
+         timeout=INDEXER_TIMEOUT)
 class VideoIndexer:
-    @modal.method()
-    def process_video(self, video_path: str, video_id: str, title: str = "Untitled", tags: str = ""):
-        print(f"🎬 [MODULAR] Starting processing for {video_id}")
-        
-        if os.path.exists(TEMP_DB_PATH): shutil.rmtree(TEMP_DB_PATH)
-        if os.path.exists(TEMP_FRAMES_DIR): shutil.rmtree(TEMP_FRAMES_DIR)
-        
-        if os.path.exists(VOLUME_DB_PATH): 
-            shutil.copytree(VOLUME_DB_PATH, TEMP_DB_PATH, dirs_exist_ok=True)
-        else: 
-            os.makedirs(TEMP_DB_PATH)
+    @modal.enter()
+    def load_model(self):
+        # 🧠 Load SigLIP ONCE per container (not once per video)
+        start = time.perf_counter()
+        self.encoder = get_encoder().load()
+        metrics.observe("chrono_model_load_seconds", time.perf_counter() - start, component="indexer")
+        # Optional perceptual frame cache (CHRONO_FRAME_CACHE=1): seen frames skip the vision tower
+        self.caching_encoder = None
+        if dedup.FRAME_CACHE:
+            self.caching_encoder = dedup.CachingEncoder(self.encoder, dedup.FrameCache(VOLUME_DB_PATH))
+        self.new_cache_entries = {} # written with the next commit
+        self.ann_due = set() # tables whose IVF-PQ build is due (see _build_indexes)
+
+    @modal.exit()
+    def flush_metrics(self):
+        metrics.REGISTRY.flush(state)
 
+    @modal.method()
+    def process_video(self, video_path: str, video_id: str, title: str = "Untitled", tags: str = "",
+                      batch_size: int = 32, precision: str = "fp32", streaming: bool = True,
+                      extractor: str = "opencv", sampling: str = "fixed",
+                      min_interval: float = 0.5, max_interval: float = 10.0, workers: int = EXTRACT_WORKERS):
+        # One video, start to finish (the API queues jobs for drain_queue instead)
+        stages, counters = {}, {}
         try:
-            # 1. EXTRACT (Your Logic)
-            extract.extract_frames(video_path, TEMP_FRAMES_DIR)
-            
-            # 2. INDEX (Frames + New Metadata)
-            # 👇 We now pass title and tags here!
-            index.index_frames(TEMP_FRAMES_DIR, TEMP_DB_PATH, video_id, TABLE_NAME, title, tags)
-            
-            # 3. SYNC
-            shutil.copytree(TEMP_DB_PATH, VOLUME_DB_PATH, dirs_exist_ok=True)
-            vol.commit()
-            
+            frame_rows, meta_row = self._prepare(video_path, video_id, title, tags, batch_size, precision, streaming,
+                                                 extractor, sampling, min_interval, max_interval, workers,
+                                                 stages=stages, counters=counters)
+            stages.update(self._commit([(video_id, frame_rows, meta_row)]))
             Database().update_processing_status.remote(video_id, "completed")
+            jobs.record_direct(state, video_id, "completed", stages, counters)
             print("✅ Workflow Complete!")
+            self._build_indexes()
             
         except Exception as e:
             print(f"❌ Workflow Failed: {e}")
             Database().update_processing_status.remote(video_id, "failed")
+            jobs.record_direct(state, video_id, "failed", stages, counters)
+        finally:
+            metrics.REGISTRY.flush(state)
+
+    @modal.method()
+    def drain_queue(self):
+        # 📬 The ingest scheduler: packed batches from the durable queue (jobs.py), one commit per batch.
+        # Returns at once if another container is already draining; stops after DRAIN_BUDGET
+        # (a call killed at INDEXER_TIMEOUT would hold the scheduler lease until it expires).
+        try:
+            finished = jobs.drain(state, self._run_batch, on_abandoned=self._abandon, budget=DRAIN_BUDGET)
+            if jobs.pending_count(state):
+                if not jobs.scheduler_active(state):
+                    print(f"📬 {jobs.pending_count(state)} job(s) left, handing over to a new scheduler")
+                    VideoIndexer().drain_queue.spawn()
+            else:
+                self._build_indexes() # once the queue is empty, not between batches
+            return finished
+        finally:
+            metrics.REGISTRY.flush(state)
+
+    def _run_batch(self, batch):
+        results, prepared = {}, []
+        for job in batch:
+            stages, counters = {}, {}
+            try:
+                frame_rows, meta_row = self._prepare(video_id=job["video_id"], stages=stages, counters=counters,
+                                                     **job["params"])
+                prepared.append((job, stages, counters, frame_rows, meta_row))
+            except Exception as e:
+                print(f"❌ {job['video_id']} failed: {e}")
+                results[job["job_id"]] = ("failed", stages, counters)
+
+        if prepared:
+            commit_stages = {}
+            try:
+                commit_stages = self._commit([(job["video_id"], frame_rows, meta_row)
+                                              for job, _, _, frame_rows, meta_row in prepared])
+                status = "completed"
+            except Exception as e:
+                print(f"❌ Commit failed: {e}")
+                status = "failed"
+            for job, stages, counters, _, _ in prepared:
+                stages.update(commit_stages) # shared by the whole batch
+                counters["batch_size"] = len(prepared)
+                results[job["job_id"]] = (status, stages, counters)
+
+        db = Database()
+        for job in batch:
+            db.update_processing_status.remote(job["video_id"], results[job["job_id"]][0])
+        return results
+
+    def _abandon(self, abandoned):
+        for job in abandoned:
+            print(f"🪦 Giving up on {job['video_id']} after {job['attempts']} attempts")
+            Database().update_processing_status.remote(job["video_id"], "failed")
+
+    def _prepare(self, video_path, video_id, title="Untitled", tags="", batch_size=32, precision="fp32",
+                 streaming=True, extractor="opencv", sampling="fixed", min_interval=0.5, max_interval=10.0,
+                 workers=EXTRACT_WORKERS, clone_from=None, stages=None, counters=None):
+        """
+        Steps 0-2b for one video (no DB writes). Returns (frame_rows, meta_row); fills stages with
+        seconds and counters with frames / bytes / frame cache hits (both also go to metrics.py).
+        clone_from: an indexed video with the same bytes -> its frame rows + thumbnails are reused.
+        """
+        print(f"🎬 [MODULAR] Starting processing for {video_id}")
+        lap = metrics.Stopwatch(stages, "chrono_ingest_stage_seconds").lap
+        counters = {} if counters is None else counters
+        counters["bytes"] = os.path.getsize(video_path)
+        metrics.inc("chrono_ingest_bytes_total", counters["bytes"])
+
+        if os.path.exists(TEMP_FRAMES_DIR): shutil.rmtree(TEMP_FRAMES_DIR)
+
+        # 0. FAST-START: moov before mdat, so /api/stream can start playback from the first bytes
+        # (lossless remux, published straight away)
+        try:
+            vol.reload() # the upload was committed by another container
+            if media.faststart(video_path):
+                vol.commit()
+                print("⚡ Remuxed to fast-start MP4")
+        except Exception as e:
+            print(f"⚠️ Fast-start remux skipped: {e}")
+        lap("faststart")
+
+        # 0b. DUPLICATE UPLOAD: same bytes -> same frames -> same vectors (only the title/tags row is new)
+        if clone_from:
+            frame_rows = index.clone_frame_rows(VOLUME_DB_PATH, TABLE_NAME, clone_from, video_id)
+            if frame_rows:
+                meta_row = index.embed_meta(video_id, title, tags, encoder=self.encoder)
+                try:
+                    thumbs.copy(clone_from, video_id)
+                except Exception as e:
+                    print(f"⚠️ Thumbnails not copied: {e}")
+                lap("clone")
+                counters["frames"] = len(frame_rows)
+                counters["cloned_from"] = clone_from
+                metrics.inc("chrono_ingest_frames_total", len(frame_rows), source="cloned")
+                print(f"♻️ Reused {len(frame_rows)} frame vectors of {clone_from}")
+                return frame_rows, meta_row
+            print(f"⚠️ {clone_from} has no frames any more, indexing from scratch")
+
+        # 1. EXTRACT (Your Logic)
+        # Streaming: decoder thread -> bounded queue -> embedder (no JPEG round-trip)
+        # Adaptive: only keep frames where the scene changes (min/max interval in seconds)
+        # Long videos: `workers` processes decode time ranges in parallel, frames stay in order
+        adaptive = {}
+        if sampling == "adaptive":
+            adaptive = {"min_interval": min_interval, "max_interval": max_interval}
+        # Poster + scrub sprites are cut from the same decoded frames (no second decode)
+        collector = thumbs.ThumbnailCollector(video_id)
+        frames = None
+        if streaming:
+            frames = extract.stream_frames(video_path, queue_size=FRAME_QUEUE_SIZE, extractor=extractor,
+                                           sampling=sampling, tap=collector.tap, workers=workers, **adaptive)
+        else:
+            extract.extract_frames(video_path, TEMP_FRAMES_DIR, extractor=extractor, sampling=sampling,
+                                   tap=collector.tap, workers=workers, **adaptive)
+            lap("extract")
+
+        # 2. EMBED (Frames + New Metadata) - in memory, no DB yet
+        # 👇 We now pass title and tags here!
+        cache_before = self.caching_encoder.stats() if self.caching_encoder else None
+        frame_rows, meta_row, _ = index.embed_video(TEMP_FRAMES_DIR, video_id, title, tags,
+                                                    encoder=self.caching_encoder or self.encoder,
+                                                    batch_size=batch_size, precision=precision, frames=frames)
+        lap("extract_embed" if streaming else "embed") # streaming overlaps the two
+        counters["frames"] = len(frame_rows)
+        metrics.inc("chrono_ingest_frames_total", len(frame_rows), source="extracted")
+        if self.caching_encoder:
+            self.new_cache_entries.update(self.caching_encoder.take_new())
+            cache_stats = self.caching_encoder.stats()
+            for stat, result in (("hits", "hit"), ("misses", "miss")):
+                counters[f"frame_cache_{stat}"] = cache_stats[stat] - cache_before[stat]
+                metrics.sync("chrono_cache_lookups_total", cache_stats[stat], cache="frame_cache", result=result)
+            print(f"🧩 Frame cache: {cache_stats}")
+
+        # 2b. THUMBNAILS (nice to have - never fail the job over them)
+        try:
+            collector.finish()
+        except Exception as e:
+            print(f"⚠️ Thumbnails skipped: {e}")
+        lap("thumbnails")
+        return frame_rows, meta_row
+
+    def _commit(self, prepared):
+        """
+        3. WRITE + SYNC for [(video_id, frame_rows, meta_row)], one writer at a time.
+        No more copytree of the whole store: delete old rows + append new fragments,
+        then ONE commit for the batch. Other containers see all changes together.
+        Returns seconds per commit stage (commit_lock_wait, commit_write, ..., commit).
+        """
+        start = time.perf_counter()
+        stopwatch = metrics.Stopwatch(metric="chrono_ingest_commit_seconds")
+        with write_lock(state):
+            stopwatch.lap("lock_wait")
+            vol.reload()
+            written = {}
+            for video_id, frame_rows, meta_row in prepared:
+                for table, rows in index.write_video(VOLUME_DB_PATH, video_id, TABLE_NAME, frame_rows, meta_row).items():
+                    written[table] = written.get(table, 0) + rows
+            stopwatch.lap("write")
+            # 4. ANN INDEX: only count the new rows here; a due (re)build runs after the commit
+            self.ann_due.update(IndexManager(VOLUME_DB_PATH).record(written))
+            stopwatch.lap("ann_record")
+            if self.new_cache_entries:
+                try:
+                    self.caching_encoder.cache.add(self.new_cache_entries) # keeps its key set current
+                except Exception as e:
+                    print(f"⚠️ Frame cache not updated: {e}")
+                self.new_cache_entries = {}
+                stopwatch.lap("frame_cache")
+            vol.commit()
+            for video_id, _, _ in prepared:
+                bump_generation(state, video_id) # searchers drop cached results + reload
+            stopwatch.lap("vol_commit")
+        for table, rows in written.items():
+            metrics.inc("chrono_ingest_vectors_written_total", rows, table=table)
+        stages = {f"commit_{name}": seconds for name, seconds in stopwatch.stages.items()}
+        stages["commit"] = time.perf_counter() - start
+        return stages
+
+    def _build_indexes(self):
+        """
+        IVF-PQ (re)builds due from earlier commits, as their own step: the batch is
+        already committed and visible, its jobs are finished, and the build takes the
+        write lock on its own (its lease is renewed for as long as the build runs).
+        Never fails the ingest: a failed build stays due for the next commit.
+        """
+        if not self.ann_due:
+            return
+        due, self.ann_due = sorted(self.ann_due), set()
+        stopwatch = metrics.Stopwatch(metric="chrono_ingest_commit_seconds")
+        try:
+            with write_lock(state):
+                stopwatch.lap("ann_lock_wait")
+                vol.reload()
+                built = IndexManager(VOLUME_DB_PATH).build_due(due)
+                if built:
+                    vol.commit() # searchers pick the index up with their next reload
+                stopwatch.lap("ann_index")
+        except Exception as e:
+            print(f"⚠️ Index build failed ({', '.join(due)}): {e}")
+            self.ann_due.update(due)
 
-@app.cls(image=image, gpu="T4", volumes={"/data": vol}, scaledown_window=300)
+    @modal.method()
+    def remove_video(self, video_id: str):
+        # 🗑️ Drop a deleted video's vectors + file (same single-writer path as ingest)
+        with write_lock(state):
+            vol.reload()
+            index.delete_video(VOLUME_DB_PATH, video_id, TABLE_NAME)
+            video_path = f"/data/videos/{video_id}.mp4"
+            if os.path.exists(video_path): os.remove(video_path)
+            thumbs.remove(video_id)
+            vol.commit()
+            bump_generation(state, video_id)
+        print(f"🗑️ Removed {video_id}")
+
+    @modal.method()
+    def migrate_storage(self, fmt: str = "int8", keep_full: bool = False, force: bool = False):
+        # 🗜️ One-off: rewrite the frame table as float16 / int8 (see compact.py), then rebuild its ANN index
+        with write_lock(state):
+            vol.reload()
+            report = compact.migrate_table(VOLUME_DB_PATH, TABLE_NAME, fmt, keep_full, force=force)
+            manager = IndexManager(VOLUME_DB_PATH)
+            manager.forget(TABLE_NAME)
+            manager.build_due([TABLE_NAME]) # float32 / float16 column; int8-only tables are skipped
+            vol.commit()
+            bump_generation(state)
+        return report
+
+    @modal.method()
+    def backfill_segments(self):
+        # 🧩 One-off: segment vectors for videos indexed before segment search existed
+        with write_lock(state):
+            vol.reload()
+            written = index.backfill_segments(VOLUME_DB_PATH, TABLE_NAME)
+            IndexManager(VOLUME_DB_PATH).refresh({index.segment_table_name(TABLE_NAME): written})
+            vol.commit()
+            bump_generation(state)
+        return written
+
+    @modal.method()
+    def backfill_thumbnails(self, extractor: str = "opencv"):
+        # 🖼️ One-off: posters + sprites for videos indexed before thumbnails existed (decode only, no GPU work)
+        vol.reload()
+        video_dir = "/data/videos"
+        missing = [name[:-len(".mp4")] for name in sorted(os.listdir(video_dir)) if name.endswith(".mp4")
+                   and not os.path.exists(os.path.join(thumbs.THUMBS_DIR, name[:-len(".mp4")], "sprites.json"))]
+        done = []
+        for video_id in missing:
+            collector = thumbs.ThumbnailCollector(video_id)
+            try:
+                for _ in extract.sample_frames(os.path.join(video_dir, f"{video_id}.mp4"), extractor, tap=collector.tap):
+                    pass
+                collector.finish()
+                done.append(video_id)
+            except Exception as e:
+                print(f"⚠️ Thumbnails failed for {video_id}: {e}")
+        vol.commit()
+        return done
+
+@app.function(schedule=modal.Period(minutes=5))
+def kick_ingest_queue():
+    # ⏰ Safety net: a scheduler that died mid-batch leaves jobs behind until its leases run out
+    if jobs.pending_count(state) and not jobs.scheduler_active(state):
+        print(f"📬 {jobs.pending_count(state)} queued job(s) without a scheduler, starting one")
+        VideoIndexer().drain_queue.spawn()
+
+@app.cls(image=search_image, gpu=SEARCH_GPU, cpu=None if SEARCH_GPU else SEARCH_CPU, volumes={"/data": vol},
+         scaledown_window=300)
+@modal.concurrent(max_inputs=SEARCH_CONCURRENCY)
 class VideoSearcher:
+    @modal.enter()
+    def load_model(self):
+        # 🧠 Load SigLIP ONCE per container (not once per query) - or just its text tower (SEARCH_ENCODER)
+        start = time.perf_counter()
+        self.encoder = get_encoder(SEARCH_ENCODER or None).load()
+        if getattr(self.encoder, "exported", False):
+            vol.commit() # first CPU container exported the ONNX graph: the next ones just load it
+        metrics.observe("chrono_model_load_seconds", time.perf_counter() - start, component="searcher",
+                        encoder=SEARCH_ENCODER or "siglip")
+        # Concurrent requests share one batched text forward pass (see encoder.BatchingEncoder)
+        self.query_encoder = BatchingEncoder(self.encoder)
+        # Results are only reused while the store is unchanged (see _sync_generation)
+        self.results = ResultCache()
+        # Deep Search: each video's vectors as one matrix, LRU by bytes
+        self.video_matrices = LRUCache(int(VIDEO_CACHE_MB * 1024 * 1024))
+        self.generation = current_generation(state)
+        self.generation_checked = time.monotonic()
+        self.generation_lock = threading.Lock()
+
+    @modal.exit()
+    def flush_metrics(self):
+        self._collect_cache_stats()
+        metrics.REGISTRY.flush(state)
+
+    def _collect_cache_stats(self):
+        # The caches keep running totals; metrics.sync turns them into counter increments
+        for cache, stats in (("query_vectors", self.encoder.query_cache.stats()), ("results", self.results.stats()),
+                             ("video_matrices", self.video_matrices.stats())):
+            metrics.sync("chrono_cache_lookups_total", stats["hits"], cache=cache, result="hit")
+            metrics.sync("chrono_cache_lookups_total", stats["misses"], cache=cache, result="miss")
+
+    def _timed(self, endpoint, run):
+        # Per request: total time, result cache hit/miss, and encode/search/format on a miss
+        start = time.perf_counter()
+        timings = {}
+        results = run(timings)
+        metrics.observe("chrono_search_seconds", time.perf_counter() - start, endpoint=endpoint)
+        metrics.inc("chrono_search_requests_total", endpoint=endpoint, cache="miss" if timings else "hit")
+        metrics.observe_stages("chrono_search_stage_seconds", timings, endpoint=endpoint)
+        metrics.REGISTRY.maybe_flush(state, collect=self._collect_cache_stats)
+        return results
+
+    def _sync_generation(self):
+        # At most one modal.Dict read per GENERATION_CHECK_SECONDS; on change, pick up the new data
+        with self.generation_lock:
+            if time.monotonic() - self.generation_checked >= GENERATION_CHECK_SECONDS:
+                self.generation_checked = time.monotonic()
+                generation = current_generation(state)
+                if generation != self.generation:
+                    print(f"🔄 Store changed (generation {self.generation} -> {generation}), reloading")
+                    try:
+                        vol.reload()
+                    except Exception as e:
+                        # Another request in this container still has LanceDB files open: keep serving
+                        # the old generation (caches untouched), the next check tries again
+                        print(f"⚠️ Volume reload skipped: {e}")
+                        return self.generation
+                    self.results.clear()
+                    # Only re-ingested / deleted videos lose their hot matrix
+                    changed = changed_videos(state, self.generation)
+                    if changed is None:
+                        self.video_matrices.clear()
+                    else:
+                        for video_id in changed:
+                            self.video_matrices.pop(video_id)
+                    self.generation = generation
+            return self.generation
+
+    def _deep_search(self, query, filter_video_id, nprobes, refine_factor, limit, timings):
+        if filter_video_id:
+            # Inside ONE video: exact scan of its cached matrix (no LanceDB filter over every frame)
+            matrix = self.video_matrices.get(filter_video_id)
+            if matrix is None:
+                start = time.perf_counter()
+                matrix = search.load_video_matrix(VOLUME_DB_PATH, TABLE_NAME, filter_video_id, VIDEO_CACHE_DTYPE)
+                timings["load_matrix"] = time.perf_counter() - start
+                if matrix is None:
+                    return []
+                self.video_matrices.put(filter_video_id, matrix)
+            return search.search_video_matrix(query, matrix, filter_video_id, encoder=self.query_encoder, limit=limit,
+                                              timings=timings)
+        return search.search_index(query, VOLUME_DB_PATH, TABLE_NAME, None, encoder=self.query_encoder,
+                                   nprobes=nprobes, refine_factor=refine_factor, limit=limit, timings=timings)
+
     @modal.method()
-    def search(self, query: str, filter_video_id: str = None):
+    def search(self, query: str, filter_video_id: str = None, nprobes: int = None, refine_factor: int = None,
+               limit: int = 10):
         # Local Search (Inside a specific video or all frames)
         # Uses search.py (Your existing logic)
-        return search.search_index(query, VOLUME_DB_PATH, TABLE_NAME, filter_video_id)
+        generation = self._sync_generation()
+        return self._timed("deep", lambda timings: self.results.get_or_search(
+            "deep", query, generation,
+            lambda: self._deep_search(query, filter_video_id, nprobes, refine_factor, limit, timings),
+            video_id=filter_video_id, limit=limit, nprobes=nprobes, refine_factor=refine_factor))
 
     @modal.method()
-    def search_global(self, query: str):
+    def search_global(self, query: str, nprobes: int = None, refine_factor: int = None, k: int = 20,
+                      mode: str = "frames"):
         # Calls the new Hybrid Logic
-        # It needs the Frame Table name to scan frames
-        return search_global.search_global_unified(query, VOLUME_DB_PATH, TABLE_NAME)
+        # It needs the Frame Table name to scan frames (mode="segments": coarse-to-fine)
+        generation = self._sync_generation()
+        return self._timed("global", lambda timings: self.results.get_or_search(
+            "global", query, generation,
+            lambda: search_global.search_global_unified(query, VOLUME_DB_PATH, TABLE_NAME, encoder=self.query_encoder,
+                                                        nprobes=nprobes, refine_factor=refine_factor, k=k,
+                                                        mode=mode, timings=timings),
+            nprobes=nprobes, refine_factor=refine_factor, k=k, mode=mode))
+
+    @modal.method()
+    def cache_stats(self):
+        return {"query_vectors": self.encoder.query_cache.stats(), "results": self.results.stats(),
+                "video_matrices": self.video_matrices.stats(), "batching": self.query_encoder.stats(),
+                "generation": self.generation}
 
 @app.cls(image=image, volumes={"/data": vol})
 class FileHelper:
@@ -0,0 +1,144 @@
+####################....... ann.py
+import json
+import os
+import time
+
+from .compact import ann_column
+
+# Below these row counts brute force is fast enough (and an IVF index would be mostly empty)
+FRAME_THRESHOLD = 50_000
+DEFAULT_THRESHOLDS = {
+    "video_metadata_index": 10_000,
+}
+REBUILD_FRACTION = 0.2 # rebuild once 20% more rows arrived since the last build
+NUM_SUB_VECTORS = 96   # 1152 / 96 = 12 dims per PQ sub-vector
+
+# Per-request knobs (see search.search_index / search_global.search_global_unified)
+DEFAULT_NPROBES = 20
+DEFAULT_REFINE_FACTOR = None
+
+
+class IndexManager:
+    """
+    IVF-PQ lifecycle for the vector tables.
+    - Counts rows added since each table's last build (state lives next to the
+      tables in ann_state.json, so it rides along with vol.commit())
+    - Builds the first index once a table crosses its threshold, rebuilds
+      when rows added since the last build exceed REBUILD_FRACTION
+    Rows added after a build are still searched (brute force on the new
+    fragments), they just get slower until the next rebuild.
+    """
+
+    def __init__(self, db_path, thresholds=None, rebuild_fraction=REBUILD_FRACTION, accelerator=None):
+        self.db_path = db_path
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.rebuild_fraction = rebuild_fraction
+        self.accelerator = accelerator # "cuda" trains IVF/PQ on the GPU
+        self.state_path = os.path.join(db_path, "ann_state.json")
+
+    def load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_state(self, data):
+        os.makedirs(self.db_path, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def record_rows(self, table_name, count):
+        data = self.load_state()
+        entry = data.setdefault(table_name, {"indexed_rows": 0, "rows_since_build": 0})
+        entry["rows_since_build"] += count
+        self.save_state(data)
+
+    def needs_build(self, table_name, total_rows):
+        entry = self.load_state().get(table_name, {"indexed_rows": 0, "rows_since_build": 0})
+        if total_rows < self.thresholds.get(table_name, FRAME_THRESHOLD):
+            return False
+        if not entry["indexed_rows"]:
+            return True
+        return entry["rows_since_build"] >= self.rebuild_fraction * entry["indexed_rows"]
+
+    def forget(self, table_name):
+        """Drops a table's build state (its index is gone, e.g. after compact.migrate_table)."""
+        data = self.load_state()
+        if data.pop(table_name, None) is not None:
+            self.save_state(data)
+
+    def build(self, table_name):
+        import lancedb
+
+        tbl = lancedb.connect(self.db_path).open_table(table_name)
+        total_rows = tbl.count_rows()
+        num_partitions = max(1, int(total_rows ** 0.5))
+        print(f"🏗️ Building IVF-PQ on {table_name} ({total_rows} rows, {num_partitions} partitions)...")
+        start = time.perf_counter()
+        kwargs = {"accelerator": self.accelerator} if self.accelerator else {}
+        tbl.create_index(metric="cosine", num_partitions=num_partitions, num_sub_vectors=NUM_SUB_VECTORS,
+                         vector_column_name=ann_column(tbl.schema), replace=True, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        data = self.load_state()
+        data[table_name] = {
+            "indexed_rows": total_rows,
+            "rows_since_build": 0,
+            "num_partitions": num_partitions,
+            "built_at": time.time(),
+            "build_seconds": round(elapsed, 1),
+        }
+        self.save_state(data)
+        print(f"✅ Index ready in {elapsed:.1f}s")
+        return data[table_name]
+
+    def record(self, added):
+        """
+        After an ingest: added = {table_name: rows_written}. Cheap (no index work),
+        so it runs inside the commit; returns the tables now due a build_due().
+        """
+        import lancedb
+
+        db = lancedb.connect(self.db_path)
+        due = []
+        for table_name, count in added.items():
+            if table_name not in db.table_names():
+                continue
+            if ann_column(db.open_table(table_name).schema) is None:
+                continue # int8-only tables are scanned (compact.scan_topk), not IVF-PQ indexed
+            self.record_rows(table_name, count)
+            if self.needs_build(table_name, db.open_table(table_name).count_rows()):
+                due.append(table_name)
+        return due
+
+    def build_due(self, tables):
+        """Builds those of `tables` still due (another container may have built them since)."""
+        import lancedb
+
+        db = lancedb.connect(self.db_path)
+        built = []
+        for table_name in tables:
+            if table_name not in db.table_names() or ann_column(db.open_table(table_name).schema) is None:
+                continue
+            if self.needs_build(table_name, db.open_table(table_name).count_rows()):
+                self.build(table_name)
+                built.append(table_name)
+        return built
+
+    def refresh(self, added):
+        """record() + build_due() in one go (one-off jobs, benchmarks)."""
+        return self.build_due(self.record(added))
+
+
+def tune(search_job, nprobes=None, refine_factor=None):
+    """Applies per-request recall/latency knobs (ignored by LanceDB on unindexed tables)."""
+    nprobes = nprobes or DEFAULT_NPROBES
+    refine_factor = refine_factor or DEFAULT_REFINE_FACTOR
+    if nprobes:
+        search_job = search_job.nprobes(nprobes)
+    if refine_factor:
+        search_job = search_job.refine_factor(refine_factor)
+    return search_job
@@ -1,17 +1,155 @@
 ####################....... api.py
-from fastapi import APIRouter, UploadFile, File, Form
+from fastapi import APIRouter, UploadFile, File, Form, Request, Response
 from pydantic import BaseModel
+import asyncio
 import os
-import shutil
+import time
 import uuid
 
-from .auth import get_password_hash, verify_password, create_access_token
-from .database import Database
+from .auth import get_password_hash, verify_password, create_access_token, decode_access_token
+from .cache import LRUCache
+from .database import Database, PAGE_SIZE, decode_cursor
+from . import dedup, jobs, media, metrics, thumbs
 from .AI import VideoIndexer, VideoSearcher
-from .common import vol
+from .common import vol, state
+from .store import FEED_VERSION_KEY, GENERATION_KEY
 
 router = APIRouter()
 
+# Every handler is async: Modal calls go through .remote.aio / .spawn.aio and
+# blocking file I/O through asyncio.to_thread, so one slow call never stalls
+# the event loop (and the other requests in this container).
+VIDEO_DIR = "/data/videos"
+REPAIR_LOG_DIR = "/data/repair_logs"
+REINDEX_COOLDOWN_SECONDS = 300
+
+def _save_upload(src, save_path):
+    # One pass: write + sha256 (re-uploads of indexed bytes skip re-embedding)
+    with open(save_path, "wb") as buffer:
+        content_hash = dedup.copy_hashing(src, buffer)
+        metrics.inc("chrono_upload_bytes_total", buffer.tell())
+    return content_hash
+
+def _read_last_run(timestamp_file):
+    if not os.path.exists(timestamp_file):
+        return None
+    with open(timestamp_file, 'r') as f:
+        return float(f.read().strip())
+
+def _write_last_run(timestamp_file, when):
+    os.makedirs(os.path.dirname(timestamp_file), exist_ok=True)
+    with open(timestamp_file, 'w') as f:
+        f.write(str(when))
+
+async def _enqueue_ingest(kind, video_id, video_path, title, tags="", **extra):
+    """
+    Durable queue instead of one spawn (= one GPU container) per video: the job
+    merges into a waiting one for the same video, and a scheduler is started only
+    if none is draining (the running one re-checks the queue before it exits).
+    """
+    size = await asyncio.to_thread(os.path.getsize, video_path)
+    params = dict(extra, video_path=video_path, title=title, tags=tags or "")
+    _, coalesced = await asyncio.to_thread(jobs.enqueue, state, video_id, kind, params, size)
+    if not await asyncio.to_thread(jobs.scheduler_active, state):
+        await VideoIndexer().drain_queue.spawn.aio()
+    return coalesced
+
+# First feed page, cached per API container. Keyed by the shared feed version,
+# which uploads / visibility changes / deletes replace (other containers notice
+# within FEED_VERSION_CHECK_SECONDS); the TTL covers anything else.
+FEED_CACHE_TTL = 30.0
+FEED_VERSION_CHECK_SECONDS = 1.0
+feed_cache = LRUCache(1024 * 1024, ttl=FEED_CACHE_TTL, sizeof=lambda page: 200 * len(page["videos"]) + 200)
+_feed_version = {"value": None, "checked": float("-inf")}
+
+async def _current_feed_version():
+    if time.monotonic() - _feed_version["checked"] >= FEED_VERSION_CHECK_SECONDS:
+        _feed_version["value"] = await state.get.aio(FEED_VERSION_KEY, None)
+        _feed_version["checked"] = time.monotonic()
+    return _feed_version["value"]
+
+async def _invalidate_feed():
+    version = uuid.uuid4().hex
+    _feed_version.update(value=version, checked=time.monotonic())
+    await state.put.aio(FEED_VERSION_KEY, version)
+
+def _page_response(page, response):
+    # Body stays a plain list (what the frontend renders); the next page's cursor rides in a header
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["videos"]
+
+# /stream: stat results per path, so a play / seek / revalidation never touches
+# the volume metadata. Files only change in this container's view when the
+# volume reloads, and every reload clears the cache.
+STAT_CACHE_TTL = 60.0
+RELOAD_MIN_SECONDS = 5.0 # unknown video ids can't force a reload per request
+STREAM_CHUNK = 1024 * 1024
+stat_cache = LRUCache(4 * 1024 * 1024, ttl=STAT_CACHE_TTL, sizeof=lambda st: 200)
+_last_reload = {"at": float("-inf")}
+# /thumbs: a missing thumbnail is normal (not indexed yet, or indexed before thumbnails
+# existed), so a miss is remembered for THUMB_MISS_TTL and only reloads the volume
+# when the store generation moved (an ingest committed since the last thumbs reload)
+THUMB_MISS_TTL = 30.0
+thumb_misses = LRUCache(1024 * 1024, ttl=THUMB_MISS_TTL, sizeof=lambda _: 100)
+_thumbs_generation = {"value": None}
+
+async def _reload_volume():
+    _last_reload["at"] = time.monotonic()
+    try:
+        await vol.reload.aio()
+    except Exception as e: # e.g. files still open for another stream
+        print(f"⚠️ Volume reload skipped: {e}")
+    stat_cache.clear()
+    thumb_misses.clear()
+
+def _stat_or_none(path):
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+async def _stat_video(path, reload=True):
+    st = stat_cache.get(path)
+    if st is None:
+        st = await asyncio.to_thread(_stat_or_none, path)
+        if st is None and reload and time.monotonic() - _last_reload["at"] >= RELOAD_MIN_SECONDS:
+            print(f"🔄 Refreshing Volume for {os.path.basename(path)}...")
+            await _reload_volume()
+            st = await asyncio.to_thread(_stat_or_none, path)
+        if st is not None:
+            stat_cache.put(path, st)
+    return st
+
+async def _stat_thumb(path):
+    if thumb_misses.get(path):
+        return None
+    st = await _stat_video(path, reload=False)
+    if st is None:
+        generation = await state.get.aio(GENERATION_KEY, 0)
+        if generation != _thumbs_generation["value"] and time.monotonic() - _last_reload["at"] >= RELOAD_MIN_SECONDS:
+            _thumbs_generation["value"] = generation
+            print(f"🔄 Refreshing Volume for thumbnails (generation {generation})...")
+            await _reload_volume()
+            st = await _stat_video(path, reload=False)
+    if st is None:
+        thumb_misses.put(path, True)
+    return st
+
+async def _read_range(path, start, end):
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(STREAM_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
 class UserAuth(BaseModel):
     username: str
     password: str
@@ -21,25 +159,25 @@ class GoogleAuthRequest(BaseModel):
 
 class VideoUpdate(BaseModel):
     video_id: str
-    user_id: str
+    user_id: str = None # ignored for ownership (the token decides), must match it if sent
     action: str
     new_visibility: str = None
 
 # --- AUTH ---
 @router.post("/register")
 async def register(user: UserAuth):
-    db = Database()
-    db.init_db.remote()
-    if db.create_user.remote(uuid.uuid4().hex, user.username, get_password_hash(user.password)):
+    db = Database() # schema is migrated when the Database container starts
+    # bcrypt is CPU-heavy: hash on a worker thread
+    password_hash = await asyncio.to_thread(get_password_hash, user.password)
+    if await db.create_user.remote.aio(uuid.uuid4().hex, user.username, password_hash):
         return {"status": "created"}
     return {"error": "Taken"}
 
 @router.post("/login") 
 async def login(auth_data: UserAuth):
     db = Database()
-    db.init_db.remote()
-    user = db.get_user_by_username.remote(auth_data.username)
-    if not user or not verify_password(auth_data.password, user['password_hash']):
+    user = await db.get_user_by_username.remote.aio(auth_data.username)
+    if not user or not await asyncio.to_thread(verify_password, auth_data.password, user['password_hash']):
         return {"error": "Invalid"}
     token = create_access_token({"sub": user['user_id'], "name": user['username']})
     return {"access_token": token, "user_id": user['user_id'], "username": user['username']}
@@ -53,65 +191,128 @@ async def upload_video(
     tags: str = Form(""),
     visibility: str = Form("public")
 ):
-    Database().init_db.remote()
-    save_dir = "/data/videos"
+    db = Database()
+    save_dir = VIDEO_DIR
     os.makedirs(save_dir, exist_ok=True) # Cloud only
 
     video_id = f"{user_id}_{uuid.uuid4().hex[:6]}"
     save_path = f"{save_dir}/{video_id}.mp4"
     
-    with open(save_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    vol.commit() 
-    
-    Database().add_video.remote(video_id, user_id, file.filename, title, tags, visibility)
+    # Copy (+ hash) the upload on a worker thread
+    content_hash = await asyncio.to_thread(_save_upload, file.file, save_path)
+    _, indexed_copy = await asyncio.gather(
+        vol.commit.aio(),
+        db.add_video.remote.aio(video_id, user_id, file.filename, title, tags, visibility, content_hash))
     
-    # 🚀 SPAWN AI (Background)
-    VideoIndexer().process_video.spawn(save_path, video_id, title)
+    # 🚀 QUEUE AI (Background) - after the commit, so the indexer sees the file
+    # Same bytes already indexed -> the indexer clones those vectors (clone_from)
+    extra = {"clone_from": indexed_copy} if indexed_copy else {}
+    await asyncio.gather(_enqueue_ingest("upload", video_id, save_path, title, tags, **extra), _invalidate_feed())
+    metrics.REGISTRY.maybe_flush(state)
     
     return {"status": "success", "video_id": video_id}
 
 @router.get("/feed")
-async def get_home_feed():
-    return Database().get_public_feed.remote()
+async def get_home_feed(response: Response, cursor: str = None, limit: int = PAGE_SIZE):
+    # Newest public videos, one page at a time (next page: ?cursor=<X-Next-Cursor>)
+    try:
+        if cursor: decode_cursor(cursor)
+    except ValueError as e:
+        return {"error": str(e)}
+    first_page = cursor is None and limit == PAGE_SIZE
+    if first_page:
+        key = ("feed", await _current_feed_version())
+        page = feed_cache.get(key)
+        if page is None:
+            page = await Database().get_public_feed.remote.aio(limit, cursor)
+            feed_cache.put(key, page)
+    else:
+        page = await Database().get_public_feed.remote.aio(limit, cursor)
+    return _page_response(page, response)
 
 @router.get("/my_videos")
-async def get_my_videos(user_id: str):
-    return Database().get_user_videos.remote(user_id)
+async def get_my_videos(response: Response, user_id: str, cursor: str = None, limit: int = PAGE_SIZE):
+    try:
+        if cursor: decode_cursor(cursor)
+    except ValueError as e:
+        return {"error": str(e)}
+    return _page_response(await Database().get_user_videos.remote.aio(user_id, limit, cursor), response)
 
 @router.get("/search")
-def search_video(query: str, video_id: str = None):
-    return {"results": VideoSearcher().search.remote(query, video_id)}
+async def search_video(query: str, video_id: str = None, nprobes: int = None, refine_factor: int = None):
+    # nprobes / refine_factor: ANN recall vs latency (see ann.py)
+    return {"results": await VideoSearcher().search.remote.aio(query, video_id, nprobes, refine_factor)}
 
 @router.get("/status")
-def get_video_status(video_id: str):
-    meta = Database().get_video_metadata.remote(video_id)
+async def get_video_status(video_id: str):
+    # job = queued/running state, or the last run's wait + per-stage seconds + counters (see jobs.job_status)
+    meta, job = await asyncio.gather(Database().get_video_metadata.remote.aio(video_id),
+                                     asyncio.to_thread(jobs.job_status, state, video_id))
     if not meta: return {"status": "not_found", "indexed": False}
-    return {"status": meta.get("status", "processing"), "indexed": (meta.get("status") == "completed")}
+    return {"status": meta.get("status", "processing"), "indexed": (meta.get("status") == "completed"), "job": job}
 
 @router.get("/search_global")
-def search_global(query: str):
-    return {"results": VideoSearcher().search_global.remote(query)}
+async def search_global(query: str, nprobes: int = None, refine_factor: int = None, k: int = 20,
+                        mode: str = "frames"):
+    # k = number of DISTINCT videos returned, mode = "frames" | "segments" (coarse-to-fine)
+    return {"results": await VideoSearcher().search_global.remote.aio(query, nprobes, refine_factor, k, mode)}
 # backend/api.py
 
 @router.get("/stream/{video_id}")
-async def stream_video(video_id: str):
-    import os
-    from fastapi.responses import FileResponse
-    from .common import vol
+async def stream_video(video_id: str, request: Request):
+    from fastapi.responses import StreamingResponse
 
-    file_path = f"/data/videos/{video_id}.mp4"
-    
-    # 1. Force Refresh
-    if not os.path.exists(file_path):
-        print(f"🔄 Refreshing Volume for {video_id}...")
-        vol.reload()
-        
-    # 2. Return File
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="video/mp4")
+    file_path = f"{VIDEO_DIR}/{video_id}.mp4"
     
-    return {"error": "File not found"}
+    # 1. Stat (cached; reloads the volume only for unknown files, rate-limited)
+    st = await _stat_video(file_path)
+    if st is None:
+        return {"error": "File not found"}
+
+    # 2. Conditional GET: the browser already has these bytes
+    tag = media.etag(st)
+    headers = {"ETag": tag, "Last-Modified": media.http_date(st.st_mtime), "Accept-Ranges": "bytes",
+               "Cache-Control": "public, no-cache"} # may store, must revalidate (cheap 304)
+    if media.not_modified(request.headers, tag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    # 3. Range (seeking / the player's first probe) or the whole file
+    byte_range = None
+    if media.range_applies(request.headers, tag, st.st_mtime):
+        try:
+            byte_range = media.parse_range(request.headers.get("range"), st.st_size)
+        except ValueError:
+            return Response(status_code=416, headers=dict(headers, **{"Content-Range": f"bytes */{st.st_size}"}))
+    start, end = byte_range or (0, st.st_size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    return StreamingResponse(_read_range(file_path, start, end), status_code=206 if byte_range else 200,
+                             media_type="video/mp4", headers=headers)
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+@router.get("/thumbs/{video_id}/{name}")
+async def video_thumb(video_id: str, name: str, request: Request):
+    # 🖼️ poster.jpg / sprite_{n}.jpg / sprites.json, written by the indexing pass (see thumbs.py)
+    if not thumbs.is_thumb_file(name) or os.path.basename(video_id) != video_id:
+        return Response(status_code=404)
+    file_path = f"{thumbs.THUMBS_DIR}/{video_id}/{name}"
+    st = await _stat_thumb(file_path)
+    if st is None:
+        return Response(status_code=404) # not indexed yet -> the player just shows no poster
+
+    tag = media.etag(st)
+    headers = {"ETag": tag, "Last-Modified": media.http_date(st.st_mtime),
+               "Cache-Control": "public, max-age=3600"} # small + only change on re-index
+    if media.not_modified(request.headers, tag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+    body = await asyncio.to_thread(_read_file, file_path)
+    return Response(body, media_type="application/json" if name.endswith(".json") else "image/jpeg",
+                    headers=headers)
 
 
 @router.post("/google_login")
@@ -138,14 +339,13 @@ async def google_login(request: GoogleAuthRequest):
 
     # 2. Check DB
     db = Database()
-    db.init_db.remote()
-    user = db.get_user_by_username.remote(email)
+    user = await db.get_user_by_username.remote.aio(email)
     
     user_id = None
     if not user:
         # Create User
         user_id = uuid.uuid4().hex
-        db.create_user.remote(user_id, email, "GOOGLE_AUTH_PLACEHOLDER")
+        await db.create_user.remote.aio(user_id, email, "GOOGLE_AUTH_PLACEHOLDER")
     else:
         user_id = user['user_id']
 
@@ -156,13 +356,20 @@ async def google_login(request: GoogleAuthRequest):
 
 @router.post("/reindex")
 async def reindex_video(video_id: str, user_id: str = Form(None)): # Allow None
-    import os
     import time
-    from .common import vol
     
-    # 🕵️‍♂️ CHECK 1: Existence
+    # 🕵️‍♂️ CHECKS 1, 3 + 4 read independent things: fetch them all at once
     db = Database()
-    meta = db.get_video_metadata.remote(video_id)
+    video_path = f"{VIDEO_DIR}/{video_id}.mp4"
+    timestamp_file = f"{REPAIR_LOG_DIR}/{video_id}.last_run"
+    async def read_files():
+        await _reload_volume() # reload first: it can't run while we hold files open
+        return await asyncio.gather(asyncio.to_thread(os.path.exists, video_path),
+                                    asyncio.to_thread(_read_last_run, timestamp_file))
+
+    meta, (file_found, last_run) = await asyncio.gather(db.get_video_metadata.remote.aio(video_id), read_files())
+
+    # 🕵️‍♂️ CHECK 1: Existence
     if not meta:
         return {"error": "Video not found"}
 
@@ -175,47 +382,84 @@ async def reindex_video(video_id: str, user_id: str = Form(None)): # Allow None
         return {"error": "Already processing! Please wait."}
 
     # 🕵️‍♂️ CHECK 3: File Existence
-    vol.reload()
-    if not os.path.exists(f"/data/videos/{video_id}.mp4"):
-        db.update_processing_status.remote(video_id, "failed_missing_file")
+    if not file_found:
+        await db.update_processing_status.remote.aio(video_id, "failed_missing_file")
         return {"error": "CRITICAL: Video file missing from disk."}
 
     # 🕵️‍♂️ CHECK 4: COOL-DOWN TIMER (The Spam Protection) ❄️
-    cooldown_dir = "/data/repair_logs"
-    os.makedirs(cooldown_dir, exist_ok=True)
-    timestamp_file = f"{cooldown_dir}/{video_id}.last_run"
-
-    if os.path.exists(timestamp_file):
-        with open(timestamp_file, 'r') as f:
-            last_run = float(f.read().strip())
-        
+    if last_run is not None:
         # 300 seconds = 5 Minutes
-        if (time.time() - last_run) < 300: 
-            remaining = int(300 - (time.time() - last_run))
+        if (time.time() - last_run) < REINDEX_COOLDOWN_SECONDS: 
+            remaining = int(REINDEX_COOLDOWN_SECONDS - (time.time() - last_run))
             return {"error": f"Cooldown active. Please wait {remaining} seconds."}
 
     # ✅ START
     print(f"🔧 Starting Public Re-index for {video_id}")
     
-    with open(timestamp_file, 'w') as f:
-        f.write(str(time.time()))
-    
-    db.update_processing_status.remote(video_id, "processing")
-    
-    VideoIndexer().process_video.spawn(
-        f"/data/videos/{video_id}.mp4", 
-        video_id, 
-        meta['title'], 
-        meta['tags']
+    _, _, coalesced = await asyncio.gather(
+        asyncio.to_thread(_write_last_run, timestamp_file, time.time()),
+        db.update_processing_status.remote.aio(video_id, "processing"),
+        _enqueue_ingest("reindex", video_id, video_path, meta['title'], meta['tags']),
     )
 
-    return {"status": "reindexing_started"}
+    return {"status": "reindexing_started", "coalesced": coalesced}
+
+@router.get("/queue")
+async def ingest_queue():
+    # 📬 Depth per kind, oldest wait, recent wait + per-stage timings (see jobs.stats)
+    return await asyncio.to_thread(jobs.stats, state)
+
+def _metrics_text():
+    metrics.REGISTRY.flush(state) # this container's own upload counters
+    queue = jobs.stats(state)
+    gauges = {
+        "chrono_ingest_queue_depth": ("Ingest jobs waiting", queue["depth"]),
+        "chrono_ingest_jobs_running": ("Ingest jobs claimed by a scheduler", queue["running"]),
+        "chrono_ingest_oldest_wait_seconds": ("Age of the oldest waiting ingest job", queue["oldest_wait_seconds"]),
+    }
+    return metrics.render(metrics.snapshot(state), gauges)
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    # 📈 Prometheus scrape target: per-stage ingest/search histograms + counters of every container
+    return Response(await asyncio.to_thread(_metrics_text), media_type="text/plain; version=0.0.4")
+
+def _token_user(request):
+    # user_id from "Authorization: Bearer <jwt>" (None = missing / invalid / expired)
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return decode_access_token(token) if scheme.lower() == "bearer" and token else None
+
+@router.post("/manage_video")
+async def manage_video(update: VideoUpdate, request: Request):
+    from fastapi.responses import JSONResponse
+
+    # 🔐 Owner = the signed token, never the body (user ids are public: feed rows, video_id prefixes)
+    owner = _token_user(request)
+    if owner is None:
+        return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    if update.user_id and update.user_id != owner:
+        return JSONResponse({"error": "Not your video"}, status_code=403)
+    update.user_id = owner
+    db = Database()
+    if update.action == "delete":
+        if not await db.delete_video.remote.aio(update.video_id, update.user_id):
+            return {"error": "Video not found"}
+        # Vectors + file go through the indexer's single-writer path (also invalidates search caches)
+        stat_cache.pop(f"{VIDEO_DIR}/{update.video_id}.mp4")
+        stat_cache.pop(f"{thumbs.THUMBS_DIR}/{update.video_id}/poster.jpg")
+        await asyncio.gather(VideoIndexer().remove_video.spawn.aio(update.video_id), _invalidate_feed())
+        return {"status": "deleted"}
+    if update.action == "visibility" and update.new_visibility in ("public", "private"):
+        if not await db.update_visibility.remote.aio(update.video_id, update.user_id, update.new_visibility):
+            return {"error": "Video not found"}
+        await _invalidate_feed()
+        return {"status": "updated"}
+    return {"error": "Unknown action"}
 
 @router.get("/debug_files")
-def list_files():
-    import os
+async def list_files():
     try:
-        files = os.listdir("/data/videos")
+        files = await asyncio.to_thread(os.listdir, VIDEO_DIR)
         return {"count": len(files), "files": files}
     except Exception as e:
         return {"error": str(e)}
\ No newline at end of file
@@ -0,0 +1,1686 @@
+####################....... bench.py
+# Local benchmarks (no Modal needed):
+#   python -m backend.bench residency --encoder stub
+#   python -m backend.bench residency --encoder siglip   (real numbers, needs weights)
+#   python -m backend.bench extractors -p seconds=1800 -p width=3840 -p height=2160
+#   python -m backend.bench pipeline --out runs/new.json --baseline runs/old.json
+#   python -m backend.bench compare runs/old.json runs/new.json
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _encoder_factory(kind):
+    from .encoder import SiglipEncoder, StubEncoder
+    return StubEncoder if kind == "stub" else SiglipEncoder
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50_ms": round(pick(0.50) * 1000, 2), "p99_ms": round(pick(0.99) * 1000, 2)}
+
+
+_PEAK_SEEN = [0.0] # highest peak before VmHWM was last reset (see _reset_peak_rss)
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process (VmHWM; ru_maxrss where there is no /proc)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _rss_mb():
+    """Current resident memory (VmRSS), e.g. right after a model load."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _reset_peak_rss():
+    """Linux only: restarts VmHWM so the next stage reports its own peak, not the run's."""
+    _PEAK_SEEN[0] = max(_PEAK_SEEN[0], _peak_rss_mb())
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+class _Stages:
+    """Seconds + peak RSS per named stage: `with stages("extract"): ...`, then stages.report."""
+
+    def __init__(self):
+        self.report = {}
+
+    @contextmanager
+    def __call__(self, name):
+        _reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield self.report.setdefault(name, {})
+        finally:
+            self.report[name].update(seconds=round(time.perf_counter() - start, 3), peak_rss_mb=_peak_rss_mb())
+
+
+def _build_frame_table(db_path, table_name, encoder, n_videos=5, frames_per_video=200):
+    import lancedb
+    import numpy as np
+
+    rng = np.random.default_rng(42)
+    rows = []
+    for v in range(n_videos):
+        images = rng.integers(0, 255, size=(frames_per_video, 36, 64, 3), dtype=np.uint8)
+        vectors = encoder.encode_images(images)
+        for i, vector in enumerate(vectors):
+            rows.append({
+                "vector": vector.tolist(),
+                "video_id": f"bench_{v}",
+                "timestamp": i * 0.5,
+                "metadata": f"Frame at {i * 0.5}s",
+            })
+    db = lancedb.connect(db_path)
+    return db.create_table(table_name, data=rows, mode="overwrite")
+
+
+def bench_residency(encoder_kind="stub", requests=20):
+    """
+    Per-request /api/search latency:
+    - before: model loaded inside every call (old search.py behaviour)
+    - after:  model resident for the whole container
+    """
+    from . import search
+
+    factory = _encoder_factory(encoder_kind)
+    db_path = tempfile.mkdtemp(prefix="chrono_bench_")
+    table_name = "bench_frames"
+    try:
+        _build_frame_table(db_path, table_name, factory())
+        queries = ["dog", "car", "explosion", "white sneakers", "coffee cup"]
+
+        before = []
+        for i in range(requests):
+            start = time.perf_counter()
+            search.search_index(queries[i % len(queries)], db_path, table_name, encoder=factory())
+            before.append(time.perf_counter() - start)
+
+        resident = factory().load()
+        after = []
+        for i in range(requests):
+            start = time.perf_counter()
+            search.search_index(queries[i % len(queries)], db_path, table_name, encoder=resident)
+            after.append(time.perf_counter() - start)
+
+        return {"encoder": encoder_kind, "requests": requests,
+                "reload_per_request": _percentiles(before), "resident": _percentiles(after)}
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+
+def bench_embedding(encoder_kind="stub", frames=256, batch_sizes=(1, 8, 32, 64), precisions=("fp32", "fp16")):
+    """
+    Frame embedding throughput + drift vs the old batch-1 fp32 loop.
+    Drift is reported as max |a-b| per component and min cosine per frame.
+    """
+    import numpy as np
+    from .index import embed_batches
+
+    encoder = _encoder_factory(encoder_kind)().load()
+    rng = np.random.default_rng(7)
+    images = list(rng.integers(0, 255, size=(frames, 360, 640, 3), dtype=np.uint8))
+    load = lambda image: image
+
+    baseline = np.concatenate([v for _, v in embed_batches(encoder, images, load, 1, "fp32")])
+    report = []
+    for precision in precisions:
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            vectors = np.concatenate([v for _, v in embed_batches(encoder, images, load, batch_size, precision)])
+            elapsed = time.perf_counter() - start
+            report.append({
+                "precision": precision,
+                "batch_size": batch_size,
+                "frames_per_sec": round(frames / elapsed, 1),
+                "max_abs_diff": float(np.abs(vectors - baseline).max()),
+                "min_cosine": float((vectors * baseline).sum(axis=1).min()),
+            })
+    return {"encoder": encoder_kind, "frames": frames, "runs": report}
+
+
+def _random_rows(video_ids, frames_per_video, seed=0):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    rows = []
+    for video_id in video_ids:
+        vectors = rng.standard_normal((frames_per_video, 1152)).astype("float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for i, vector in enumerate(vectors):
+            rows.append({"vector": vector.tolist(), "video_id": video_id, "timestamp": i * 0.5,
+                         "metadata": f"Frame at {i * 0.5}s", "span_end": i * 0.5 + 0.5})
+    return rows
+
+
+def bench_ingest(library_sizes=(10, 100, 1000, 10000), frames_per_video=20):
+    """
+    Cost of writing ONE video as the library grows:
+    - copytree: old VideoIndexer path (copy store out, write, copy store back)
+    - incremental: index.write_video straight into the store
+    """
+    import lancedb
+    from .index import open_tables, write_video
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    stable = os.path.join(workdir, "stable")
+    workpad = os.path.join(workdir, "workpad")
+    table_name = "bench_frames"
+    try:
+        db = lancedb.connect(stable)
+        tbl_frames, _ = open_tables(db, table_name)
+        report, videos = [], 0
+        for size in library_sizes:
+            for chunk in range(videos, size, 500):
+                ids = [f"lib_{v}" for v in range(chunk, min(chunk + 500, size))]
+                tbl_frames.add(_random_rows(ids, frames_per_video, seed=chunk))
+            videos = size
+
+            new_rows = _random_rows(["new_video"], frames_per_video, seed=size)
+            meta_row = dict(new_rows[0], title="new", tags="")
+            meta_row = {k: meta_row[k] for k in ("vector", "video_id", "title", "tags")}
+
+            start = time.perf_counter()
+            shutil.rmtree(workpad, ignore_errors=True)
+            shutil.copytree(stable, workpad)
+            write_video(workpad, "new_video", table_name, new_rows, meta_row)
+            shutil.copytree(workpad, stable, dirs_exist_ok=True)
+            copytree_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            write_video(stable, "new_video", table_name, new_rows, meta_row)
+            incremental_s = time.perf_counter() - start
+
+            report.append({"videos": size, "frames": size * frames_per_video,
+                           "copytree_ms": round(copytree_s * 1000, 1), "incremental_ms": round(incremental_s * 1000, 1)})
+        return {"frames_per_video": frames_per_video, "runs": report}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _clustered_vectors(n, clusters=256, noise=0.35, seed=0):
+    """Unit vectors around random centers (real frame vectors cluster by scene/video)."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, 1152)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + noise * rng.standard_normal((n, 1152)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_ann(rows=200_000, queries=100, k=10, nprobes=(1, 5, 10, 20, 50), refine_factors=(None, 10)):
+    """Recall@k and latency of IVF-PQ (ann.IndexManager) vs exact cosine top-k."""
+    import lancedb
+    import numpy as np
+    import pyarrow as pa
+    from .ann import IndexManager
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    table_name = "bench_frames"
+    try:
+        vectors = _clustered_vectors(rows)
+        data = pa.table({
+            "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1)), 1152),
+            "video_id": pa.array([f"vid_{i // 500}" for i in range(rows)]),
+            "timestamp": pa.array(np.arange(rows, dtype="float64") % 500 * 0.5),
+        })
+        tbl = lancedb.connect(workdir).create_table(table_name, data=data)
+        query_vectors = _clustered_vectors(queries, seed=1)
+
+        exact, exact_times = [], []
+        for q in query_vectors:
+            start = time.perf_counter()
+            exact.append(set(np.argpartition(-(vectors @ q), k)[:k].tolist()))
+            exact_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        IndexManager(workdir, thresholds={table_name: 0}).build(table_name)
+        build_s = time.perf_counter() - start
+
+        runs = []
+        for probes in nprobes:
+            for refine in refine_factors:
+                hits, times = 0, []
+                for q, truth in zip(query_vectors, exact):
+                    job = tbl.search(q).metric("cosine").nprobes(probes)
+                    if refine:
+                        job = job.refine_factor(refine)
+                    start = time.perf_counter()
+                    found = job.limit(k).to_pandas()
+                    times.append(time.perf_counter() - start)
+                    keys = set(zip(found["video_id"], found["timestamp"]))
+                    hits += sum((data["video_id"][i].as_py(), data["timestamp"][i].as_py()) in keys for i in truth)
+                runs.append(dict({"nprobes": probes, "refine_factor": refine,
+                                  "recall_at_k": round(hits / (queries * k), 3)}, **_percentiles(times)))
+        return {"rows": rows, "k": k, "build_seconds": round(build_s, 1),
+                "exact_numpy": _percentiles(exact_times), "runs": runs}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _query_log(n, vocabulary=500, seed=0):
+    """Zipf-distributed query replay (a few queries dominate, long tail of one-offs)."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.3, n), vocabulary)
+    spacing = ["{}", " {}", "{} ", "{}".upper()]
+    return [spacing[i % len(spacing)].format(f"query {r}") for i, r in enumerate(ranks)]
+
+
+def bench_query_cache(encoder_kind="stub", requests=5000, cache_mb=1.0):
+    """Hit rate + per-query encode latency with the shared QueryCache on a replayed log."""
+    from .cache import QueryCache
+
+    encoder = _encoder_factory(encoder_kind)().load()
+    encoder.query_cache = QueryCache(int(cache_mb * 1024 * 1024))
+    times = []
+    for query in _query_log(requests):
+        start = time.perf_counter()
+        encoder.encode_query(query)
+        times.append(time.perf_counter() - start)
+    return dict({"encoder": encoder_kind, "requests": requests, "cache": encoder.query_cache.stats()},
+                **_percentiles(times))
+
+
+def bench_result_cache(encoder_kind="stub", requests=2000, ingest_every=500):
+    """
+    Replayed /api/search_global log through ResultCache, with an ingest
+    (generation bump) every `ingest_every` requests. Reports hit rate + latency.
+    """
+    from . import search_global
+    from .cache import ResultCache
+    from .store import LocalState, bump_generation, current_generation
+
+    encoder = _encoder_factory(encoder_kind)().load()
+    db_path = tempfile.mkdtemp(prefix="chrono_bench_")
+    table_name = "bench_frames"
+    try:
+        _build_frame_table(db_path, table_name, encoder)
+        state, cache = LocalState(), ResultCache()
+        times = []
+        for i, query in enumerate(_query_log(requests)):
+            if i and i % ingest_every == 0:
+                bump_generation(state)
+            start = time.perf_counter()
+            cache.get_or_search("global", query, current_generation(state),
+                                lambda: search_global.search_global_unified(query, db_path, table_name, encoder=encoder))
+            times.append(time.perf_counter() - start)
+        return dict({"requests": requests, "ingest_every": ingest_every, "cache": cache.stats()}, **_percentiles(times))
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+
+def bench_microbatch(encoder_kind="stub", clients=(1, 8, 32, 128), queries_per_client=20, window_ms=5.0):
+    """
+    Throughput + p50/p99 of encode_query with N concurrent clients:
+    one forward pass per query vs encoder.BatchingEncoder. Query cache is
+    disabled (size 0) so every query really hits the model.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from .cache import QueryCache
+    from .encoder import BatchingEncoder
+
+    encoder = _encoder_factory(encoder_kind)().load()
+    encoder.query_cache = QueryCache(max_bytes=0)
+    encoder.encode_query("warm up")
+    lock = threading.Lock()
+
+    def serial_encode(query):
+        with lock: # one model, one forward pass at a time (like today)
+            return encoder.encode_query(query)
+
+    runs = []
+    for n in clients:
+        for mode, encode in (("single", serial_encode),
+                             ("batched", BatchingEncoder(encoder, window_ms=window_ms).encode_query)):
+            times = []
+
+            def client(c):
+                for i in range(queries_per_client):
+                    start = time.perf_counter()
+                    encode(f"client {c} query {i}")
+                    times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=n) as pool:
+                list(pool.map(client, range(n)))
+            elapsed = time.perf_counter() - start
+            runs.append(dict({"clients": n, "mode": mode,
+                              "queries_per_sec": round(n * queries_per_client / elapsed, 1)}, **_percentiles(times)))
+    return {"encoder": encoder_kind, "window_ms": window_ms, "runs": runs}
+
+
+def _search_queries(n, seed=0):
+    """Short natural-language queries like the ones users type into /api/search."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    subjects = ["a dog", "a red car", "two people", "a child", "white sneakers", "a coffee cup", "a laptop",
+                "a cat", "a soccer ball", "fireworks", "a bicycle", "a man in a suit", "a whiteboard"]
+    scenes = ["on a beach", "at night", "in the rain", "in a kitchen", "on stage", "in a crowded street",
+              "next to a window", "in slow motion", "from above", "", "", ""]
+    return [" ".join(filter(None, [subjects[rng.integers(len(subjects))], scenes[rng.integers(len(scenes))]]))
+            for _ in range(n)]
+
+
+def _query_encoder_run(kind, texts, onnx_dir, latency_queries):
+    """One query encoder in a fresh process (its own load time + memory). kind = "siglip" or a text backend."""
+    import numpy as np
+    from .encoder import SiglipEncoder, SiglipTextEncoder
+
+    start = time.perf_counter()
+    encoder = SiglipEncoder() if kind == "siglip" else SiglipTextEncoder(backend=kind, onnx_dir=onnx_dir)
+    encoder.load()
+    report = {"device": encoder.device, "load_seconds": round(time.perf_counter() - start, 2), "rss_mb": _rss_mb()}
+    encoder.encode_text(texts[:1]) # warm-up (lazy init, first-call allocations)
+
+    start = time.perf_counter()
+    vectors = np.concatenate([encoder.encode_text(texts[i:i + 32]) for i in range(0, len(texts), 32)])
+    report["batch32_queries_per_sec"] = round(len(texts) / (time.perf_counter() - start), 1)
+    single = []
+    for text in texts[:latency_queries]:
+        start = time.perf_counter()
+        encoder.encode_text([text])
+        single.append(time.perf_counter() - start)
+    report["single_query"] = _percentiles(single)
+    report["peak_rss_mb"] = _peak_rss_mb()
+    return report, vectors
+
+
+def bench_query_encoder(backends=("fp32", "int8", "onnx", "onnx-int8"), queries=256, latency_queries=50,
+                        min_cosine=None):
+    """
+    CPU query encoders (encoder.SiglipTextEncoder) vs the current path (full
+    SigLIP, get_text_features, on the GPU if there is one): cosine agreement
+    per query against min_cosine (default encoder.TEXT_MIN_COSINE), single-query
+    p50/p99, batch throughput, load time and memory. Each encoder runs in its
+    own process; ONNX graphs are exported first (timed separately).
+    Needs torch + transformers (+ onnxruntime for onnx*) and the weights.
+    """
+    import multiprocessing
+    import numpy as np
+    from .encoder import TEXT_MIN_COSINE, SiglipTextEncoder, export_text_onnx
+
+    min_cosine = TEXT_MIN_COSINE if min_cosine is None else min_cosine
+    texts = _search_queries(queries)
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    context = multiprocessing.get_context("spawn")
+    try:
+        def run(target, *args):
+            with context.Pool(1) as pool:
+                return pool.apply(target, args)
+
+        current, reference = run(_query_encoder_run, "siglip", texts, workdir, latency_queries)
+        report = {"queries": queries, "cpus": os.cpu_count(), "min_cosine": min_cosine,
+                  "current": dict(current, encoder="siglip"), "runs": []}
+        for backend in backends:
+            run_report = {"backend": backend}
+            if backend.startswith("onnx"):
+                path = SiglipTextEncoder(backend=backend, onnx_dir=workdir).onnx_path()
+                start = time.perf_counter()
+                run(export_text_onnx, SiglipTextEncoder().model_id, path, backend == "onnx-int8")
+                run_report["export_seconds"] = round(time.perf_counter() - start, 1)
+                run_report["model_mb"] = round(sum(os.path.getsize(os.path.join(workdir, name))
+                                                   for name in os.listdir(workdir)
+                                                   if name.startswith(os.path.basename(path))) / 2 ** 20, 1)
+            stats, vectors = run(_query_encoder_run, backend, texts, workdir, latency_queries)
+            cosines = (vectors * reference).sum(axis=1)
+            run_report.update(stats, min_cosine=round(float(cosines.min()), 5), mean_cosine=round(float(cosines.mean()), 5),
+                              within_tolerance=bool(cosines.min() >= min_cosine),
+                              rss_saving_x=round(current["rss_mb"] / max(stats["rss_mb"], 1e-9), 1),
+                              p50_vs_current_x=round(stats["single_query"]["p50_ms"] /
+                                                     max(current["single_query"]["p50_ms"], 1e-9), 2))
+            report["runs"].append(run_report)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_deep_search(encoder_kind="stub", videos=200, frames_per_video=2000, queries=50, dtype="float32"):
+    """In-video Deep Search: LanceDB `where video_id = ...` vs the hot per-video matrix."""
+    import lancedb
+    from . import search
+    from .index import open_tables
+
+    encoder = _encoder_factory(encoder_kind)().load()
+    db_path = tempfile.mkdtemp(prefix="chrono_bench_")
+    table_name = "bench_frames"
+    try:
+        tbl_frames, _ = open_tables(lancedb.connect(db_path), table_name)
+        for chunk in range(0, videos, 20):
+            ids = [f"vid_{v}" for v in range(chunk, min(chunk + 20, videos))]
+            tbl_frames.add(_random_rows(ids, frames_per_video, seed=chunk))
+        target = f"vid_{videos // 2}"
+        texts = [f"query {i}" for i in range(queries)]
+
+        filtered = []
+        for text in texts:
+            start = time.perf_counter()
+            search.search_index(text, db_path, table_name, target, encoder=encoder)
+            filtered.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        matrix = search.load_video_matrix(db_path, table_name, target, dtype)
+        load_s = time.perf_counter() - start
+        hot = []
+        for text in texts:
+            start = time.perf_counter()
+            search.search_video_matrix(text, matrix, target, encoder=encoder)
+            hot.append(time.perf_counter() - start)
+
+        return {"videos": videos, "frames_per_video": frames_per_video, "dtype": dtype,
+                "matrix_mb": round(matrix.nbytes / 1e6, 2), "matrix_load_ms": round(load_s * 1000, 1),
+                "lancedb_filtered": _percentiles(filtered), "hot_matrix": _percentiles(hot)}
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+
+def _legacy_global(tbl_meta, tbl_frames, query_vector):
+    """The pre-fusion search_global_unified merge (sequential lookups, iterrows, fixed limit(50))."""
+    final_candidates = {}
+    for _, row in tbl_meta.search(query_vector).metric("cosine").limit(20).to_pandas().iterrows():
+        score = 1 - row['_distance']
+        if score < 0.10: continue
+        final_candidates[row['video_id']] = {"video_id": row['video_id'], "score": score * 1.2,
+                                             "match_type": "Title Match", "timestamp": None}
+    for _, row in tbl_frames.search(query_vector).metric("cosine").limit(50).to_pandas().iterrows():
+        vid_id, raw_score = row['video_id'], 1 - row['_distance']
+        if raw_score < 0.15: continue
+        if vid_id in final_candidates:
+            final_candidates[vid_id]['score'] += 0.05
+            final_candidates[vid_id]['match_type'] += " + Visuals"
+        else:
+            final_candidates[vid_id] = {"video_id": vid_id, "score": raw_score,
+                                        "match_type": "Visual Match", "timestamp": row['timestamp']}
+    return sorted(final_candidates.values(), key=lambda x: x['score'], reverse=True)
+
+
+def bench_global_search(encoder_kind="stub", frame_counts=(1_000, 100_000, 1_000_000), frames_per_video=500,
+                        queries=30, k=20):
+    """Global search latency (before: legacy merge, after: grouped fusion) + distinct videos returned."""
+    import lancedb
+    import numpy as np
+    from . import search_global
+    from .index import open_tables
+
+    encoder = _encoder_factory(encoder_kind)().load()
+    runs = []
+    for frames in frame_counts:
+        db_path = tempfile.mkdtemp(prefix="chrono_bench_")
+        table_name = "bench_frames"
+        try:
+            db = lancedb.connect(db_path)
+            tbl_frames, tbl_meta = open_tables(db, table_name)
+            videos = max(1, frames // frames_per_video)
+            for chunk in range(0, videos, 20):
+                ids = [f"vid_{v}" for v in range(chunk, min(chunk + 20, videos))]
+                tbl_frames.add(_random_rows(ids, min(frames, frames_per_video), seed=chunk))
+            meta_vectors = _clustered_vectors(videos, seed=5)
+            tbl_meta.add([{"vector": v.tolist(), "video_id": f"vid_{i}", "title": f"Video {i}", "tags": ""}
+                          for i, v in enumerate(meta_vectors)])
+
+            before, after, distinct_before, distinct_after = [], [], [], []
+            for q in range(queries):
+                text = f"query {q}"
+                query_vector = encoder.encode_query(text)
+                start = time.perf_counter()
+                legacy = _legacy_global(tbl_meta, tbl_frames, query_vector)
+                before.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                fused = search_global.search_global_unified(text, db_path, table_name, encoder=encoder, k=k)
+                after.append(time.perf_counter() - start)
+                distinct_before.append(len(legacy))
+                distinct_after.append(len(fused))
+            runs.append({"frames": frames, "videos": videos, "before": _percentiles(before),
+                         "after": _percentiles(after), "mean_videos_before": float(np.mean(distinct_before)),
+                         "mean_videos_after": float(np.mean(distinct_after))})
+        finally:
+            shutil.rmtree(db_path, ignore_errors=True)
+    return {"encoder": encoder_kind, "k": k, "runs": runs}
+
+
+def _scene_vectors(videos, frames_per_video, scene_frames=60, noise=0.5, seed=0):
+    """Video-like frames: each video is a run of scenes, frames = scene vector + per-frame noise."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    scenes = -(-frames_per_video // scene_frames)
+    centers = rng.standard_normal((videos, scenes, 1152)).astype("float32")
+    vectors = np.repeat(centers, scene_frames, axis=1)[:, :frames_per_video]
+    vectors = vectors + noise * rng.standard_normal(vectors.shape).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=2, keepdims=True)
+    return vectors # (videos, frames_per_video, 1152)
+
+
+def bench_segments(frames=1_000_000, frames_per_video=500, queries=50, k=20, chunk_videos=100,
+                   nprobes=(10, 20, 50)):
+    """
+    search_global_unified mode="frames" vs mode="segments" on a synthetic store:
+    recall of the top-k distinct videos (truth = exact per-video best frame) + latency.
+    """
+    import lancedb
+    import numpy as np
+    import pyarrow as pa
+    from . import search_global
+    from .ann import IndexManager
+    from .index import SEGMENT_SECONDS, open_segment_table, open_tables, segment_table_name
+
+    class FixedQueries:
+        # search_global_unified only needs encode_query(); queries are vectors here
+        def __init__(self, vectors): self.vectors = vectors
+        def encode_query(self, text): return self.vectors[int(text)]
+
+    videos = max(1, frames // frames_per_video)
+    per_segment = int(SEGMENT_SECONDS / 0.5) # same windows as index.segment_rows() at 2 fps
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    table_name = "bench_frames"
+    try:
+        db = lancedb.connect(workdir)
+        tbl_frames, _ = open_tables(db, table_name)
+        tbl_segments = open_segment_table(db, table_name)
+
+        # Queries = noisy copies of random frames (known to exist somewhere in the store)
+        rng = np.random.default_rng(99)
+        picks = rng.integers(0, videos, queries)
+        query_vectors = np.empty((queries, 1152), dtype="float32")
+
+        # --- 1. BUILD (chunked, so 1M x 1152 floats never sit in RAM at once) ---
+        timestamps = np.arange(frames_per_video, dtype="float64") * 0.5
+        for chunk in range(0, videos, chunk_videos):
+            ids = range(chunk, min(chunk + chunk_videos, videos))
+            vectors = _scene_vectors(len(ids), frames_per_video, seed=chunk)
+            for q in np.nonzero((picks >= chunk) & (picks < chunk + len(ids)))[0]:
+                frame = vectors[picks[q] - chunk, rng.integers(0, frames_per_video)]
+                noisy = frame + 0.03 * rng.standard_normal(1152).astype("float32")
+                query_vectors[q] = noisy / np.linalg.norm(noisy)
+            flat = vectors.reshape(-1, 1152)
+            tbl_frames.add(pa.table({
+                "vector": pa.FixedSizeListArray.from_arrays(pa.array(flat.reshape(-1)), 1152),
+                "video_id": pa.array([f"vid_{v}" for v in ids for _ in range(frames_per_video)]),
+                "timestamp": pa.array(np.tile(timestamps, len(ids))),
+                "metadata": pa.array([""] * len(flat)),
+                "span_end": pa.array(np.tile(timestamps + 0.5, len(ids))),
+            }))
+
+            pad = -frames_per_video % per_segment
+            windows = np.pad(vectors, ((0, 0), (0, pad), (0, 0))).reshape(len(ids), -1, per_segment, 1152)
+            counts = np.minimum(per_segment, frames_per_video - np.arange(windows.shape[1]) * per_segment)
+            means = windows.sum(axis=2) / counts[None, :, None]
+            means /= np.linalg.norm(means, axis=2, keepdims=True)
+            starts = np.arange(windows.shape[1]) * per_segment * 0.5
+            ends = np.minimum(starts + (per_segment - 1) * 0.5, timestamps[-1]) + 0.5
+            tbl_segments.add(pa.table({
+                "vector": pa.FixedSizeListArray.from_arrays(pa.array(means.reshape(-1)), 1152),
+                "video_id": pa.array([f"vid_{v}" for v in ids for _ in range(windows.shape[1])]),
+                "start": pa.array(np.tile(starts, len(ids))),
+                "end": pa.array(np.tile(ends, len(ids))),
+                "frames": pa.array(np.tile(counts, len(ids)).astype("int32")),
+            }))
+        del vectors, flat, windows
+
+        manager = IndexManager(workdir, thresholds={table_name: 0, segment_table_name(table_name): 0})
+        build = {name: manager.build(name)["build_seconds"] for name in (table_name, segment_table_name(table_name))}
+
+        # Exact truth: per-video best frame score (chunks regenerated from their seeds)
+        best = np.empty((queries, videos), dtype="float32")
+        for chunk in range(0, videos, chunk_videos):
+            n = min(chunk_videos, videos - chunk)
+            vectors = _scene_vectors(n, frames_per_video, seed=chunk)
+            best[:, chunk:chunk + n] = np.max(vectors @ query_vectors.T[None], axis=1).T
+        truth = [set(np.argsort(-row)[:k].tolist()) for row in best]
+
+        # --- 2. SEARCH both modes ---
+        encoder = FixedQueries(query_vectors)
+        runs = []
+        for mode in ("frames", "segments"):
+            for probes in nprobes:
+                times, hits = [], 0
+                for q in range(queries):
+                    start = time.perf_counter()
+                    found = search_global.search_global_unified(str(q), workdir, table_name, encoder=encoder,
+                                                                nprobes=probes, k=k, mode=mode)
+                    times.append(time.perf_counter() - start)
+                    hits += len({int(r["video_id"][4:]) for r in found} & truth[q])
+                runs.append(dict({"mode": mode, "nprobes": probes, "recall_videos_at_k": round(hits / (queries * k), 3)},
+                                 **_percentiles(times)))
+        frames_p50 = {r["nprobes"]: r["p50_ms"] for r in runs if r["mode"] == "frames"}
+        for r in runs:
+            if r["mode"] == "segments":
+                r["speedup_p50"] = round(frames_p50[r["nprobes"]] / max(r["p50_ms"], 1e-9), 2)
+        return {"frames": videos * frames_per_video, "segments": tbl_segments.count_rows(), "videos": videos,
+                "k": k, "build_seconds": build, "runs": runs}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_storage(rows=200_000, frames_per_video=500, queries=50, k=10, refine_factor=4):
+    """
+    Compact frame storage (compact.py) vs the float32 table:
+    on-disk size, scan latency and top-k agreement with the exact float32 top-k.
+    """
+    import lancedb
+    import numpy as np
+    import pyarrow as pa
+    from . import compact
+    from .index import open_tables
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    table_name = "bench_frames"
+    try:
+        # --- 1. FLOAT32 SOURCE TABLE (video-like vectors) ---
+        source = os.path.join(workdir, "float32")
+        tbl, _ = open_tables(lancedb.connect(source), table_name, storage="float32")
+        videos = max(1, rows // frames_per_video)
+        timestamps = np.arange(frames_per_video, dtype="float64") * 0.5
+        for chunk in range(0, videos, 100):
+            ids = range(chunk, min(chunk + 100, videos))
+            flat = _scene_vectors(len(ids), frames_per_video, seed=chunk).reshape(-1, 1152)
+            tbl.add(pa.table(dict(compact.encode(flat, "float32"), **{
+                "video_id": pa.array([f"vid_{v}" for v in ids for _ in range(frames_per_video)]),
+                "timestamp": pa.array(np.tile(timestamps, len(ids))),
+                "metadata": pa.array([""] * len(flat)),
+                "span_end": pa.array(np.tile(timestamps + 0.5, len(ids))),
+            })))
+
+        rng = np.random.default_rng(3)
+        # Queries = noisy copies of random stored frames
+        sample = tbl.to_lance().take(rng.integers(0, tbl.count_rows(), queries).tolist(), columns=["vector"])
+        query_vectors = compact.decode(sample, "float32") + 0.03 * rng.standard_normal((queries, 1152))
+        query_vectors = (query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)).astype("float32")
+
+        key = lambda hits: set(zip(hits["video_id"], hits["timestamp"]))
+        truth = [key(compact.scan_topk(tbl.to_lance(), q, k)) for q in query_vectors]
+
+        # --- 2. VARIANTS (copied, then migrated in place) ---
+        variants = [("float32", False, None), ("float16", False, None), ("int8", False, None),
+                    ("float16", True, refine_factor), ("int8", True, refine_factor)]
+        report = []
+        for fmt, keep_full, refine in variants:
+            path = os.path.join(workdir, f"{fmt}_{keep_full}")
+            shutil.copytree(source, path)
+            if fmt != "float32":
+                compact.migrate_table(path, table_name, fmt, keep_full, force=True) # scan timings wanted
+            dataset = lancedb.connect(path).open_table(table_name).to_lance()
+
+            times, agree = [], 0
+            for q, expected in zip(query_vectors, truth):
+                start = time.perf_counter()
+                hits = compact.scan_topk(dataset, q, k, refine_factor=refine)
+                times.append(time.perf_counter() - start)
+                agree += len(key(hits) & expected)
+            report.append(dict({"format": fmt, "keep_float32": keep_full, "refine_factor": refine,
+                                "mb": round(compact.directory_bytes(dataset.uri) / 1e6, 1),
+                                "top_k_agreement": round(agree / (queries * k), 3)}, **_percentiles(times)))
+        return {"rows": videos * frames_per_video, "k": k, "runs": report}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _fill_videos(conn, rows, users, seed=0, chunk=50_000):
+    """Synthetic `videos` rows: random owners, ~10% private, created_at spread over a year."""
+    import random
+    rng = random.Random(seed)
+    base = time.mktime((2025, 1, 1, 0, 0, 0, 0, 0, -1))
+    for start in range(0, rows, chunk):
+        batch = []
+        for i in range(start, min(start + chunk, rows)):
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(base + rng.random() * 365 * 86400))
+            batch.append((f"vid_{i}", f"user_{rng.randrange(users)}", f"clip_{i}.mp4", f"Video {i}", "",
+                          "private" if rng.random() < 0.1 else "public", created, "completed"))
+        with conn:
+            conn.executemany("INSERT INTO videos (video_id, user_id, filename, title, tags, visibility, created_at, status)"
+                             " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+
+_LEGACY_FEED_SQL = "SELECT * FROM videos WHERE visibility = 'public' ORDER BY created_at DESC LIMIT 50"
+_LEGACY_USER_VIDEOS_SQL = "SELECT * FROM videos WHERE user_id = ? ORDER BY created_at DESC"
+
+
+def bench_db(rows=1_000_000, users=10_000, queries=200):
+    """
+    Feed + profile queries at `rows` videos:
+    - before: connect per call, init_db DDL per call, no indexes (schema v1), SELECT *
+    - after:  one WAL connection, latest migration, keyset pages (database.feed_page / user_videos_page)
+    """
+    import random
+    import sqlite3
+    from . import database
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    try:
+        paths = {"before": os.path.join(workdir, "before.db"), "after": os.path.join(workdir, "after.db")}
+        setup = database.connect(paths["before"], journal_mode="delete")
+        database.migrate(setup, target=1)
+        _fill_videos(setup, rows, users)
+        setup.close()
+        shutil.copyfile(paths["before"], paths["after"])
+
+        start = time.perf_counter()
+        after_conn = database.connect(paths["after"])
+        database.migrate(after_conn)
+        migrate_s = time.perf_counter() - start
+
+        rng = random.Random(1)
+        user_ids = [f"user_{rng.randrange(users)}" for _ in range(queries)]
+
+        def legacy(sql, params=()):
+            with sqlite3.connect(paths["before"]) as conn:
+                for step in database.MIGRATIONS[0]:
+                    if not callable(step):
+                        conn.execute(step)
+                conn.row_factory = sqlite3.Row
+                return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+        runs = {
+            "before": (lambda: legacy(_LEGACY_FEED_SQL),
+                       lambda user_id: legacy(_LEGACY_USER_VIDEOS_SQL, (user_id,))),
+            "after": (lambda: database.feed_page(after_conn),
+                      lambda user_id: database.user_videos_page(after_conn, user_id)),
+        }
+        report = {}
+        for label, (feed_query, user_query) in runs.items():
+            feed, profile = [], []
+            for user_id in user_ids:
+                t = time.perf_counter()
+                feed_query()
+                feed.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                user_query(user_id)
+                profile.append(time.perf_counter() - t)
+            report[label] = {"feed": _percentiles(feed), "user_videos": _percentiles(profile)}
+        after_conn.close()
+        return {"rows": rows, "users": users, "migrate_seconds": round(migrate_s, 1), **report}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class _StubCall:
+    """A Modal call that takes `latency` seconds: blocking as f(...), non-blocking as f.aio(...)."""
+
+    def __init__(self, latency, result=None):
+        self.latency = latency
+        self.result = result
+
+    def __call__(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return self.result(*args, **kwargs) if callable(self.result) else self.result
+
+    async def aio(self, *args, **kwargs):
+        import asyncio
+        await asyncio.sleep(self.latency)
+        return self.result(*args, **kwargs) if callable(self.result) else self.result
+
+
+class _StubService:
+    """Stands in for Database() / VideoIndexer() / VideoSearcher(): every method has .remote + .spawn."""
+
+    def __init__(self, latency, results=None):
+        self.latency = latency
+        self.results = results or {}
+
+    def __call__(self):
+        return self
+
+    def __getattr__(self, name):
+        call = _StubCall(self.latency, self.results.get(name))
+        return type("StubMethod", (), {"remote": call, "spawn": call})()
+
+
+def _stub_dict(latency, backing=None):
+    """A modal.Dict stand-in over store.LocalState: get/put/pop take `latency` (blocking or .aio)."""
+    from .store import LocalState
+
+    backing = LocalState() if backing is None else backing
+    return type("StubDict", (), {name: _StubCall(latency, getattr(backing, name)) for name in ("get", "put", "pop")})()
+
+
+def bench_api(latency_ms=50.0, clients=(1, 16, 64), requests_per_client=10):
+    """
+    Requests/sec through the FastAPI router with every Modal call stubbed at a
+    fixed latency. before = the old handlers (blocking .remote() inside async def),
+    after = backend/api.py as it is now.
+    """
+    import asyncio
+    import httpx
+    from fastapi import APIRouter, FastAPI
+    from . import api
+
+    latency = latency_ms / 1000
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    meta = lambda video_id: {"video_id": video_id, "title": "t", "tags": "", "status": "completed"}
+    patched = {
+        "Database": _StubService(latency, {"get_public_feed": {"videos": [], "next_cursor": None},
+                                           "get_video_metadata": meta}),
+        "VideoIndexer": _StubService(latency),
+        "VideoSearcher": _StubService(latency, {"search": []}),
+        "vol": type("StubVolume", (), {"reload": _StubCall(latency), "commit": _StubCall(latency)})(),
+        "state": _stub_dict(latency / 10), # feed version + ingest queue (a Dict hop is cheaper than a call)
+        "VIDEO_DIR": os.path.join(workdir, "videos"),
+        "REPAIR_LOG_DIR": os.path.join(workdir, "repair_logs"),
+    }
+    original = {name: getattr(api, name) for name in patched}
+
+    # The pre-async handlers, verbatim apart from the paths
+    legacy = APIRouter()
+
+    @legacy.get("/feed")
+    async def legacy_feed():
+        return api.Database().get_public_feed.remote()
+
+    @legacy.post("/reindex")
+    async def legacy_reindex(video_id: str):
+        db = api.Database()
+        meta = db.get_video_metadata.remote(video_id)
+        if not meta or meta.get("status") == "processing":
+            return {"error": "skip"}
+        api.vol.reload()
+        if not os.path.exists(f"{api.VIDEO_DIR}/{video_id}.mp4"):
+            return {"error": "missing"}
+        os.makedirs(api.REPAIR_LOG_DIR, exist_ok=True)
+        with open(f"{api.REPAIR_LOG_DIR}/{video_id}.last_run", "w") as f:
+            f.write(str(time.time()))
+        db.update_processing_status.remote(video_id, "processing")
+        api.VideoIndexer().process_video.spawn(f"{api.VIDEO_DIR}/{video_id}.mp4", video_id, meta["title"], meta["tags"])
+        return {"status": "reindexing_started"}
+
+    apps = {"before": FastAPI(), "after": FastAPI()}
+    apps["before"].include_router(legacy, prefix="/api")
+    apps["after"].include_router(api.router, prefix="/api")
+
+    async def run(app, method, path_for, n_clients):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def one_client(c):
+                for r in range(requests_per_client):
+                    response = await client.request(method, path_for(c * requests_per_client + r))
+                    response.raise_for_status()
+            start = time.perf_counter()
+            await asyncio.gather(*(one_client(c) for c in range(n_clients)))
+            return n_clients * requests_per_client / (time.perf_counter() - start)
+
+    try:
+        for name, value in patched.items():
+            setattr(api, name, value)
+        os.makedirs(api.VIDEO_DIR)
+        for i in range(sum(clients) * requests_per_client * 2):
+            open(os.path.join(api.VIDEO_DIR, f"vid_{i}.mp4"), "wb").close()
+
+        endpoints = {
+            "feed": ("GET", lambda i: "/api/feed"),
+            "reindex": ("POST", None),
+        }
+        report, offset = [], 0
+        for endpoint, (method, path_for) in endpoints.items():
+            for n_clients in clients:
+                row = {"endpoint": endpoint, "clients": n_clients}
+                for label, app in apps.items():
+                    if path_for is None: # fresh video ids so the cooldown never kicks in
+                        path_for_run = lambda i, base=offset: f"/api/reindex?video_id=vid_{base + i}"
+                        offset += n_clients * requests_per_client
+                    else:
+                        path_for_run = path_for
+                    row[f"{label}_rps"] = round(asyncio.run(run(app, method, path_for_run, n_clients)), 1)
+                report.append(row)
+        return {"latency_ms": latency_ms, "requests_per_client": requests_per_client, "runs": report}
+    finally:
+        for name, value in original.items():
+            setattr(api, name, value)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_listing(rows=1_000_000, users=10_000, requests=300, latency_ms=20.0, deep_pages=20):
+    """
+    p50/p99 of /api/feed and /api/my_videos through the router, at `rows` videos.
+    Database is a real SQLite file behind a stub that adds `latency_ms` per call
+    (the hop to the Database container); the feed version lives in a stub Dict.
+    - feed_first: cached first page      - feed_deep: a page `deep_pages` pages in
+    - my_videos: first profile page      - legacy_*: the old SELECT * handlers
+    """
+    import asyncio
+    import random
+    import httpx
+    from fastapi import APIRouter, FastAPI
+    from . import api, database
+
+    latency = latency_ms / 1000
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    try:
+        conn = database.connect(os.path.join(workdir, "metadata.db"))
+        database.migrate(conn)
+        _fill_videos(conn, rows, users)
+        lock = threading.Lock()
+
+        def locked(query):
+            def run(*args):
+                with lock:
+                    return query(conn, *args)
+            return run
+
+        legacy_query = lambda sql: locked(lambda c, *args: [dict(r) for r in c.execute(sql, args).fetchall()])
+        shared = {}
+        patched = {
+            "Database": _StubService(latency, {
+                "get_public_feed": locked(database.feed_page),
+                "get_user_videos": locked(database.user_videos_page),
+                "legacy_feed": legacy_query(_LEGACY_FEED_SQL),
+                "legacy_user_videos": legacy_query(_LEGACY_USER_VIDEOS_SQL),
+            }),
+            "state": type("StubDict", (), {"get": _StubCall(latency, lambda key, default=None: shared.get(key, default)),
+                                           "put": _StubCall(latency, shared.__setitem__)})(),
+        }
+        original = {name: getattr(api, name) for name in patched}
+
+        legacy = APIRouter()
+
+        @legacy.get("/feed")
+        async def legacy_feed():
+            return await api.Database().legacy_feed.remote.aio()
+
+        @legacy.get("/my_videos")
+        async def legacy_my_videos(user_id: str):
+            return await api.Database().legacy_user_videos.remote.aio(user_id)
+
+        app = FastAPI()
+        app.include_router(api.router, prefix="/api")
+        app.include_router(legacy, prefix="/legacy")
+
+        rng = random.Random(2)
+        user_ids = [f"user_{rng.randrange(users)}" for _ in range(requests)]
+
+        async def measure(client):
+            # A cursor `deep_pages` pages into the feed
+            cursor = None
+            for _ in range(deep_pages):
+                cursor = (await client.get("/api/feed", params={"cursor": cursor} if cursor else {})).headers["X-Next-Cursor"]
+            paths = {
+                "feed_first": lambda i: ("/api/feed", {}),
+                "feed_deep": lambda i: ("/api/feed", {"cursor": cursor}),
+                "my_videos": lambda i: ("/api/my_videos", {"user_id": user_ids[i]}),
+                "legacy_feed": lambda i: ("/legacy/feed", {}),
+                "legacy_my_videos": lambda i: ("/legacy/my_videos", {"user_id": user_ids[i]}),
+            }
+            report = {}
+            for name, path_for in paths.items():
+                times = []
+                for i in range(requests):
+                    path, params = path_for(i)
+                    start = time.perf_counter()
+                    (await client.get(path, params=params)).raise_for_status()
+                    times.append(time.perf_counter() - start)
+                report[name] = _percentiles(times)
+            return report
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                return await measure(client)
+
+        try:
+            for name, value in patched.items():
+                setattr(api, name, value)
+            api.feed_cache.clear()
+            report = asyncio.run(run())
+        finally:
+            for name, value in original.items():
+                setattr(api, name, value)
+        conn.close()
+        return {"rows": rows, "users": users, "latency_ms": latency_ms, "feed_cache": api.feed_cache.stats(),
+                "endpoints": report}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_stream(seconds=600, width=1280, height=720, rtt_ms=50.0, mbps=20.0, probe_kb=64, first_frame_kb=512,
+                 seeks=20):
+    """
+    Time-to-first-frame + seek latency through /api/stream on a large MP4,
+    as uploaded (moov at the end) vs after media.faststart().
+    A simulated player fetches: probe -> moov (wherever it is) -> first frames;
+    each request costs real server time + rtt + bytes / bandwidth.
+    """
+    import asyncio
+    import random
+    import httpx
+    from fastapi import FastAPI
+    from . import api, media
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    original_dir = api.VIDEO_DIR
+    try:
+        api.VIDEO_DIR = workdir
+        make_synthetic_video(os.path.join(workdir, "uploaded.mp4"), seconds=seconds, width=width, height=height)
+        shutil.copyfile(os.path.join(workdir, "uploaded.mp4"), os.path.join(workdir, "faststart.mp4"))
+        start = time.perf_counter()
+        media.faststart(os.path.join(workdir, "faststart.mp4"))
+        remux_s = time.perf_counter() - start
+
+        app = FastAPI()
+        app.include_router(api.router, prefix="/api")
+        link = lambda nbytes: rtt_ms / 1000 + nbytes * 8 / (mbps * 1e6)
+        rng = random.Random(4)
+
+        async def fetch(client, video_id, first, last, headers=None):
+            start = time.perf_counter()
+            response = await client.get(f"/api/stream/{video_id}",
+                                        headers=dict(headers or {}, Range=f"bytes={first}-{last}"))
+            assert response.status_code == 206, response.status_code
+            return time.perf_counter() - start + link(len(response.content)), response
+
+        async def play(client, video_id):
+            atoms = {kind: (offset, size) for kind, offset, size in media.top_level_atoms(os.path.join(workdir, f"{video_id}.mp4"))}
+            moov, mdat = atoms["moov"], atoms["mdat"]
+            elapsed, requests = 0.0, 0
+            # 1. probe the head
+            spent, response = await fetch(client, video_id, 0, probe_kb * 1024 - 1)
+            elapsed, requests = elapsed + spent, requests + 1
+            # 2. the rest of moov, if the probe didn't cover it (a tail fetch when moov is last)
+            if moov[0] + moov[1] > probe_kb * 1024:
+                spent, _ = await fetch(client, video_id, max(moov[0], probe_kb * 1024), moov[0] + moov[1] - 1)
+                elapsed, requests = elapsed + spent, requests + 1
+            # 3. first frames
+            spent, _ = await fetch(client, video_id, mdat[0], mdat[0] + first_frame_kb * 1024 - 1)
+            return elapsed + spent, requests + 1, response.headers["ETag"], mdat
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                report = []
+                for video_id in ("uploaded", "faststart"):
+                    ttff, requests, tag, mdat = await play(client, video_id)
+                    seek_times = []
+                    for _ in range(seeks):
+                        offset = rng.randrange(mdat[0], mdat[0] + mdat[1] - first_frame_kb * 1024)
+                        spent, _ = await fetch(client, video_id, offset, offset + first_frame_kb * 1024 - 1)
+                        seek_times.append(spent)
+                    start = time.perf_counter()
+                    revalidated = await client.get(f"/api/stream/{video_id}", headers={"If-None-Match": tag})
+                    revalidate_s = time.perf_counter() - start + link(0)
+                    report.append({"file": video_id, "faststart": media.is_faststart(os.path.join(workdir, f"{video_id}.mp4")),
+                                   "ttff_ms": round(ttff * 1000, 1), "requests_to_first_frame": requests,
+                                   "seek": _percentiles(seek_times), "revalidate_status": revalidated.status_code,
+                                   "revalidate_ms": round(revalidate_s * 1000, 1)})
+                return report
+
+        api.stat_cache.clear()
+        return {"seconds": seconds, "resolution": f"{width}x{height}",
+                "mb": round(os.path.getsize(os.path.join(workdir, "uploaded.mp4")) / 1e6, 1),
+                "rtt_ms": rtt_ms, "mbps": mbps, "remux_seconds": round(remux_s, 2), "runs": asyncio.run(run())}
+    finally:
+        api.VIDEO_DIR = original_dir
+        api.stat_cache.clear()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_thumbnails(seconds=300, width=1280, height=720, repeats=2):
+    """
+    Cost of thumbnails cut from the indexing decode pass (thumbs.ThumbnailCollector
+    as extract's tap) vs the plain pass, and what a result card / scrub bar
+    downloads: poster + sprites instead of the MP4.
+    """
+    from .extract import sample_frames
+    from . import thumbs
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    try:
+        path = make_synthetic_video(os.path.join(workdir, "clip.mp4"), seconds=seconds, width=width, height=height)
+        timings = {"plain": [], "with_thumbnails": []}
+        for _ in range(repeats):
+            start = time.perf_counter()
+            frames = sum(1 for _ in sample_frames(path))
+            timings["plain"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            collector = thumbs.ThumbnailCollector("clip", out_dir=workdir)
+            for _ in sample_frames(path, tap=collector.tap):
+                pass
+            folder = collector.finish()
+            timings["with_thumbnails"].append(time.perf_counter() - start)
+
+        sizes = {name: os.path.getsize(os.path.join(folder, name)) for name in sorted(os.listdir(folder))}
+        sprites = sum(size for name, size in sizes.items() if name.startswith("sprite_"))
+        video_bytes = os.path.getsize(path)
+        plain, tapped = min(timings["plain"]), min(timings["with_thumbnails"])
+        return {"seconds": seconds, "resolution": f"{width}x{height}", "decoded_frames": frames,
+                "decode_seconds": round(plain, 2), "decode_with_thumbnails_seconds": round(tapped, 2),
+                "overhead_pct": round((tapped - plain) / plain * 100, 1),
+                "files": sizes, "video_kb": round(video_bytes / 1024),
+                "poster_kb": round(sizes["poster.jpg"] / 1024, 1), "sprites_kb": round(sprites / 1024, 1),
+                "card_bytes_saved_x": round(video_bytes / sizes["poster.jpg"])}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_queue(uploads=40, reindex_requests=60, reindexed_videos=10, arrival_ms=5.0, prepare_ms_per_100mb=40.0,
+                mb_range=(5, 200), commit_ms=150.0, cold_start_s=20.0, seed=5):
+    """
+    Ingest scheduling on the in-process queue (jobs.py over store.LocalState).
+    `uploads` fresh videos + `reindex_requests` repair clicks spread over
+    `reindexed_videos` videos arrive every `arrival_ms`, shuffled. Like api.py,
+    each arrival enqueues and starts a scheduler thread only if none is draining.
+    Work is simulated: prepare sleeps by file size, a commit sleeps once per batch.
+    "spawn_per_request" is the old path in the same cost model: one container
+    (cold start) + one prepare + one serialized commit per request.
+    """
+    import random
+    from . import jobs
+    from .store import LocalState
+
+    rng = random.Random(seed)
+    state = LocalState()
+    sizes = {f"up_{i}": rng.uniform(*mb_range) for i in range(uploads)}
+    repaired = [f"old_{i}" for i in range(reindexed_videos)]
+    sizes.update({video_id: rng.uniform(*mb_range) for video_id in repaired})
+    arrivals = [("upload", f"up_{i}") for i in range(uploads)] + \
+               [("reindex", rng.choice(repaired)) for _ in range(reindex_requests)]
+    rng.shuffle(arrivals)
+    prepare_s = lambda video_id: sizes[video_id] / 100 * prepare_ms_per_100mb / 1000
+    counters = {"batches": 0, "prepared": 0, "scheduler_starts": 0, "prepare_s": 0.0}
+
+    def run_batch(batch):
+        results = {}
+        for job in batch:
+            time.sleep(prepare_s(job["video_id"]))
+            counters["prepare_s"] += prepare_s(job["video_id"])
+            results[job["job_id"]] = ("completed", {"prepare": prepare_s(job["video_id"])}, {})
+        time.sleep(commit_ms / 1000)
+        for stages in results.values():
+            stages[1]["commit"] = commit_ms / 1000
+        counters["batches"] += 1
+        counters["prepared"] += len(batch)
+        return results
+
+    schedulers = []
+    start = time.perf_counter()
+    for kind, video_id in arrivals:
+        _, coalesced = jobs.enqueue(state, video_id, kind, {}, size_bytes=int(sizes[video_id] * 1e6))
+        if not jobs.scheduler_active(state):
+            counters["scheduler_starts"] += 1
+            schedulers.append(threading.Thread(target=jobs.drain, args=(state, run_batch)))
+            schedulers[-1].start()
+        time.sleep(arrival_ms / 1000)
+    for thread in schedulers:
+        thread.join()
+    makespan = time.perf_counter() - start
+
+    history = state.get(jobs.HISTORY_KEY, [])
+    stats = jobs.stats(state)
+    requests = len(arrivals)
+    per_request_prepare = sum(prepare_s(video_id) for _, video_id in arrivals)
+    return {
+        "requests": requests, "left_in_queue": jobs.pending_count(state),
+        "scheduler": {"jobs_run": counters["prepared"], "coalesced": requests - counters["prepared"],
+                      "batches": counters["batches"], "commits": counters["batches"],
+                      "scheduler_starts": counters["scheduler_starts"],
+                      "gpu_seconds_est": round(counters["scheduler_starts"] * cold_start_s + counters["prepare_s"], 1),
+                      "makespan_s": round(makespan, 2),
+                      "wait_seconds": stats["recent"]["wait_seconds"], "finished": len(history)},
+        "spawn_per_request": {"jobs_run": requests, "containers": requests, "commits": requests,
+                              "gpu_seconds_est": round(requests * cold_start_s + per_request_prepare, 1)},
+    }
+
+
+def bench_sharding(encoder_kind="stub", seconds=1800, width=1280, height=720, fps=29.97, workers=(1, 2, 4, 8),
+                   extractor="opencv"):
+    """
+    Wall clock of decode + embed for one long video vs decode worker count
+    (extract.iter_frames_sharded), and whether every run yields exactly the
+    single-worker frames (timestamps + pixel checksums, in order).
+    Speedup is bounded by the cores this machine has (reported as cpus).
+    """
+    import zlib
+    from . import extract
+    from .index import embed_video
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    original_min = extract.SHARD_MIN_SECONDS
+    try:
+        extract.SHARD_MIN_SECONDS = 0.0
+        path = make_synthetic_video(os.path.join(workdir, "long.mp4"), seconds=seconds, fps=fps, width=width, height=height)
+        encoder = _encoder_factory(encoder_kind)().load()
+        report = {"seconds": seconds, "resolution": f"{width}x{height}", "extractor": extractor,
+                  "cpus": os.cpu_count(), "runs": []}
+        reference = None
+        for n in workers:
+            seen = []
+            def record(frames):
+                for item in frames:
+                    seen.append((item[0], zlib.crc32(item[1].tobytes())))
+                    yield item
+            start = time.perf_counter()
+            frame_rows, _, _ = embed_video(None, "bench", encoder=encoder,
+                                           frames=extract.stream_frames(path, extractor=extractor, tap=record, workers=n))
+            elapsed = time.perf_counter() - start
+            reference = reference or (seen, elapsed)
+            report["runs"].append({"workers": n, "frames": len(frame_rows), "seconds": round(elapsed, 2),
+                                   "speedup_x": round(reference[1] / elapsed, 2),
+                                   "matches_single_worker": seen == reference[0]})
+        return report
+    finally:
+        extract.SHARD_MIN_SECONDS = original_min
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_dedup(encoder_kind="stub", unique=4, seconds=60, copies=3, overlaps=3, overlap=0.5,
+                gpu_ms_per_frame=5.0, frame_cache=True):
+    """
+    GPU work saved on a corpus with KNOWN duplicates: `unique` distinct clips,
+    `copies` byte-identical re-uploads of them and `overlaps` re-encoded clips
+    sharing `overlap` of an earlier clip's time range.
+    - baseline: every upload goes through the vision tower
+    - dedup: sha256 match -> index.clone_frame_rows; otherwise (frame_cache)
+      dedup.CachingEncoder over a dedup.FrameCache table
+    GPU-seconds = frames through the vision tower x gpu_ms_per_frame (T4 SigLIP
+    ballpark at batch 32). Reused vectors are checked against the baseline ones.
+    """
+    import numpy as np
+    from . import dedup, extract
+    from .index import clone_frame_rows, embed_meta, embed_video, write_video
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    try:
+        clip = lambda name, start: make_synthetic_video(os.path.join(workdir, f"{name}.mp4"), seconds,
+                                                        width=640, height=360, start=start)
+        starts = [k * 100.0 + 13.0 for k in range(unique)]
+        uploads = [(f"unique_{k}", clip(f"unique_{k}", start)) for k, start in enumerate(starts)]
+        for k in range(copies):
+            source = uploads[k % unique][1]
+            shutil.copyfile(source, os.path.join(workdir, f"copy_{k}.mp4"))
+            uploads.append((f"copy_{k}", os.path.join(workdir, f"copy_{k}.mp4")))
+        for k in range(overlaps):
+            uploads.append((f"overlap_{k}", clip(f"overlap_{k}", starts[k % unique] + seconds * (1 - overlap))))
+        encoder = _encoder_factory(encoder_kind)().load()
+
+        # 1. Baseline: everything embedded
+        baseline = {}
+        for video_id, path in uploads:
+            rows, _, _ = embed_video(None, video_id, encoder=encoder, frames=extract.sample_frames(path))
+            baseline[video_id] = np.asarray([row["vector"] for row in rows], dtype=np.float32)
+
+        # 2. Content hash + (optional) frame cache, through the real write path
+        db_path = os.path.join(workdir, "lancedb")
+        caching = dedup.CachingEncoder(encoder, dedup.FrameCache(db_path)) if frame_cache else None
+        indexed, per_upload = {}, []
+        for video_id, path in uploads:
+            digest = dedup.file_sha256(path)
+            misses = caching.misses if caching else 0
+            if digest in indexed:
+                how, rows = "clone", clone_frame_rows(db_path, "bench_frames", indexed[digest], video_id)
+                embedded = 0
+            else:
+                rows, _, _ = embed_video(None, video_id, encoder=caching or encoder, frames=extract.sample_frames(path))
+                how, embedded = "embed", (caching.misses - misses) if caching else len(rows)
+                indexed[digest] = video_id
+            write_video(db_path, video_id, "bench_frames", rows, embed_meta(video_id, encoder=encoder))
+            if caching:
+                caching.cache.add(caching.take_new())
+            vectors = np.asarray([row["vector"] for row in rows], dtype=np.float32)
+            per_upload.append({"video_id": video_id, "how": how, "frames": len(rows), "embedded": embedded,
+                               "min_cosine_vs_baseline": round(float((vectors * baseline[video_id]).sum(axis=1).min()), 4)})
+
+        frames_total = sum(len(vectors) for vectors in baseline.values())
+        frames_embedded = sum(row["embedded"] for row in per_upload)
+        gpu = lambda frames: round(frames * gpu_ms_per_frame / 1000, 1)
+        return {"uploads": len(uploads), "frame_cache": frame_cache,
+                "baseline": {"frames_embedded": frames_total, "gpu_seconds_est": gpu(frames_total)},
+                "dedup": {"frames_embedded": frames_embedded, "gpu_seconds_est": gpu(frames_embedded),
+                          "frames_cloned": sum(row["frames"] for row in per_upload if row["how"] == "clone"),
+                          "frame_cache_hits": caching.hits if caching else 0},
+                "gpu_seconds_saved_est": gpu(frames_total - frames_embedded), "per_upload": per_upload}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def make_synthetic_video(path, seconds=60, fps=30.0, width=1920, height=1080, start=0.0):
+    """Moving-gradient test clip written with OpenCV (mp4v). start: seconds into the same endless clip."""
+    import cv2
+    import numpy as np
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    base = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    first = int(round(start * fps))
+    for i in range(first, first + int(seconds * fps)):
+        shifted = np.roll(base, i * 7, axis=1)
+        frame = np.dstack([shifted, np.roll(shifted, height // 3, axis=0), np.full_like(shifted, (i * 3) % 256)])
+        cv2.putText(frame, f"{i / fps:8.3f}", (40, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 6)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def make_slideshow_video(path, seconds=300, fps=30.0, width=1280, height=720, slide_seconds=20):
+    """Static slides with a small moving cursor: the worst case for fixed 2 fps sampling."""
+    import cv2
+    import numpy as np
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    rng = np.random.default_rng(3)
+    slide = None
+    for i in range(int(seconds * fps)):
+        if i % int(slide_seconds * fps) == 0:
+            color = rng.integers(0, 255, size=3).tolist()
+            slide = np.full((height, width, 3), color, dtype=np.uint8)
+            cv2.putText(slide, f"Slide {i // int(slide_seconds * fps) + 1}", (60, 120),
+                        cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 6)
+        frame = slide.copy()
+        cv2.circle(frame, (100 + (i * 3) % (width - 200), height - 100), 12, (0, 0, 0), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def bench_adaptive(encoder_kind="stub", seconds=300, slide_seconds=20, min_interval=0.5, max_interval=10.0):
+    """Vector count + indexing time: fixed 2 fps vs scene-change sampling on a slideshow."""
+    from .extract import sample_frames
+    from .index import index_frames
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    try:
+        path = make_slideshow_video(os.path.join(workdir, "slides.mp4"), seconds, slide_seconds=slide_seconds)
+        encoder = _encoder_factory(encoder_kind)().load()
+        report = {"seconds": seconds, "slide_seconds": slide_seconds}
+        for sampling in ("fixed", "adaptive"):
+            adaptive = {"min_interval": min_interval, "max_interval": max_interval} if sampling == "adaptive" else {}
+            start = time.perf_counter()
+            stats = index_frames(None, os.path.join(workdir, f"db_{sampling}"), "bench", "bench_frames",
+                                 encoder=encoder, frames=sample_frames(path, sampling=sampling, **adaptive))
+            report[sampling] = {"vectors": stats["frames"], "index_seconds": round(time.perf_counter() - start, 2)}
+        report["vector_reduction_x"] = round(report["fixed"]["vectors"] / max(report["adaptive"]["vectors"], 1), 1)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_extractors(seconds=120, fps=29.97, width=1920, height=1080):
+    """
+    OpenCV read()-and-discard vs ffmpeg select+scale rawvideo pipe on one clip.
+    Also reports how far each extractor's timestamps sit from the true
+    2 fps grid at the end of the clip (drift).
+    """
+    from .extract import EXTRACTORS
+
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    try:
+        path = make_synthetic_video(os.path.join(workdir, "clip.mp4"), seconds, fps, width, height)
+        report = {"seconds": seconds, "fps": fps, "resolution": f"{width}x{height}", "extractors": {}}
+        for name, iter_frames in EXTRACTORS.items():
+            start = time.perf_counter()
+            timestamps = [t for t, _ in iter_frames(path)]
+            elapsed = time.perf_counter() - start
+            report["extractors"][name] = {
+                "frames": len(timestamps),
+                "seconds": round(elapsed, 2),
+                "realtime_x": round(seconds / elapsed, 1),
+                "last_timestamp": timestamps[-1] if timestamps else None,
+                "end_drift_sec": round(timestamps[-1] - (len(timestamps) - 1) * 0.5, 3) if timestamps else None,
+            }
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _filler_frames(ids, frames_per_video, seed):
+    """Frame rows of stand-in videos vid_{id} as one arrow table (scene-like vectors, 2 fps)."""
+    import numpy as np
+    import pyarrow as pa
+
+    flat = _scene_vectors(len(ids), frames_per_video, seed=seed).reshape(-1, 1152)
+    timestamps = np.arange(frames_per_video, dtype="float64") * 0.5
+    return pa.table({
+        "vector": pa.FixedSizeListArray.from_arrays(pa.array(flat.reshape(-1)), 1152),
+        "video_id": pa.array([f"vid_{v}" for v in ids for _ in range(frames_per_video)]),
+        "timestamp": pa.array(np.tile(timestamps, len(ids))),
+        "metadata": pa.array([""] * len(flat)),
+        "span_end": pa.array(np.tile(timestamps + 0.5, len(ids))),
+    })
+
+
+def bench_pipeline(encoder_kind="stub", seconds=60, fps=30.0, width=1280, height=720, extractor="opencv",
+                   frame_counts=(1_000, 100_000, 1_000_000), frames_per_video=500, queries=50, k=20,
+                   batch_size=32, chunk_videos=100):
+    """
+    The real ingest + search code on one synthetic clip, stage by stage:
+    generate -> extract.extract_frames -> index.index_frames, then the library is
+    grown to each frame count (filler videos + the IVF-PQ build ann.py would do)
+    and search.search_index (inside the clip) / search_global_unified are timed.
+    Every stage reports seconds + peak RSS; extract/index also frames/sec.
+    """
+    import lancedb
+    from . import extract, search, search_global
+    from .ann import IndexManager
+    from .index import META_TABLE, index_frames, open_tables
+
+    encoder = _encoder_factory(encoder_kind)().load()
+    workdir = tempfile.mkdtemp(prefix="chrono_bench_")
+    db_path = os.path.join(workdir, "lancedb")
+    frames_folder = os.path.join(workdir, "frames")
+    table_name = "bench_frames"
+    stages = _Stages()
+    try:
+        # --- 1. INGEST one clip (what VideoIndexer does per upload) ---
+        with stages("generate"):
+            path = make_synthetic_video(os.path.join(workdir, "clip.mp4"), seconds, fps, width, height)
+        with stages("extract") as report:
+            frames = extract.extract_frames(path, frames_folder, extractor=extractor)
+        report["frames_per_sec"] = round(frames / max(report["seconds"], 1e-9), 1)
+        with stages("index") as report:
+            index_frames(frames_folder, db_path, "clip", table_name, title="Synthetic clip", tags="bench",
+                         encoder=encoder, batch_size=batch_size)
+        report["frames_per_sec"] = round(frames / max(report["seconds"], 1e-9), 1)
+
+        # --- 2. SEARCH as the library grows ---
+        db = lancedb.connect(db_path)
+        tbl_frames, tbl_meta = open_tables(db, table_name)
+        manager = IndexManager(db_path)
+        texts = [f"query {q}" for q in range(queries)]
+        filled, runs = 0, []
+        for target in frame_counts:
+            videos = max(0, target - frames) // frames_per_video
+            with stages(f"fill_{target}"):
+                for chunk in range(filled, videos, chunk_videos):
+                    ids = range(chunk, min(chunk + chunk_videos, videos))
+                    tbl_frames.add(_filler_frames(ids, frames_per_video, seed=chunk))
+                    tbl_meta.add([{"vector": v.tolist(), "video_id": f"vid_{i}", "title": f"Video {i}", "tags": ""}
+                                  for i, v in zip(ids, _clustered_vectors(len(ids), seed=chunk))])
+                added = max(0, videos - filled)
+                manager.refresh({table_name: added * frames_per_video, META_TABLE: added})
+                filled = max(filled, videos)
+
+            run = {"frames": tbl_frames.count_rows(), "videos": tbl_meta.count_rows()}
+            for name, query in (("search_index", lambda text: search.search_index(
+                                     text, db_path, table_name, filter_video_id="clip", encoder=encoder)),
+                                ("search_global", lambda text: search_global.search_global_unified(
+                                     text, db_path, table_name, encoder=encoder, k=k))):
+                times = []
+                with stages(f"{name}_{target}"):
+                    for text in texts:
+                        start = time.perf_counter()
+                        query(text)
+                        times.append(time.perf_counter() - start)
+                run[name] = _percentiles(times)
+            runs.append(run)
+        return {"encoder": encoder_kind, "seconds": seconds, "fps": fps, "resolution": f"{width}x{height}",
+                "extractor": extractor, "frames": frames, "stages": stages.report, "runs": runs}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+BENCHMARKS = {
+    "residency": bench_residency,
+    "embedding": bench_embedding,
+    "extractors": bench_extractors,
+    "adaptive": bench_adaptive,
+    "ingest": bench_ingest,
+    "ann": bench_ann,
+    "query_cache": bench_query_cache,
+    "result_cache": bench_result_cache,
+    "microbatch": bench_microbatch,
+    "query_encoder": bench_query_encoder,
+    "deep_search": bench_deep_search,
+    "global_search": bench_global_search,
+    "segments": bench_segments,
+    "storage": bench_storage,
+    "api": bench_api,
+    "db": bench_db,
+    "listing": bench_listing,
+    "stream": bench_stream,
+    "thumbnails": bench_thumbnails,
+    "queue": bench_queue,
+    "sharding": bench_sharding,
+    "dedup": bench_dedup,
+    "pipeline": bench_pipeline,
+}
+
+
+def _parse_param(text):
+    import json
+    key, _, value = text.partition("=")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+# --- Saved runs (--out) and run-to-run comparison (--baseline / compare) ---
+
+LOWER_IS_BETTER = ("_ms", "seconds", "_mb")
+HIGHER_IS_BETTER = ("per_sec", "speedup", "recall", "rps", "realtime")
+
+
+def _git_commit():
+    import subprocess
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(name, **kwargs):
+    """Runs one benchmark and wraps its report with what is needed to compare it later."""
+    import datetime
+    import platform
+
+    started_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    start = time.perf_counter()
+    result = BENCHMARKS[name](**kwargs)
+    return {
+        "benchmark": name,
+        "params": kwargs,
+        "started_at": started_at,
+        "git_commit": _git_commit(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "wall_seconds": round(time.perf_counter() - start, 2),
+        "peak_rss_mb": max(_PEAK_SEEN[0], _peak_rss_mb()),
+        "result": result,
+    }
+
+
+def _numbers(value, prefix=""):
+    """Flattens a report to {"runs.0.after.p50_ms": 1.2, ...} (numeric leaves only)."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+    found = {}
+    for key, item in items:
+        found.update(_numbers(item, f"{prefix}.{key}" if prefix else str(key)))
+    return found
+
+
+def compare_runs(baseline, current, tolerance=0.1):
+    """
+    Every number both saved runs have, side by side. Timings / memory that grew,
+    or throughput / recall that shrank, by more than `tolerance` are regressions.
+    """
+    pick = lambda run: {"wall_seconds": run["wall_seconds"], "peak_rss_mb": run["peak_rss_mb"], "result": run["result"]}
+    before, after = _numbers(pick(baseline)), _numbers(pick(current))
+    metrics, regressions = [], []
+    for key in sorted(before.keys() & after.keys()):
+        leaf = key.rsplit(".", 1)[-1]
+        sign = 1 if leaf.endswith(LOWER_IS_BETTER) else -1 if any(w in leaf for w in HIGHER_IS_BETTER) else 0
+        change = (after[key] - before[key]) / abs(before[key]) if before[key] else 0.0
+        metric = {"metric": key, "baseline": before[key], "current": after[key], "change": round(change, 3)}
+        metrics.append(metric)
+        if sign and sign * change > tolerance:
+            regressions.append(metric)
+    return {
+        "benchmark": current["benchmark"],
+        "baseline": {"git_commit": baseline.get("git_commit"), "started_at": baseline.get("started_at")},
+        "current": {"git_commit": current.get("git_commit"), "started_at": current.get("started_at")},
+        "same_params": baseline.get("params") == current.get("params"),
+        "tolerance": tolerance,
+        "regressions": regressions,
+        "metrics": metrics,
+    }
+
+
+def main():
+    import inspect
+    import json
+    parser = argparse.ArgumentParser(description="ChronoSearch local benchmarks")
+    parser.add_argument("name", choices=sorted(BENCHMARKS) + ["compare"])
+    parser.add_argument("files", nargs="*", help="compare: BASELINE.json CURRENT.json")
+    parser.add_argument("--encoder", default=os.environ.get("CHRONO_ENCODER", "stub"), choices=["stub", "siglip"])
+    parser.add_argument("-p", "--param", action="append", default=[], type=_parse_param,
+                        help="benchmark keyword argument, e.g. -p seconds=600 -p width=3840")
+    parser.add_argument("--out", help="also save the run (report + params, commit, host, peak RSS) as JSON")
+    parser.add_argument("--baseline", help="saved run to compare this one against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    def load(path):
+        with open(path) as f:
+            return json.load(f)
+
+    if args.name == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs BASELINE.json CURRENT.json")
+        comparison = compare_runs(load(args.files[0]), load(args.files[1]), args.tolerance)
+        print(json.dumps(comparison, indent=2))
+        sys.exit(1 if comparison["regressions"] else 0)
+
+    kwargs = dict(args.param)
+    if "encoder_kind" in inspect.signature(BENCHMARKS[args.name]).parameters:
+        kwargs.setdefault("encoder_kind", args.encoder)
+    run = run_benchmark(args.name, **kwargs)
+    print(json.dumps(run["result"], indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"💾 Saved to {args.out}")
+    if args.baseline:
+        comparison = compare_runs(load(args.baseline), run, args.tolerance)
+        if not comparison["same_params"]:
+            print(f"⚠️ {args.baseline} was run with other params, numbers may not be comparable")
+        for metric in comparison["regressions"]:
+            print(f"📉 {metric['metric']}: {metric['baseline']} -> {metric['current']} ({metric['change']:+.0%})")
+        print(f"{'❌' if comparison['regressions'] else '✅'} {len(comparison['regressions'])} regression(s) "
+              f"vs {args.baseline} (tolerance {args.tolerance:.0%})")
+        sys.exit(1 if comparison["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+####################....... cache.py
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU capped by BYTES (not entries), with an optional TTL.
+    - sizeof(value) says how many bytes an entry costs (default: value.nbytes)
+    - Counts hits / misses / evictions / expirations for the metrics endpoint
+    """
+
+    def __init__(self, max_bytes, ttl=None, sizeof=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: value.nbytes)
+        self._entries = OrderedDict() # key -> (value, size, stored_at)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, size, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return # would evict everything and still not fit
+            self._entries[key] = (value, size, time.monotonic())
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+def normalize_query(query):
+    """'  White   Sneakers ' -> 'white sneakers' (the text that actually gets encoded)."""
+    return " ".join(query.split()).casefold()
+
+
+class QueryCache(LRUCache):
+    """
+    Normalized query text -> normalized 1152-d query vector.
+    Shared by deep search and global search (it lives on the encoder).
+    Emptied automatically if the model identifier ever changes.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=None):
+        super().__init__(max_bytes, ttl, sizeof=lambda vector: vector.nbytes + 200)
+        self.model_id = None
+
+    def get_or_encode(self, model_id, query, encode):
+        if model_id != self.model_id:
+            self.clear()
+            self.model_id = model_id
+        text = normalize_query(query)
+        vector = self.get(text)
+        if vector is None:
+            vector = encode(text)
+            vector.setflags(write=False) # shared between requests
+            self.put(text, vector)
+        return vector
+
+
+class ResultCache(LRUCache):
+    """
+    Search results keyed by (kind, query, filter, limit, knobs, generation).
+    The ingest generation is part of the key, so a finished ingest or delete
+    makes every older entry unreachable; they are dropped on the next sync.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=None):
+        # ~300 bytes per result dict is close enough for a size cap
+        super().__init__(max_bytes, ttl, sizeof=lambda results: 300 * len(results) + 200)
+
+    def key(self, kind, query, generation, **params):
+        return (kind, normalize_query(query), generation, tuple(sorted(params.items())))
+
+    def get_or_search(self, kind, query, generation, search, **params):
+        key = self.key(kind, query, generation, **params)
+        results = self.get(key)
+        if results is None:
+            results = search()
+            self.put(key, results)
+        return results
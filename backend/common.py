@@ -19,6 +19,8 @@ image = (
         "pandas",
         "opencv-python-headless", 
         "sentencepiece",
+        "onnx",
+        "onnxruntime", # CPU query encoder (encoder.SiglipTextEncoder, backend onnx / onnx-int8)
         "fastapi", 
         "python-multipart",
         "bcrypt",
@@ -31,4 +33,7 @@ image = (
 # Persistent storage
 vol = modal.Volume.from_name("chrono-storage-v8", create_if_missing=True)
 
+# Small shared state across containers (write lock for the vector store)
+state = modal.Dict.from_name("chrono-state-v8", create_if_missing=True)
+
 app = modal.App(APP_NAME, image=image)
\ No newline at end of file
@@ -0,0 +1,303 @@
+####################....... compact.py
+# Compact frame-vector storage:
+#   python -m backend.compact migrate /data/lancedb_stable video_vectors_v8_golden --format int8
+import argparse
+import os
+
+EMBED_DIM = 1152
+FORMATS = ("float32", "float16", "int8")
+# Format for NEW frame tables (existing tables keep theirs until migrated)
+DEFAULT_FORMAT = os.environ.get("CHRONO_VECTOR_STORAGE", "float32")
+SCAN_BATCH_ROWS = 65_536
+# int8-only tables can't carry an IVF-PQ index (see ann_column), so every global query
+# scans them; past this many rows migrate_table refuses int8 without keep_full / force
+SCAN_MAX_ROWS = int(os.environ.get("CHRONO_SCAN_MAX_ROWS", "1000000"))
+
+# Column(s) each compact format scans; "vector" (float32) is optional next to them
+CODE_COLUMNS = {
+    "float16": ["vector_f16"],
+    "int8": ["vector_i8", "vector_scale"],
+}
+
+
+def storage_format(schema):
+    """Which format a frame table uses, from its schema (old tables are float32)."""
+    names = schema.names
+    if "vector_i8" in names:
+        return "int8"
+    if "vector_f16" in names:
+        return "float16"
+    return "float32"
+
+
+def has_full_vectors(schema):
+    return "vector" in schema.names
+
+
+def ann_column(schema):
+    """
+    The column an IVF-PQ index (ann.py) and LanceDB search run on: float32 when
+    stored, else the float16 codes. None for int8-only tables: Lance can't index
+    int8 vectors, so those are scanned (scan_topk).
+    """
+    if has_full_vectors(schema):
+        return "vector"
+    if storage_format(schema) == "float16":
+        return "vector_f16"
+    return None
+
+
+def vector_fields(fmt, keep_full=False):
+    """Schema fields for the vector part of a frame table."""
+    import pyarrow as pa
+
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown vector storage format: {fmt}")
+    fields = []
+    if fmt == "float32" or keep_full:
+        fields.append(pa.field("vector", pa.list_(pa.float32(), EMBED_DIM)))
+    if fmt == "float16":
+        fields.append(pa.field("vector_f16", pa.list_(pa.float16(), EMBED_DIM)))
+    if fmt == "int8":
+        fields.append(pa.field("vector_i8", pa.list_(pa.int8(), EMBED_DIM)))
+        fields.append(pa.field("vector_scale", pa.float32()))
+    return fields
+
+
+def encode(vectors, fmt):
+    """
+    float32 (n, 1152) -> {column: arrow array} for `fmt`.
+    int8 is symmetric per vector: codes = round(v / scale), scale = max|v| / 127.
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, EMBED_DIM)
+    fixed = lambda values, dtype: pa.FixedSizeListArray.from_arrays(pa.array(values.reshape(-1), type=dtype), EMBED_DIM)
+    if fmt == "float32":
+        return {"vector": fixed(vectors, pa.float32())}
+    if fmt == "float16":
+        return {"vector_f16": fixed(vectors.astype(np.float16), pa.float16())}
+    if fmt == "int8":
+        scale = np.abs(vectors).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scale[:, None]), -127, 127).astype(np.int8)
+        return {"vector_i8": fixed(codes, pa.int8()), "vector_scale": pa.array(scale.astype(np.float32))}
+    raise ValueError(f"Unknown vector storage format: {fmt}")
+
+
+def _matrix(column, dtype):
+    """FixedSizeList column (Array or ChunkedArray) -> (n, 1152) NumPy view/copy."""
+    import pyarrow as pa
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    return column.flatten().to_numpy(zero_copy_only=False).reshape(-1, EMBED_DIM).astype(dtype, copy=False)
+
+
+def decode(data, fmt=None, full=False):
+    """
+    Arrow table/batch -> float32 (n, 1152).
+    full=True reads the float32 "vector" column (the rescoring source) when there is one.
+    """
+    import numpy as np
+
+    fmt = fmt or storage_format(data.schema)
+    if fmt == "float32" or (full and has_full_vectors(data.schema)):
+        return _matrix(data.column("vector"), np.float32)
+    if fmt == "float16":
+        return _matrix(data.column("vector_f16"), np.float32)
+    vectors = _matrix(data.column("vector_i8"), np.float32) # a fresh float32 copy: scale it in place
+    vectors *= data.column("vector_scale").to_numpy()[:, None]
+    return vectors
+
+
+def dot(data, query_vector, fmt=None):
+    """
+    decode(data, fmt) @ query_vector without the decoded matrix: int8 rows are
+    scored as (codes @ q) * scale, so the scaled (n, 1152) copy is never built.
+    """
+    import numpy as np
+
+    fmt = fmt or storage_format(data.schema)
+    if fmt != "int8":
+        return decode(data, fmt) @ query_vector
+    return (_matrix(data.column("vector_i8"), np.float32) @ query_vector) * data.column("vector_scale").to_numpy()
+
+
+def compact_rows(frame_rows, fmt, keep_full=False):
+    """write_video() rows (float32 "vector" lists) -> an Arrow table in `fmt`."""
+    import numpy as np
+    import pyarrow as pa
+
+    columns = {}
+    if frame_rows:
+        vectors = np.asarray([row["vector"] for row in frame_rows], dtype=np.float32)
+        columns.update(encode(vectors, fmt))
+        if keep_full and fmt != "float32":
+            columns.update(encode(vectors, "float32"))
+        for name in frame_rows[0]:
+            if name != "vector":
+                columns[name] = pa.array([row[name] for row in frame_rows])
+    return pa.table(columns)
+
+
+def _rescore(dataset, hits, query_vector):
+    """Exact float32 scores for the candidate rows (one filtered read, grouped per video)."""
+    import numpy as np
+
+    clauses = []
+    for video_id, times in hits.groupby("video_id")["timestamp"]:
+        listed = ", ".join(repr(float(t)) for t in times)
+        clauses.append(f"(video_id = '{video_id}' AND timestamp IN ({listed}))")
+    full = dataset.to_table(columns=["vector", "video_id", "timestamp"], filter=" OR ".join(clauses))
+    scores = decode(full, "float32") @ query_vector
+    exact = dict(zip(zip(full["video_id"].to_pylist(), full["timestamp"].to_pylist()), scores.tolist()))
+    keys = zip(hits["video_id"], hits["timestamp"])
+    return hits.assign(score=[exact.get(key, score) for key, score in zip(keys, hits["score"])])
+
+
+def scan_topk(dataset, query_vector, limit, where=None, refine_factor=None,
+              columns=("video_id", "timestamp", "metadata", "span_end"), batch_rows=SCAN_BATCH_ROWS):
+    """
+    Exact scan over the COMPACT columns only (the float32 column is never read here):
+    - keeps the best limit * refine_factor rows per batch, merges across batches
+    - refine_factor + a float32 column -> those candidates are rescored at full precision
+    Returns a DataFrame shaped like LanceDB's search().to_pandas() (with _distance).
+    """
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+
+    fmt = storage_format(dataset.schema)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    extra = [c for c in columns if c in dataset.schema.names]
+    keep = limit * (refine_factor or 1)
+
+    def prune(frame, scores):
+        if len(scores) <= keep:
+            return frame, scores
+        top = np.argpartition(-scores, keep - 1)[:keep]
+        return frame.iloc[top].reset_index(drop=True), scores[top]
+
+    kept, kept_scores = [], []
+    for batch in dataset.to_batches(columns=CODE_COLUMNS.get(fmt, ["vector"]) + extra, filter=where,
+                                    batch_size=batch_rows):
+        if batch.num_rows == 0:
+            continue
+        scores = dot(batch, query_vector, fmt)
+        if len(scores) > keep:
+            top = np.argpartition(-scores, keep - 1)[:keep]
+            batch, scores = batch.take(top), scores[top]
+        kept.append(pa.Table.from_arrays([batch.column(c) for c in extra], names=extra).to_pandas())
+        kept_scores.append(scores)
+        if len(kept) >= 16: # merge now and then (bounded memory)
+            merged = prune(pd.concat(kept, ignore_index=True), np.concatenate(kept_scores))
+            kept, kept_scores = [merged[0]], [merged[1]]
+
+    if not kept:
+        return pd.DataFrame(columns=extra + ["score", "_distance"])
+    hits = pd.concat(kept, ignore_index=True).assign(score=np.concatenate(kept_scores))
+    hits = hits.sort_values("score", ascending=False, kind="stable").head(keep)
+    if refine_factor and fmt != "float32" and has_full_vectors(dataset.schema):
+        hits = _rescore(dataset, hits, query_vector)
+    hits = hits.sort_values("score", ascending=False, kind="stable").head(limit).reset_index(drop=True)
+    hits["_distance"] = 1 - hits["score"]
+    return hits
+
+
+def search_frames(tbl, query_vector, limit, nprobes=None, refine_factor=None, where=None):
+    """
+    Frame search for any storage format: LanceDB ANN/brute force on ann_column()
+    (float32, or the float16 codes), scan_topk() (+ optional full-precision
+    rescore) on int8-only tables.
+    """
+    from .ann import tune
+
+    column = ann_column(tbl.schema)
+    if column is None:
+        return scan_topk(tbl.to_lance(), query_vector, limit, where, refine_factor)
+    search_job = tune(tbl.search(query_vector, vector_column_name=column).metric("cosine"), nprobes, refine_factor)
+    if where:
+        search_job = search_job.where(where)
+    return search_job.limit(limit).to_pandas()
+
+
+def migrate_table(db_path, table_name, fmt, keep_full=False, batch_rows=SCAN_BATCH_ROWS, cleanup=True,
+                  force=False):
+    """
+    Rewrites a frame table IN PLACE (same Lance dataset, new version) in `fmt`.
+    Batches stream from the old version while the new one is written, so the
+    table is never held in memory. The ANN index doesn't carry over: rebuild it
+    (ann.IndexManager) on ann_column(), i.e. float32 if kept, else float16.
+    int8 without keep_full has NO index column, so every global query becomes a
+    full scan: above SCAN_MAX_ROWS rows that needs force=True.
+    cleanup=True deletes the old version's files afterwards (frees the space).
+    Returns {"rows", "bytes_before", "bytes_after"}.
+    """
+    import lance
+    import lancedb
+    import pyarrow as pa
+    from datetime import timedelta
+
+    tbl = lancedb.connect(db_path).open_table(table_name)
+    dataset = tbl.to_lance()
+    current = storage_format(dataset.schema)
+    if current == fmt and has_full_vectors(dataset.schema) == (keep_full or fmt == "float32"):
+        print(f"✅ {table_name} is already {fmt}")
+        size = directory_bytes(dataset.uri)
+        return {"rows": dataset.count_rows(), "bytes_before": size, "bytes_after": size}
+
+    rows = dataset.count_rows()
+    if fmt == "int8" and not keep_full and rows > SCAN_MAX_ROWS and not force:
+        raise ValueError(f"{table_name} has {rows} rows: int8 without keep_full can't be ANN-indexed, so every "
+                         f"query would scan all of them (> SCAN_MAX_ROWS={SCAN_MAX_ROWS}). Use float16, "
+                         f"keep_full, or force.")
+
+    others = [f for f in dataset.schema if f.name not in ("vector", "vector_f16", "vector_i8", "vector_scale")]
+    schema = pa.schema(vector_fields(fmt, keep_full) + others)
+    bytes_before = directory_bytes(dataset.uri)
+
+    def batches():
+        for batch in dataset.to_batches(batch_size=batch_rows):
+            vectors = decode(batch, current, full=True)
+            columns = encode(vectors, fmt)
+            if keep_full and fmt != "float32":
+                columns.update(encode(vectors, "float32"))
+            yield pa.RecordBatch.from_arrays([columns[f.name] if f.name in columns else batch.column(f.name)
+                                              for f in schema], schema=schema)
+
+    print(f"🗜️ Migrating {table_name} ({rows} rows) {current} -> {fmt}{' (+float32)' if keep_full else ''}...")
+    migrated = lance.write_dataset(pa.RecordBatchReader.from_batches(schema, batches()), dataset.uri,
+                                   schema=schema, mode="overwrite")
+    if cleanup:
+        migrated.cleanup_old_versions(older_than=timedelta(0))
+    report = {"rows": migrated.count_rows(), "bytes_before": bytes_before,
+              "bytes_after": directory_bytes(migrated.uri)}
+    print(f"✅ Migrated: {report['bytes_before'] / 1e6:.1f} MB -> {report['bytes_after'] / 1e6:.1f} MB")
+    return report
+
+
+def directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact frame-vector storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="convert a frame table in place")
+    migrate.add_argument("db_path")
+    migrate.add_argument("table_name")
+    migrate.add_argument("--format", choices=FORMATS, default="int8")
+    migrate.add_argument("--keep-full", action="store_true", help="keep float32 next to the codes (rescoring)")
+    migrate.add_argument("--keep-old-version", action="store_true", help="don't clean up the old Lance version")
+    migrate.add_argument("--force", action="store_true", help=f"int8-only above {SCAN_MAX_ROWS} rows (scanned, no ANN)")
+    args = parser.parse_args()
+    print(migrate_table(args.db_path, args.table_name, args.format, args.keep_full,
+                        cleanup=not args.keep_old_version, force=args.force))
+
+
+if __name__ == "__main__":
+    main()
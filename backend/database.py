@@ -1,119 +1,257 @@
 ####################....... database.py
 
 
+import base64
+import json
+import os
 import sqlite3
+import threading
 import modal
 from .common import app, vol
 
 DB_PATH = "/data/metadata.db"
 
+# Tuned once per connection (see connect())
+JOURNAL_MODE = os.environ.get("CHRONO_SQLITE_JOURNAL", "wal") # "delete" if the filesystem can't do WAL
+PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",   # safe with WAL, no fsync per commit
+    "PRAGMA busy_timeout = 5000",    # wait for a writer instead of failing with "database is locked"
+    "PRAGMA cache_size = -65536",    # 64 MB page cache
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+]
+
+# Versioned schema: MIGRATIONS[i] takes the DB from user_version i to i + 1.
+# Append only - never edit a migration that has shipped.
+def _add_status_column(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(videos)")]
+    if "status" not in columns:
+        conn.execute("ALTER TABLE videos ADD COLUMN status TEXT DEFAULT 'processing'")
+
+def _add_content_hash_column(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(videos)")]
+    if "content_hash" not in columns:
+        conn.execute("ALTER TABLE videos ADD COLUMN content_hash TEXT")
+
+MIGRATIONS = [
+    # 1. Base tables (what init_db used to create on every request)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            title TEXT,
+            tags TEXT,
+            visibility TEXT DEFAULT 'public',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'processing',
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        )
+        """,
+        _add_status_column, # DBs created before the status column existed
+    ],
+    # 2. Feed + profile listings: walk the index in order instead of scan + sort
+    [
+        "CREATE INDEX IF NOT EXISTS idx_videos_visibility_created ON videos (visibility, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_user_created ON videos (user_id, created_at DESC)",
+    ],
+    # 3. Keyset pages: (created_at, video_id) order + the listed columns -> index-only reads
+    [
+        "DROP INDEX IF EXISTS idx_videos_visibility_created",
+        "DROP INDEX IF EXISTS idx_videos_user_created",
+        "CREATE INDEX IF NOT EXISTS idx_videos_feed ON videos "
+        "(visibility, created_at DESC, video_id DESC, user_id, title)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_profile ON videos "
+        "(user_id, created_at DESC, video_id DESC, title, filename, visibility, status)",
+    ],
+    # 4. sha256 of the uploaded bytes: re-uploads clone an indexed copy instead of re-embedding
+    [
+        _add_content_hash_column,
+        "CREATE INDEX IF NOT EXISTS idx_videos_content_hash ON videos (content_hash, status)",
+    ],
+]
+
+# Only what the frontend renders (Home / Profile)
+FEED_COLUMNS = ("video_id", "user_id", "title", "created_at")
+PROFILE_COLUMNS = ("video_id", "title", "filename", "visibility", "status", "created_at")
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, video_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, video_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Opaque cursor -> (created_at, video_id). Raises ValueError if it was tampered with."""
+    try:
+        created_at, video_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return str(created_at), str(video_id)
+
+
+def list_videos(conn, columns, where, params=(), limit=PAGE_SIZE, cursor=None):
+    """
+    One keyset page, newest first: rows strictly after `cursor` in
+    (created_at DESC, video_id DESC) order. Cost is the page, not the offset.
+    Returns {"videos": [...], "next_cursor": str | None}.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    sql = f"SELECT {', '.join(columns)} FROM videos WHERE {where}"
+    if cursor:
+        sql += " AND (created_at, video_id) < (?, ?)"
+        params = tuple(params) + decode_cursor(cursor)
+    sql += " ORDER BY created_at DESC, video_id DESC LIMIT ?"
+    rows = [dict(row) for row in conn.execute(sql, tuple(params) + (limit + 1,)).fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["video_id"])
+    return {"videos": rows, "next_cursor": next_cursor}
+
+
+def feed_page(conn, limit=PAGE_SIZE, cursor=None):
+    return list_videos(conn, FEED_COLUMNS, "visibility = 'public'", (), limit, cursor)
+
+
+def user_videos_page(conn, user_id, limit=PAGE_SIZE, cursor=None):
+    return list_videos(conn, PROFILE_COLUMNS, "user_id = ?", (user_id,), limit, cursor)
+
+
+def find_indexed_copy(conn, content_hash, exclude_video_id=None):
+    """video_id of an indexed video with exactly these bytes, or None."""
+    if not content_hash:
+        return None
+    row = conn.execute("SELECT video_id FROM videos WHERE content_hash = ? AND status = 'completed' AND video_id != ? "
+                       "ORDER BY created_at LIMIT 1", (content_hash, exclude_video_id or "")).fetchone()
+    return row["video_id"] if row else None
+
+
+def connect(path=DB_PATH, journal_mode=JOURNAL_MODE):
+    """One long-lived connection (shared by the container's threads, serialized by Database's lock)."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    mode = conn.execute(f"PRAGMA journal_mode = {journal_mode}").fetchone()[0]
+    if mode.lower() != journal_mode.lower():
+        print(f"⚠️ SQLite journal_mode {journal_mode} not available, using {mode}")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def migrate(conn, target=None):
+    """Runs the migrations past PRAGMA user_version (each one in its own transaction)."""
+    target = len(MIGRATIONS) if target is None else target
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number in range(version, target):
+        with conn: # commit, or roll back the whole step
+            for step in MIGRATIONS[number]:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {number + 1}")
+        print(f"🗄️ Migrated metadata DB to v{number + 1}")
+    return max(version, target)
+
+
 @app.cls(volumes={"/data": vol})
 class Database:
-    
+
+    @modal.enter()
+    def open(self):
+        # 🔌 One connection per container, schema checked ONCE at startup
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        self.conn = connect(DB_PATH)
+        self.lock = threading.Lock()
+        migrate(self.conn)
+
+    @modal.exit()
+    def close(self):
+        # Fold the WAL back into metadata.db so the volume holds one consistent file
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+
     @modal.method()
     def init_db(self):
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id TEXT PRIMARY KEY,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS videos (
-                    video_id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    filename TEXT NOT NULL,
-                    title TEXT,
-                    tags TEXT,
-                    visibility TEXT DEFAULT 'public',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'processing',
-                    FOREIGN KEY(user_id) REFERENCES users(user_id)
-                )
-            """)
-            try:
-                conn.execute("ALTER TABLE videos ADD COLUMN status TEXT DEFAULT 'processing'")
-                conn.commit()
-            except sqlite3.OperationalError:
-                pass 
+        # Kept for old callers: the schema is migrated in open() now
+        with self.lock:
+            return migrate(self.conn)
 
     @modal.method()
     def create_user(self, user_id, username, password_hash):
         try:
-            with sqlite3.connect(DB_PATH) as conn:
-                conn.execute("INSERT INTO users (user_id, username, password_hash) VALUES (?, ?, ?)", 
+            with self.lock, self.conn as conn:
+                conn.execute("INSERT INTO users (user_id, username, password_hash) VALUES (?, ?, ?)",
                              (user_id, username, password_hash))
-                conn.commit()
             return True
         except sqlite3.IntegrityError:
             return False
 
     @modal.method()
     def get_user_by_username(self, username):
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
+        with self.lock:
             try:
-                cur = conn.execute("SELECT * FROM users WHERE username = ?", (username,))
+                cur = self.conn.execute("SELECT * FROM users WHERE username = ?", (username,))
                 row = cur.fetchone()
                 return dict(row) if row else None
             except: return None
 
     @modal.method()
-    def add_video(self, video_id, user_id, filename, title, tags, visibility):
-        with sqlite3.connect(DB_PATH) as conn:
+    def add_video(self, video_id, user_id, filename, title, tags, visibility, content_hash=None):
+        with self.lock, self.conn as conn:
             conn.execute("""
-                INSERT INTO videos (video_id, user_id, filename, title, tags, visibility, status) 
-                VALUES (?, ?, ?, ?, ?, ?, 'processing')
-            """, (video_id, user_id, filename, title, tags, visibility))
-            conn.commit()
+                INSERT INTO videos (video_id, user_id, filename, title, tags, visibility, status, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, 'processing', ?)
+            """, (video_id, user_id, filename, title, tags, visibility, content_hash))
+        # An indexed copy of the same bytes (the indexer clones its vectors)
+        with self.lock:
+            return find_indexed_copy(self.conn, content_hash, video_id)
 
     @modal.method()
     def update_processing_status(self, video_id, status):
-        with sqlite3.connect(DB_PATH) as conn:
+        with self.lock, self.conn as conn:
             conn.execute("UPDATE videos SET status = ? WHERE video_id = ?", (status, video_id))
-            conn.commit()
 
     @modal.method()
     def get_video_metadata(self, video_id):
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
+        with self.lock:
             try:
                 # 👇 FIX: Changed "SELECT status" to "SELECT *"
-                row = conn.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+                row = self.conn.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
                 return dict(row) if row else None
             except: return None
 
     @modal.method()
-    def get_public_feed(self):
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            try:
-                res = conn.execute("SELECT * FROM videos WHERE visibility = 'public' ORDER BY created_at DESC LIMIT 50")
-                return [dict(row) for row in res.fetchall()]
-            except: return []
+    def get_public_feed(self, limit=PAGE_SIZE, cursor=None):
+        # {"videos": [...], "next_cursor": ...} - see list_videos()
+        with self.lock:
+            return feed_page(self.conn, limit, cursor)
 
     @modal.method()
-    def get_user_videos(self, user_id):
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            try:
-                res = conn.execute("SELECT * FROM videos WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
-                return [dict(row) for row in res.fetchall()]
-            except: return []
-        
+    def get_user_videos(self, user_id, limit=PAGE_SIZE, cursor=None):
+        with self.lock:
+            return user_videos_page(self.conn, user_id, limit, cursor)
+
     @modal.method()
     def update_visibility(self, video_id, user_id, new_visibility):
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute("UPDATE videos SET visibility = ? WHERE video_id = ? AND user_id = ?", (new_visibility, video_id, user_id))
-            conn.commit()
-        return True
-        
+        with self.lock, self.conn as conn:
+            cur = conn.execute("UPDATE videos SET visibility = ? WHERE video_id = ? AND user_id = ?", (new_visibility, video_id, user_id))
+        return cur.rowcount > 0 # False = not found / not the owner
+
     @modal.method()
     def delete_video(self, video_id, user_id):
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute("DELETE FROM videos WHERE video_id = ? AND user_id = ?", (video_id, user_id))
-            conn.commit()
-        return True
\ No newline at end of file
+        with self.lock, self.conn as conn:
+            cur = conn.execute("DELETE FROM videos WHERE video_id = ? AND user_id = ?", (video_id, user_id))
+        return cur.rowcount > 0 # False = not found / not the owner
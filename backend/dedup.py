@@ -0,0 +1,196 @@
+####################....... dedup.py
+# Not embedding the same pixels twice:
+# - whole files: sha256 of the upload bytes (api.py) -> the frame rows of the indexed
+#   copy are cloned under the new video_id (index.clone_frame_rows), no SigLIP at all
+# - single frames (optional, CHRONO_FRAME_CACHE=1): perceptual key -> cached vector,
+#   so overlapping clips / static scenes only embed the frames nobody has seen
+import hashlib
+import os
+
+HASH_CHUNK = 1024 * 1024
+FRAME_CACHE = os.environ.get("CHRONO_FRAME_CACHE", "0") == "1"
+FRAME_CACHE_TABLE = "frame_cache"
+FRAME_CACHE_MAX_ROWS = int(os.environ.get("CHRONO_FRAME_CACHE_MAX_ROWS", "200000")) # ~0.9 GB of vectors
+DHASH_SIZE = 16 # 16x16 gradient bits: survives re-encoding, still sees layout changes
+EMBED_DIM = 1152
+
+
+def copy_hashing(src, dst, chunk=HASH_CHUNK):
+    """Copies file object src -> dst in one pass and returns the sha256 of the bytes."""
+    digest = hashlib.sha256()
+    while True:
+        block = src.read(chunk)
+        if not block:
+            break
+        digest.update(block)
+        dst.write(block)
+    return digest.hexdigest()
+
+
+def file_sha256(path, chunk=HASH_CHUNK):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_key(frame):
+    """
+    Perceptual key of an RGB frame: dHash (DHASH_SIZE^2 bits) + mean colour
+    (4 bits per channel, so flat slides of different colours don't collide).
+    Equal for re-encodes of the same picture; NOT a guarantee for fine text.
+    """
+    import cv2
+    import numpy as np
+
+    frame = np.asarray(frame)
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (DHASH_SIZE + 1, DHASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = np.packbits((small[:, 1:] > small[:, :-1]).reshape(-1))
+    colour = "".join(f"{int(c) >> 4:x}" for c in cv2.mean(frame)[:3])
+    return bits.tobytes().hex() + colour
+
+
+class FrameCache:
+    """
+    frame_key -> vector, in a LanceDB table next to the frame table (added to by the writer only).
+    - lookup() checks an in-memory key set first (loaded once per table version), so
+      the table is only queried for keys it holds, through a scalar index on `key`
+    - add() keeps the table under max_rows by evicting the oldest entries
+    """
+
+    def __init__(self, db_path, table_name=FRAME_CACHE_TABLE, max_rows=FRAME_CACHE_MAX_ROWS):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.max_rows = max_rows
+        self.keys = None    # every key in the table at `version`
+        self.version = None
+
+    def _table(self):
+        import lancedb
+        db = lancedb.connect(self.db_path)
+        return db.open_table(self.table_name) if self.table_name in db.table_names() else None
+
+    def _known_keys(self, tbl):
+        version = tbl.version
+        if self.keys is None or self.version != version:
+            self.keys = set(tbl.to_lance().to_table(columns=["key"]).column("key").to_pylist())
+            self.version = version
+        return self.keys
+
+    def lookup(self, keys):
+        import numpy as np
+
+        tbl = self._table()
+        if tbl is None or not keys:
+            return {}
+        keys = [key for key in keys if key in self._known_keys(tbl)]
+        if not keys:
+            return {}
+        listed = ", ".join(f"'{key}'" for key in keys)
+        found = tbl.to_lance().to_table(columns=["key", "vector"], filter=f"key IN ({listed})")
+        vectors = found.column("vector").combine_chunks().flatten().to_numpy().reshape(-1, EMBED_DIM)
+        return dict(zip(found.column("key").to_pylist(), np.asarray(vectors, dtype=np.float32)))
+
+    def add(self, entries):
+        """entries: {key: vector} not in the cache yet (see CachingEncoder.take_new)."""
+        import time
+        import lancedb
+        import numpy as np
+        import pyarrow as pa
+
+        if not entries:
+            return 0
+        vectors = np.asarray(list(entries.values()), dtype=np.float32).reshape(-1)
+        data = pa.table({"key": pa.array(list(entries)),
+                         "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors, type=pa.float32()), EMBED_DIM),
+                         "added_at": pa.array([time.time()] * len(entries), type=pa.float64())})
+        db = lancedb.connect(self.db_path)
+        tbl = self._table()
+        if tbl is not None and "added_at" not in tbl.schema.names:
+            print("🧹 Frame cache predates eviction (no added_at): starting it over")
+            db.drop_table(self.table_name)
+            tbl = None
+        if tbl is None:
+            tbl = db.create_table(self.table_name, data=data)
+            rebuild = True
+        else:
+            current = self.keys is not None and self.version == tbl.version
+            tbl.add(data)
+            if current: # our key set saw the version just before ours: extend it
+                self.keys.update(entries)
+                self.version = tbl.version
+            rebuild = self._evict(tbl)
+        try:
+            if rebuild:
+                tbl.create_scalar_index("key", replace=True)
+            else:
+                tbl.to_lance().optimize.optimize_indices() # new rows into the existing index
+        except Exception as e:
+            print(f"⚠️ Frame cache key index not updated: {e}")
+        return len(entries)
+
+    def _evict(self, tbl):
+        """Oldest entries out once the table passes max_rows (down to 80% of it). True if any went."""
+        import numpy as np
+
+        rows = tbl.count_rows()
+        if rows <= self.max_rows:
+            return False
+        added_at = tbl.to_lance().to_table(columns=["added_at"]).column("added_at").to_numpy()
+        drop = rows - int(self.max_rows * 0.8)
+        cutoff = np.partition(added_at, drop - 1)[drop - 1]
+        tbl.delete(f"added_at <= {float(cutoff)!r}")
+        tbl.compact_files() # deleted rows leave the files, not just the row count
+        self.keys = self.version = None
+        print(f"🧹 Frame cache: evicted {rows - tbl.count_rows()} of {rows} entries")
+        return True
+
+
+class CachingEncoder:
+    """
+    Wraps an encoder for index.embed_batches: frames whose key is cached (or was
+    already embedded by this container) skip the vision tower. The lookup runs
+    in preprocess_images, i.e. on embed_batches' worker thread, next to the GPU.
+    """
+
+    def __init__(self, encoder, cache):
+        self.encoder = encoder
+        self.cache = cache
+        self.new = {} # embedded here, not in the cache table yet
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.encoder, name)
+
+    def preprocess_images(self, images):
+        images = list(images)
+        keys = [frame_key(image) for image in images]
+        known = {key: self.new[key] for key in keys if key in self.new}
+        known.update(self.cache.lookup({key for key in keys if key not in known}))
+        first = {} # one forward pass per unknown key, even if the batch repeats it
+        for i, key in enumerate(keys):
+            if key not in known:
+                first.setdefault(key, i)
+        pixels = self.encoder.preprocess_images([images[i] for i in first.values()]) if first else None
+        return keys, known, list(first), pixels
+
+    def embed_preprocessed(self, prepared, precision="fp32"):
+        import numpy as np
+
+        keys, known, missing, pixels = prepared
+        if missing:
+            for key, vector in zip(missing, self.encoder.embed_preprocessed(pixels, precision)):
+                known[key] = self.new[key] = vector
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        return np.asarray([known[key] for key in keys], dtype=np.float32)
+
+    def take_new(self):
+        new, self.new = self.new, {}
+        return new
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
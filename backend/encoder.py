@@ -0,0 +1,379 @@
+####################....... encoder.py
+
+import os
+import threading
+from concurrent.futures import Future
+
+from .cache import QueryCache
+
+MODEL_ID = "google/siglip-so400m-patch14-384"
+EMBED_DIM = 1152
+
+# Query-vector cache (per container): size cap in MB, optional TTL in seconds
+QUERY_CACHE_MB = float(os.environ.get("CHRONO_QUERY_CACHE_MB", "32"))
+QUERY_CACHE_TTL = float(os.environ.get("CHRONO_QUERY_CACHE_TTL", "0")) or None
+
+# Micro-batching of concurrent query encodes (VideoSearcher)
+BATCH_WINDOW_MS = float(os.environ.get("CHRONO_BATCH_WINDOW_MS", "5"))
+BATCH_MAX = int(os.environ.get("CHRONO_BATCH_MAX", "64"))
+
+
+# precision name -> torch dtype name used under autocast ("fp32" = no autocast)
+PRECISIONS = {"fp32": None, "fp16": "float16", "bf16": "bfloat16"}
+
+# CPU query encoders (SiglipTextEncoder): text tower only, no vision weights
+TEXT_BACKENDS = ("fp32", "int8", "onnx", "onnx-int8")
+TEXT_ONNX_DIR = os.environ.get("CHRONO_TEXT_ONNX_DIR", "/data/models") # exported graphs, shared via the volume
+TEXT_MAX_LENGTH = 64 # SigLIP's text tower is trained on max_length padding to 64 tokens
+TEXT_MIN_COSINE = 0.99 # agreement with the full model's get_text_features (bench.py query_encoder)
+
+
+class QueryCaching:
+    """
+    encode_query() for every encoder: same query text (after normalize_query)
+    -> cached vector, no forward pass. Subclasses set model_id + encode_text().
+    """
+
+    def __init__(self):
+        self.query_cache = QueryCache(int(QUERY_CACHE_MB * 1024 * 1024), QUERY_CACHE_TTL)
+
+    def encode_query(self, query):
+        return self.query_cache.get_or_encode(self.model_id, query, lambda text: self.encode_text([text])[0])
+
+
+class SiglipEncoder(QueryCaching):
+    """
+    Holds SigLIP + its processor for the lifetime of a container.
+    - Loaded lazily on first use (or eagerly via load())
+    - Returns L2-normalized float32 NumPy vectors
+    - Weights stay fp32; fp16/bf16 is applied per call with autocast, so one
+      resident model serves both full-precision and mixed-precision callers
+    """
+
+    def __init__(self, model_id=MODEL_ID, device=None):
+        self.model_id = model_id
+        self.device = device
+        self.model = None
+        self.processor = None
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def load(self):
+        if self.model is not None:
+            return self
+        with self._lock:
+            if self.model is not None:
+                return self
+            import torch
+            from transformers import AutoProcessor, AutoModel
+
+            self.device = self.device or ("cuda" if torch.cuda.is_available() else "cpu")
+            print(f"🚀 Loading Model on {self.device.upper()}...")
+            model = AutoModel.from_pretrained(self.model_id).to(self.device)
+            model.eval()
+            self.processor = AutoProcessor.from_pretrained(self.model_id)
+            self.model = model
+        return self
+
+    def encode_text(self, texts):
+        import torch
+        self.load()
+        with torch.no_grad():
+            inputs = self.processor(text=list(texts), return_tensors="pt", padding="max_length").to(self.device)
+            outputs = self.model.get_text_features(**inputs)
+            # Normalize (CRITICAL: cosine search assumes unit vectors)
+            outputs = outputs / outputs.norm(p=2, dim=-1, keepdim=True)
+            return outputs.float().cpu().numpy()
+
+    def encode_images(self, images, precision="fp32"):
+        return self.embed_preprocessed(self.preprocess_images(images), precision)
+
+    def preprocess_images(self, images):
+        # CPU-only half of encode_images (safe to run in a worker thread)
+        self.load()
+        pixel_values = self.processor(images=list(images), return_tensors="pt")["pixel_values"]
+        return pixel_values.pin_memory() if self.device == "cuda" else pixel_values
+
+    def embed_preprocessed(self, pixel_values, precision="fp32"):
+        import torch
+        self.load()
+        dtype = PRECISIONS[precision]
+        with torch.no_grad():
+            pixel_values = pixel_values.to(self.device, non_blocking=True)
+            if dtype is None:
+                outputs = self.model.get_image_features(pixel_values=pixel_values)
+            else:
+                device_type = "cuda" if self.device == "cuda" else "cpu"
+                with torch.autocast(device_type=device_type, dtype=getattr(torch, dtype)):
+                    outputs = self.model.get_image_features(pixel_values=pixel_values)
+            # Normalize in fp32 so mixed precision only affects the forward pass
+            outputs = outputs.float()
+            outputs = outputs / outputs.norm(p=2, dim=-1, keepdim=True)
+            return outputs.cpu().numpy()
+
+
+class SiglipTextEncoder(QueryCaching):
+    """
+    Query-only SigLIP for CPU search containers: loads the text tower
+    (SiglipTextModel + tokenizer), not the 400M-parameter vision tower.
+    backend:
+    - fp32:      PyTorch on CPU (same math as get_text_features)
+    - int8:      PyTorch dynamic int8 quantization of every nn.Linear
+    - onnx:      ONNX Runtime graph, exported once to TEXT_ONNX_DIR
+    - onnx-int8: the same graph with int8 weights (onnxruntime quantize_dynamic)
+    Vectors agree with SiglipEncoder.encode_text within TEXT_MIN_COSINE (checked by
+    `python -m backend.bench query_encoder`). It has no image methods at all, so
+    indexing with it fails straight away (AttributeError on preprocess_images).
+    """
+
+    def __init__(self, model_id=MODEL_ID, backend="int8", onnx_dir=TEXT_ONNX_DIR):
+        if backend not in TEXT_BACKENDS:
+            raise ValueError(f"Unknown text backend: {backend}")
+        self.model_id = model_id
+        self.backend = backend
+        self.onnx_dir = onnx_dir
+        self.device = "cpu"
+        self.model = None     # torch module (fp32 / int8)
+        self.session = None   # onnxruntime.InferenceSession (onnx / onnx-int8)
+        self.tokenizer = None
+        self.exported = False # True if load() wrote a new ONNX file (caller commits the volume)
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def load(self):
+        if self.model is not None or self.session is not None:
+            return self
+        with self._lock:
+            if self.model is not None or self.session is not None:
+                return self
+            from transformers import AutoTokenizer
+
+            print(f"🚀 Loading SigLIP text tower on CPU ({self.backend})...")
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+            if self.backend.startswith("onnx"):
+                import onnxruntime as ort
+                path = self.onnx_path()
+                if not os.path.exists(path):
+                    export_text_onnx(self.model_id, path, quantize=self.backend == "onnx-int8")
+                    self.exported = True
+                self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+            else:
+                self.model = _load_text_tower(self.model_id, quantize=self.backend == "int8")
+        return self
+
+    def onnx_path(self):
+        return os.path.join(self.onnx_dir, f"{self.model_id.replace('/', '--')}-text-{self.backend}.onnx")
+
+    def _tokenize(self, texts):
+        return self.tokenizer(list(texts), padding="max_length", max_length=TEXT_MAX_LENGTH, truncation=True,
+                              return_tensors="np")["input_ids"]
+
+    def encode_text(self, texts):
+        import numpy as np
+        self.load()
+        input_ids = self._tokenize(texts).astype(np.int64)
+        if self.session is not None:
+            outputs = self.session.run(["text_embeds"], {"input_ids": input_ids})[0]
+        else:
+            import torch
+            with torch.no_grad():
+                outputs = self.model(input_ids=torch.from_numpy(input_ids)).pooler_output.float().numpy()
+        # Normalize (CRITICAL: cosine search assumes unit vectors)
+        return _normalize(np.asarray(outputs, dtype="float32"))
+
+
+def _load_text_tower(model_id, quantize=False):
+    import torch
+    from transformers import SiglipTextModel
+
+    # Reads only the text_model.* weights of the full checkpoint
+    model = SiglipTextModel.from_pretrained(model_id, torch_dtype=torch.float32)
+    model.eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def export_text_onnx(model_id, path, quantize=False):
+    """input_ids (batch, TEXT_MAX_LENGTH) -> text_embeds (batch, 1152), unnormalized like get_text_features."""
+    import torch
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids):
+            return self.model(input_ids=input_ids).pooler_output
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fp32_path = tmp_path + ".fp32" if quantize else tmp_path
+    print(f"📦 Exporting SigLIP text tower to ONNX ({'int8' if quantize else 'fp32'})...")
+    dummy = torch.zeros((1, TEXT_MAX_LENGTH), dtype=torch.int64)
+    with torch.no_grad():
+        torch.onnx.export(TextTower(_load_text_tower(model_id)), (dummy,), fp32_path, input_names=["input_ids"],
+                          output_names=["text_embeds"], opset_version=17,
+                          dynamic_axes={"input_ids": {0: "batch"}, "text_embeds": {0: "batch"}})
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    os.replace(tmp_path, path) # concurrent exporters: last one wins, readers never see half a file
+    return path
+
+
+class StubEncoder(QueryCaching):
+    """
+    Deterministic CPU stand-in for SigLIP (no torch, no weights).
+    - Text: seeded from a hash of the string
+    - Images: tiny thumbnail projected through a fixed random matrix
+    Same input -> same vector, so search/index can be exercised locally.
+    """
+
+    def __init__(self, model_id="stub-siglip", dim=EMBED_DIM):
+        import numpy as np
+        self.model_id = model_id
+        self.dim = dim
+        self._projection = np.random.default_rng(0).standard_normal((8 * 8 * 3, dim)).astype("float32")
+        super().__init__()
+
+    def load(self):
+        return self
+
+    def encode_text(self, texts):
+        import hashlib
+        import numpy as np
+        rows = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            rows.append(np.random.default_rng(seed).standard_normal(self.dim))
+        return _normalize(np.asarray(rows, dtype="float32"))
+
+    def encode_images(self, images, precision="fp32"):
+        return self.embed_preprocessed(self.preprocess_images(images), precision)
+
+    def preprocess_images(self, images):
+        import numpy as np
+        thumbs = []
+        for image in images:
+            arr = np.asarray(image, dtype="float32")
+            if arr.ndim == 2:
+                arr = np.repeat(arr[:, :, None], 3, axis=2)
+            ys = np.linspace(0, arr.shape[0] - 1, 8).astype(int)
+            xs = np.linspace(0, arr.shape[1] - 1, 8).astype(int)
+            thumbs.append(arr[ys][:, xs, :3].reshape(-1) / 255.0)
+        return np.asarray(thumbs, dtype="float32").reshape(len(thumbs), -1)
+
+    def embed_preprocessed(self, thumbs, precision="fp32"):
+        import numpy as np
+        if precision != "fp32":
+            # Mimic reduced precision so tolerance checks mean something locally
+            thumbs = thumbs.astype("float16").astype("float32")
+        return _normalize(np.asarray(thumbs @ self._projection, dtype="float32"))
+
+
+class BatchingEncoder:
+    """
+    Wraps an encoder so CONCURRENT encode_query() calls share forward passes.
+    - The first query opens a window of `window_ms`; everything that arrives
+      before it closes (up to max_batch) is encoded in one batch
+    - Identical in-flight queries are coalesced into a single encode
+    - Vectors still land in the encoder's QueryCache
+    Everything else (encode_images, query_cache, ...) passes straight through.
+    """
+
+    def __init__(self, encoder, window_ms=BATCH_WINDOW_MS, max_batch=BATCH_MAX):
+        self.encoder = encoder
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = []   # texts waiting for the next batch
+        self._inflight = {}  # text -> Future (queued or being encoded)
+        self._cond = threading.Condition()
+        self._worker = None
+        self.batches = self.coalesced = 0
+
+    def __getattr__(self, name):
+        return getattr(self.encoder, name)
+
+    def encode_query(self, query):
+        return self.encoder.query_cache.get_or_encode(self.encoder.model_id, query, self._encode_batched)
+
+    def _encode_batched(self, text):
+        with self._cond:
+            future = self._inflight.get(text)
+            if future is None:
+                future = Future()
+                self._inflight[text] = future
+                self._pending.append(text)
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                    self._worker.start()
+                self._cond.notify()
+            else:
+                self.coalesced += 1
+        return future.result()
+
+    def _run(self):
+        import time
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                futures = [self._inflight[text] for text in batch]
+                self.batches += 1
+
+            try:
+                vectors = self.encoder.encode_text(batch)
+                results = [(future, vector.copy()) for future, vector in zip(futures, vectors)]
+                error = None
+            except Exception as e:
+                results, error = [], e
+
+            with self._cond:
+                for text in batch:
+                    self._inflight.pop(text, None)
+            if error is not None:
+                for future in futures:
+                    future.set_exception(error)
+            for future, vector in results:
+                future.set_result(vector)
+
+    def stats(self):
+        return {"batches": self.batches, "coalesced": self.coalesced,
+                "window_ms": self.window * 1000, "max_batch": self.max_batch}
+
+
+def _normalize(vectors):
+    import numpy as np
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# One encoder per container (per kind). CHRONO_ENCODER=stub swaps in the CPU stub,
+# text-int8 / text-onnx / ... the CPU query encoder (SiglipTextEncoder).
+_ENCODERS = {}
+_ENCODERS_LOCK = threading.Lock()
+
+
+def get_encoder(kind=None):
+    kind = kind or os.environ.get("CHRONO_ENCODER", "siglip")
+    with _ENCODERS_LOCK:
+        if kind not in _ENCODERS:
+            if kind == "stub":
+                _ENCODERS[kind] = StubEncoder()
+            elif kind == "siglip":
+                _ENCODERS[kind] = SiglipEncoder()
+            elif kind.startswith("text-") and kind[len("text-"):] in TEXT_BACKENDS:
+                _ENCODERS[kind] = SiglipTextEncoder(backend=kind[len("text-"):])
+            else:
+                raise ValueError(f"Unknown encoder: {kind}")
+        return _ENCODERS[kind]
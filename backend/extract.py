@@ -1,22 +1,20 @@
 ####################.......extract.py
-def extract_frames(video_path, output_folder):
+def iter_frames(video_path, start=0.0, end=None):
     """
-    Exact logic provided by user:
+    Exact logic provided by user, as a generator:
     - 2 Frames Per Second (Fixed Math)
     - Resize to width 640 (Maintain Aspect Ratio)
+    Yields (timestamp_sec, RGB ndarray). Nothing touches the disk.
+    start/end (seconds on the same 0.5 s grid) decode just that range: it seeks
+    to the first kept frame, so the timestamps are those of a full pass.
     """
     import cv2
-    import os
-    # 1. Create output folder if missing
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder, exist_ok=True)
-        print(f"Created folder: {output_folder}")
-    
-    # 2. Open Video
+
+    # 1. Open Video
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print("Error: Could not open video.")
-        return 0
+        return
 
     original_fps = cap.get(cv2.CAP_PROP_FPS) or 24
     print(f"Processing video at {original_fps} FPS...")
@@ -27,33 +25,348 @@ def extract_frames(video_path, output_folder):
 
     frame_count = 0
     saved_count = 0
+    if start:
+        saved_count = int(round(start * 2))
+        frame_count = saved_count * capture_interval
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+    stop_count = int(round(end * 2)) if end is not None else None
+
+    try:
+        while True:
+            if stop_count is not None and saved_count >= stop_count:
+                break # End of the range
+            success, frame = cap.read()
+            if not success:
+                break # End of video
+
+            # Only keep every Nth frame (e.g., every 15th frame for 30fps video)
+            if frame_count % int(capture_interval) == 0:
+
+                current_time_sec = saved_count * 0.5
+
+                # --- THE 4K FIX START ---
+                height, width = frame.shape[:2]
+                new_width = 640
+                new_height = int(height * (new_width / width)) # Keep aspect ratio
+                resized_frame = cv2.resize(frame, (new_width, new_height))
+                # --- THE 4K FIX END ---
+
+                # OpenCV decodes BGR, SigLIP/PIL expect RGB
+                yield current_time_sec, cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB)
+                saved_count += 1
+
+            frame_count += 1
+    finally:
+        cap.release()
+
+
+def _probe(video_path):
+    """(width, height, start_time) of the first video stream, as displayed."""
+    import json
+    import subprocess
+
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height:stream_side_data=rotation:format=start_time",
+         "-of", "json", video_path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    info = json.loads(out)
+    stream = info["streams"][0]
+    width, height = int(stream["width"]), int(stream["height"])
+    rotation = next((int(d["rotation"]) for d in stream.get("side_data_list", []) if "rotation" in d), 0)
+    if abs(rotation) % 180 == 90:
+        width, height = height, width # ffmpeg autorotates, so output is transposed
+    start_time = float(info.get("format", {}).get("start_time") or 0.0)
+    return width, height, start_time
+
+
+def iter_frames_ffmpeg(video_path, start=0.0, end=None, sample_fps=2, new_width=640):
+    """
+    Same contract as iter_frames(), but ffmpeg does the work:
+    - select keeps the first frame of every 1/sample_fps bucket (by real PTS)
+    - scale to new_width in C, raw RGB24 piped straight into NumPy
+    - timestamps come from showinfo's pts_time, so no drift on 29.97/59.94 fps
+    - start/end: input seek + -copyts, so buckets and timestamps stay those of a full pass
+    Timestamps are zero-based (seconds since the container's start_time). A full pass
+    gets that from ffmpeg itself (without -copyts input timestamps are shifted by
+    -start_time); under -copyts they stay absolute, so start_time is subtracted in the
+    select expression AND from pts_time. Either way the buckets are the same.
+    (Input -ss is relative to start_time already; the output -to is absolute and
+    lets a frame or two through, so `end` is also enforced here.)
+    """
+    import queue
+    import re
+    import subprocess
+    import threading
+    import numpy as np
+
+    try:
+        width, height, start_time = _probe(video_path)
+    except Exception as e:
+        print(f"Error: Could not probe video ({e}).")
+        return
 
-    while True:
-        success, frame = cap.read()
-        if not success:
-            break # End of video
-        
-        # Only save every Nth frame (e.g., every 15th frame for 30fps video)
-        if frame_count % int(capture_interval) == 0:
-            
-            current_time_sec = saved_count * 0.5
-
-            # --- THE 4K FIX START ---
-            height, width = frame.shape[:2]
-            new_width = 640
-            new_height = int(height * (new_width / width)) # Keep aspect ratio
-            resized_frame = cv2.resize(frame, (new_width, new_height))
-            # --- THE 4K FIX END ---
-
-            # Save the file (Double format: frame_1.50.jpg)
-            filename = f"frame_{current_time_sec:.2f}.jpg"
-            filepath = os.path.join(output_folder, filename)
-            cv2.imwrite(filepath, resized_frame)
-            
+    new_height = int(height * (new_width / width)) // 2 * 2 # Keep aspect ratio (even for swscale)
+    frame_bytes = new_width * new_height * 3
+    print(f"Processing video with ffmpeg ({width}x{height} -> {new_width}x{new_height}, {sample_fps} fps)...")
+
+    seek = []
+    if start or end is not None:
+        seek = ["-ss", f"{start:.6f}", "-copyts"]
+        if end is not None:
+            seek += ["-to", f"{start_time + end:.6f}"]
+    offset = start_time if seek else 0.0 # -copyts keeps absolute timestamps
+    vf = (f"select='isnan(prev_selected_t)"
+          f"+gt(floor((t-{offset:.6f})*{sample_fps}),floor((prev_selected_t-{offset:.6f})*{sample_fps}))',"
+          f"scale={new_width}:{new_height},showinfo")
+    proc = subprocess.Popen(
+        ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "info", *seek[:3], "-i", video_path, *seek[3:],
+         "-an", "-vf", vf, "-fps_mode", "vfr", "-pix_fmt", "rgb24", "-f", "rawvideo", "pipe:1"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=frame_bytes,
+    )
+
+    # showinfo logs one line per frame on stderr; read it on the side
+    pts_times = queue.Queue()
+    pts_pattern = re.compile(rb"pts_time:\s*(-?[\d.]+)")
+
+    def read_pts():
+        for line in proc.stderr:
+            match = pts_pattern.search(line)
+            if match:
+                pts_times.put(float(match.group(1)))
+
+    reader = threading.Thread(target=read_pts, name="ffmpeg-pts", daemon=True)
+    reader.start()
+
+    saved_count = 0
+    try:
+        while True:
+            raw = proc.stdout.read(frame_bytes)
+            if len(raw) < frame_bytes:
+                break # End of video
+            try:
+                pts_time = pts_times.get(timeout=10)
+            except queue.Empty:
+                pts_time = offset + start + saved_count / sample_fps
+            frame = np.frombuffer(raw, dtype=np.uint8).reshape(new_height, new_width, 3)
+            timestamp = round(pts_time - offset, 3)
+            if end is not None and timestamp >= end:
+                break # the next range starts here
+            yield timestamp, frame
             saved_count += 1
+    finally:
+        proc.kill()
+        proc.wait()
+        reader.join(timeout=5)
+
+
+# Per-job choice of decoder (VideoIndexer.process_video(extractor=...))
+EXTRACTORS = {
+    "opencv": iter_frames,
+    "ffmpeg": iter_frames_ffmpeg,
+}
+
+# --- Sharded decoding (long videos): time ranges decoded by a process pool ---
+SHARD_MIN_SECONDS = 600.0 # shorter videos aren't worth the pool start-up
+CHUNK_SECONDS = 30.0      # ~60 decoded 640px frames (~40 MB) per chunk in flight
+
+
+def video_seconds(video_path, extractor="opencv"):
+    """Rough length from the container (opencv: on iter_frames' 0.5 s grid)."""
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 24
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+    finally:
+        cap.release()
+    if extractor == "opencv":
+        return frames / max(1, int(fps / 2)) * 0.5
+    return frames / fps
+
+
+def plan_chunks(seconds, chunk_seconds=CHUNK_SECONDS):
+    """[(start, end)] covering [0, seconds); the last one is open-ended (end=None)."""
+    starts = [i * chunk_seconds for i in range(max(1, int(-(-seconds // chunk_seconds))))]
+    return [(start, starts[i + 1] if i + 1 < len(starts) else None) for i, start in enumerate(starts)]
+
+
+def _decode_chunk(extractor, video_path, start, end):
+    # Runs in a pool process: the whole chunk comes back at once (bounded by CHUNK_SECONDS)
+    return list(EXTRACTORS[extractor](video_path, start, end))
+
+
+def iter_frames_sharded(video_path, workers=4, extractor="opencv", chunk_seconds=CHUNK_SECONDS):
+    """
+    Same contract as iter_frames(): `workers` processes decode consecutive
+    chunks in parallel, and the frames come out IN ORDER (so adaptive sampling,
+    thumbnails and embedding see exactly the stream of a single pass).
+    At most 2 * workers chunks are decoded ahead. A frame that two chunks
+    both return (boundary rounding) is yielded once. Holds for any container
+    start_time: chunks and a single pass share zero-based timestamps and
+    sampling buckets (see iter_frames_ffmpeg).
+    """
+    import multiprocessing
+    from collections import deque
+
+    chunks = iter(plan_chunks(video_seconds(video_path, extractor), chunk_seconds))
+    # spawn, not fork: the parent may hold CUDA + threads
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        in_flight = deque()
+        def submit():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                in_flight.append(pool.apply_async(_decode_chunk, (extractor, video_path, *chunk)))
+
+        for _ in range(2 * workers):
+            submit()
+        last = None
+        while in_flight:
+            frames = in_flight.popleft().get()
+            submit()
+            for timestamp, frame in frames:
+                if last is not None and timestamp <= last:
+                    continue
+                last = timestamp
+                yield timestamp, frame
+
+
+def _signature(frame):
+    """
+    32x18 RGB thumbnail (0-1) by strided sampling. Cheap enough for every frame.
+    Kept in colour: two slides with the same brightness but different colours
+    look identical in grayscale.
+    """
+    import numpy as np
+    ys = np.linspace(0, frame.shape[0] - 1, 18).astype(int)
+    xs = np.linspace(0, frame.shape[1] - 1, 32).astype(int)
+    return frame[ys][:, xs].astype(np.float32) / 255.0
+
+
+def adaptive_sample(frames, scene_threshold=0.08, min_interval=0.5, max_interval=10.0, base_interval=0.5):
+    """
+    Scene-change-aware thinning of a fixed-rate frame stream.
+    - Emits a frame when its mean abs difference from the last EMITTED frame
+      crosses scene_threshold (and min_interval has passed), or max_interval passes
+    - Yields (timestamp, frame, span_end): each emitted frame stands for
+      [timestamp, span_end), i.e. up to the next emitted frame / end of video
+    """
+    import numpy as np
+
+    held = None # (timestamp, frame, signature) waiting for its span_end
+    last_seen = None
+    for timestamp, frame in frames:
+        last_seen = timestamp
+        signature = _signature(frame)
+        if held is not None:
+            elapsed = timestamp - held[0]
+            changed = float(np.abs(signature - held[2]).mean()) >= scene_threshold
+            if not ((changed and elapsed >= min_interval) or elapsed >= max_interval):
+                continue
+            yield held[0], held[1], timestamp
+        held = (timestamp, frame, signature)
+
+    if held is not None:
+        yield held[0], held[1], last_seen + base_interval
 
-        frame_count += 1
 
-    cap.release()
+def sample_frames(video_path, extractor="opencv", sampling="fixed", tap=None, workers=1, **adaptive):
+    """
+    Frame source for a job:
+    - sampling="fixed":    every 2 fps frame, (timestamp, frame)
+    - sampling="adaptive": scene changes only, (timestamp, frame, span_end)
+    - tap(frames) sees every DECODED frame before sampling (e.g. thumbs.ThumbnailCollector.tap)
+    - workers > 1: videos longer than SHARD_MIN_SECONDS decode in parallel chunks (same frames)
+    """
+    if workers > 1 and video_seconds(video_path, extractor) >= SHARD_MIN_SECONDS:
+        frames = iter_frames_sharded(video_path, workers, extractor)
+    else:
+        frames = EXTRACTORS[extractor](video_path)
+    if tap is not None:
+        frames = tap(frames)
+    if sampling == "adaptive":
+        return adaptive_sample(frames, **adaptive)
+    if sampling != "fixed":
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+    return frames
+
+
+def extract_frames(video_path, output_folder, extractor="opencv", sampling="fixed", tap=None, workers=1, **adaptive):
+    """
+    Writes every frame from sample_frames() as a JPEG (frame_1.50.jpg, or
+    frame_1.50_12.00.jpg when adaptive sampling records a span end).
+    Kept for the non-streaming path; stream_frames() skips the disk entirely.
+    """
+    import cv2
+    import os
+    # 1. Create output folder if missing
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder, exist_ok=True)
+        print(f"Created folder: {output_folder}")
+
+    saved_count = 0
+    for current_time_sec, frame, *span in sample_frames(video_path, extractor, sampling, tap, workers, **adaptive):
+        # Save the file (Double format: frame_1.50.jpg)
+        filename = f"frame_{current_time_sec:.2f}.jpg"
+        if span:
+            filename = f"frame_{current_time_sec:.2f}_{span[0]:.2f}.jpg"
+        filepath = os.path.join(output_folder, filename)
+        cv2.imwrite(filepath, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        saved_count += 1
+
     print(f"🎉 Done! Extracted {saved_count} frames.")
-    return saved_count
\ No newline at end of file
+    return saved_count
+
+
+def stream_frames(video_path, queue_size=64, extractor="opencv", sampling="fixed", tap=None, workers=1,
+                  **adaptive):
+    """
+    Runs sample_frames() on a producer thread and yields its frames through a
+    bounded queue, so decoding overlaps embedding and at most `queue_size`
+    decoded frames are held in memory. Decode errors are re-raised here.
+    """
+    import queue
+    import threading
+
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up if the consumer went away (otherwise we'd block forever)
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        count = 0
+        try:
+            for frame in sample_frames(video_path, extractor, sampling, tap, workers, **adaptive):
+                if not put(frame):
+                    return
+                count += 1
+            print(f"🎉 Done! Streamed {count} frames.")
+            put(done)
+        except Exception as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, name="frame-producer", daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = frames.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join(timeout=5)
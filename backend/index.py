@@ -1,110 +1,352 @@
 ####################....... index.py
 
-def index_frames(frames_folder, db_path, video_id, table_name, title="", tags=""):
-    import os
-    import lancedb
-    import torch
-    import pyarrow as pa
-    from PIL import Image
-    from transformers import AutoProcessor, AutoModel
-    import shutil
+def embed_batches(encoder, items, load, batch_size=32, precision="fp32"):
     """
-    1. Indexes Visual Frames (Your Logic)
-    2. Indexes Title & Tags (New Logic)
+    Yields (items_batch, vectors) for `items`, `batch_size` at a time.
+    - `load(item)` turns an item into an image (runs on the worker thread)
+    - A single preprocessing worker prepares batch N+1 while batch N runs on the device
     """
-    # --- 1. LOAD THE BRAIN ---
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"🚀 Loading Model on {device.upper()}...")
+    from concurrent.futures import ThreadPoolExecutor
+    from itertools import islice
 
-    model = AutoModel.from_pretrained("google/siglip-so400m-patch14-384").to(device)
-    processor = AutoProcessor.from_pretrained("google/siglip-so400m-patch14-384")
+    items = iter(items)
 
-    # --- 2. PREPARE THE DATABASE ---
-    print(f"📂 Setting up LanceDB at {db_path}...")
-    db = lancedb.connect(db_path)
+    def prepare():
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return batch, None
+        return batch, encoder.preprocess_images([load(item) for item in batch])
+
+    with ThreadPoolExecutor(max_workers=1) as worker:
+        pending = worker.submit(prepare)
+        while True:
+            batch, pixels = pending.result()
+            if not batch:
+                break
+            pending = worker.submit(prepare)
+            yield batch, encoder.embed_preprocessed(pixels, precision)
+
+
+def frame_files(frames_folder):
+    """
+    [(timestamp, path, span_end)] for frame_1.50.jpg / frame_1.50_12.00.jpg
+    files, in time order (span_end is None when the name has none).
+    Parses the full float (the old int(...) parse turned 1.50 into 1).
+    """
+    import os
+    frames = []
+    for name in os.listdir(frames_folder):
+        if name.startswith("frame_") and name.endswith(".jpg"):
+            times = name[len("frame_"):-len(".jpg")].split("_")
+            span_end = float(times[1]) if len(times) > 1 else None
+            frames.append((float(times[0]), os.path.join(frames_folder, name), span_end))
+    frames.sort(key=lambda f: f[0])
+    return frames
+
+
+META_TABLE = "video_metadata_index"
+
+
+def open_tables(db, table_name, storage=None):
+    """
+    Opens (or creates) the frame table and the metadata table.
+    storage = vector format for a NEW frame table (see compact.py); default float32.
+    """
+    import pyarrow as pa
+    from .compact import DEFAULT_FORMAT, vector_fields
 
     # A. FRAME TABLE (For "Deep Search")
-    schema_frames = pa.schema([
-        pa.field("vector", pa.list_(pa.float32(), 1152)),
+    schema_frames = pa.schema(vector_fields(storage or DEFAULT_FORMAT) + [
         pa.field("video_id", pa.string()),
         pa.field("timestamp", pa.float64()),
         pa.field("metadata", pa.string()),
+        pa.field("span_end", pa.float64()), # row covers [timestamp, span_end)
     ])
     try: tbl_frames = db.open_table(table_name)
     except: tbl_frames = db.create_table(table_name, schema=schema_frames)
 
     # B. METADATA TABLE (For "Global Search") - NEW 🌟
-    metadata_table_name = "video_metadata_index"
     schema_meta = pa.schema([
         pa.field("vector", pa.list_(pa.float32(), 1152)),
         pa.field("video_id", pa.string()),
         pa.field("title", pa.string()),
         pa.field("tags", pa.string()),
     ])
-    try: tbl_meta = db.open_table(metadata_table_name)
-    except: tbl_meta = db.create_table(metadata_table_name, schema=schema_meta)
+    try: tbl_meta = db.open_table(META_TABLE)
+    except: tbl_meta = db.create_table(META_TABLE, schema=schema_meta)
+
+    return tbl_frames, tbl_meta
+
+
+SEGMENT_SECONDS = 20.0 # coarse retrieval unit for search_global mode="segments"
+
+
+def segment_table_name(table_name):
+    return f"{table_name}_segments"
+
+
+def open_segment_table(db, table_name):
+    """Opens (or creates) the segment table that sits next to `table_name`."""
+    import pyarrow as pa
+
+    name = segment_table_name(table_name)
+    schema_segments = pa.schema([
+        pa.field("vector", pa.list_(pa.float32(), 1152)),
+        pa.field("video_id", pa.string()),
+        pa.field("start", pa.float64()),
+        pa.field("end", pa.float64()),
+        pa.field("frames", pa.int32()),
+    ])
+    try: return db.open_table(name)
+    except: return db.create_table(name, schema=schema_segments)
+
+
+def segment_rows(frame_rows, window=SEGMENT_SECONDS):
+    """
+    Mean-pools consecutive frames into ~`window`-second segments (renormalized).
+    Segments only ever break BETWEEN rows, so with adaptive sampling (one row
+    per scene) they follow scene boundaries instead of a fixed grid.
+    """
+    import numpy as np
+
+    segments, current = [], []
+
+    def close():
+        mean = np.asarray([r["vector"] for r in current], dtype=np.float32).mean(axis=0)
+        mean /= max(float(np.linalg.norm(mean)), 1e-12)
+        segments.append({
+            "vector": mean.tolist(),
+            "video_id": current[0]["video_id"],
+            "start": current[0]["timestamp"],
+            "end": current[-1].get("span_end") or current[-1]["timestamp"],
+            "frames": len(current),
+        })
+
+    for row in sorted(frame_rows, key=lambda r: r["timestamp"]):
+        if current and row["timestamp"] - current[0]["timestamp"] >= window:
+            close()
+            current = []
+        current.append(row)
+    if current:
+        close()
+    return segments
+
+
+def embed_video(frames_folder, video_id, title="", tags="", encoder=None,
+                batch_size=32, precision="fp32", frames=None, sample_interval=0.5):
+    import time
+    from PIL import Image
+    from .encoder import get_encoder
+    """
+    1. Embeds Visual Frames (Your Logic)
+    2. Embeds Title & Tags (New Logic)
+    Touches no database: returns (frame_rows, meta_row, stats) for write_video().
+
+    Frames are embedded `batch_size` at a time. precision="fp32" matches the old
+    one-frame-at-a-time vectors to ~1e-5 per component (batching only changes
+    kernel reduction order). "fp16"/"bf16" run the vision tower under autocast;
+    expect cosine >= 0.999 against fp32 (check with `python -m backend.bench embedding`).
+    stats is {"frames", "seconds", "fps"} for the frame pass.
+
+    Pass `frames` (an iterable of (timestamp, RGB ndarray[, span_end]), e.g.
+    extract.stream_frames) to embed straight from the decoder instead of
+    reading JPEGs from `frames_folder`. Without a span_end a row covers
+    `sample_interval` seconds.
+    """
+    # --- 1. THE BRAIN (resident per container, see encoder.py) ---
+    encoder = encoder or get_encoder()
 
-    # --- 3. INDEX TITLE & TAGS (NEW STEP) ---
+    # --- 2. TITLE & TAGS ---
+    meta_row = embed_meta(video_id, title, tags, encoder)
+
+    # --- 3. FRAMES (YOUR EXISTING LOGIC) ---
+    if frames is None:
+        print(f"📸 Scanning frames in '{frames_folder}'...")
+        frames = frame_files(frames_folder)
+    else:
+        print("📸 Embedding frames as they are decoded (streaming)...")
+
+    buffer = [] 
+
+    def load(frame):
+        source = frame[1]
+        return Image.open(source).convert("RGB") if isinstance(source, str) else source
+
+    start = time.perf_counter()
+    # Your normalization happens inside the encoder
+    for batch, vectors in embed_batches(encoder, frames, load, batch_size, precision):
+        for frame, vector in zip(batch, vectors):
+            timestamp = frame[0]
+            span_end = frame[2] if len(frame) > 2 and frame[2] is not None else timestamp + sample_interval
+            buffer.append({
+                "vector": vector.tolist(),
+                "video_id": video_id, 
+                "timestamp": timestamp,
+                "metadata": f"Frame at {timestamp}s",
+                "span_end": span_end,
+            })
+    elapsed = time.perf_counter() - start
+    stats = {"frames": len(buffer), "seconds": round(elapsed, 2), "fps": round(len(buffer) / max(elapsed, 1e-9), 1)}
+    print(f"⚡ Embedded {stats['frames']} frames in {stats['seconds']}s ({stats['fps']} frames/sec, batch={batch_size}, {precision})")
+    if not buffer:
+        print("⚠️ No frames found.")
+    return buffer, meta_row, stats
+
+
+def embed_meta(video_id, title="", tags="", encoder=None):
+    """The title + tags row for META_TABLE (one text-tower pass)."""
+    from .encoder import get_encoder
+    encoder = encoder or get_encoder()
     print(f"📝 Indexing Metadata: '{title}' + '{tags}'")
     text_content = f"{title} {tags}"
     
-    with torch.no_grad():
-        # Turn Title+Tags into a Vector
-        inputs = processor(text=[text_content], return_tensors="pt", padding="max_length").to(device)
-        outputs = model.get_text_features(**inputs)
-        outputs = outputs / outputs.norm(p=2, dim=-1, keepdim=True)
-        meta_vector = outputs[0].cpu().tolist()
-
-    # Save to Metadata Table (Remove old entry for this video first if exists)
-    try: tbl_meta.delete(f"video_id = '{video_id}'")
-    except: pass
-    
-    tbl_meta.add([{
-        "vector": meta_vector,
+    # Turn Title+Tags into a Vector
+    return {
+        "vector": encoder.encode_text([text_content])[0].tolist(),
         "video_id": video_id,
         "title": title,
         "tags": tags
-    }])
+    }
+
+
+def clone_frame_rows(db_path, table_name, source_video_id, video_id):
+    """
+    The frame rows of an already indexed video, re-labelled as `video_id`
+    (byte-identical upload: same frames, same vectors). [] if the source has none.
+    Compact tables round-trip exactly (float16 -> float32 -> float16, int8 keeps its scale).
+    """
+    import lancedb
+    from .compact import decode
+
+    db = lancedb.connect(db_path)
+    if table_name not in db.table_names():
+        return []
+    dataset = db.open_table(table_name).to_lance()
+    found = dataset.to_table(filter=f"video_id = '{source_video_id}'")
+    if found.num_rows == 0:
+        return []
+    vectors = decode(found, full=True)
+    columns = {name: found.column(name).to_pylist() for name in ("timestamp", "metadata", "span_end")
+               if name in found.schema.names}
+    rows = [dict({name: values[i] for name, values in columns.items()}, vector=vectors[i].tolist(), video_id=video_id)
+            for i in range(found.num_rows)]
+    return sorted(rows, key=lambda row: row["timestamp"])
+
+
+def write_video(db_path, video_id, table_name, frame_rows, meta_row):
+    """
+    Replaces ONE video's rows in place: deletes its old rows, appends the new
+    fragments. Cost depends on the video, not on the size of the library.
+    All or nothing: if any step fails, every table goes back to the version it
+    had before (the old rows are never left deleted) and the error is re-raised.
+    Returns rows written per table ({table: count}, feeds IndexManager.record).
+    """
+    import lancedb
+
+    print(f"📂 Writing {video_id} to LanceDB at {db_path}...")
+    db = lancedb.connect(db_path)
+    tbl_frames, tbl_meta = open_tables(db, table_name)
+    tbl_segments = open_segment_table(db, table_name)
+    tables = (tbl_meta, tbl_frames, tbl_segments)
+    versions = [tbl.version for tbl in tables]
+    try:
+        return _replace_video(video_id, table_name, tbl_frames, tbl_meta, tbl_segments, frame_rows, meta_row)
+    except Exception as e:
+        print(f"⏪ Writing {video_id} failed ({e}), restoring the previous table versions")
+        for tbl, version in zip(tables, versions):
+            try:
+                if tbl.version != version:
+                    tbl.restore(version)
+            except Exception as restore_error:
+                print(f"⚠️ Could not restore {tbl.name} to version {version}: {restore_error}")
+        raise
+
 
-    # --- 4. INDEX FRAMES (YOUR EXISTING LOGIC) ---
-    print(f"📸 Scanning frames in '{frames_folder}'...")
+def _replace_video(video_id, table_name, tbl_frames, tbl_meta, tbl_segments, frame_rows, meta_row):
+    from .compact import compact_rows, has_full_vectors, storage_format
+
+    # Save to Metadata Table (old entry for this video removed first)
+    tbl_meta.delete(f"video_id = '{video_id}'")
+    tbl_meta.add([meta_row])
 
     # 👇 CRITICAL FIX: Delete old frame data to prevent "Ghost Results" (3 min timestamp in 2 min video)
-    try: 
-        tbl_frames.delete(f"video_id = '{video_id}'")
-        print(f"🧹 Cleaned up old data for {video_id}")
-    except: 
-        pass
+    tbl_frames.delete(f"video_id = '{video_id}'")
+    tbl_segments.delete(f"video_id = '{video_id}'")
+    print(f"🧹 Cleaned up old data for {video_id}")
 
+    if not frame_rows:
+        return {META_TABLE: 1}
 
-    files = [f for f in os.listdir(frames_folder) if f.endswith(".jpg")]
-    if not files:
-        print("⚠️ No frames found.")
-        return
+    # Coarse segment vectors (computed before span_end may be stripped below)
+    segments = segment_rows(frame_rows)
 
-    files.sort(key=lambda x: int(x.split("_")[1].split(".")[0]))
-    buffer = [] 
+    # Tables created before span_end existed keep working (spans just aren't stored)
+    if "span_end" not in tbl_frames.schema.names:
+        frame_rows = [{k: v for k, v in row.items() if k != "span_end"} for row in frame_rows]
 
-    for file in files:
-        timestamp = float(file.split("_")[1].split(".")[0])
-        path = os.path.join(frames_folder, file)
-        image = Image.open(path)
-        
-        with torch.no_grad():
-            inputs = processor(images=image, return_tensors="pt").to(device)
-            outputs = model.get_image_features(**inputs)
-            # Your normalization
-            outputs = outputs / outputs.norm(p=2, dim=-1, keepdim=True)
-            vector = outputs[0].cpu().tolist()
-            
-        buffer.append({
-            "vector": vector,
-            "video_id": video_id, 
-            "timestamp": timestamp,
-            "metadata": f"Frame at {timestamp}s"
-        })
-        
-    if buffer:
-        print(f"💾 Dumping {len(buffer)} frame vectors...")
-        tbl_frames.add(buffer)
-        print("🎉 Indexing Complete.")
\ No newline at end of file
+    # Compact tables (float16 / int8, see compact.py) get their codes computed here
+    fmt = storage_format(tbl_frames.schema)
+    if fmt != "float32":
+        frame_rows = compact_rows(frame_rows, fmt, keep_full=has_full_vectors(tbl_frames.schema))
+
+    print(f"💾 Dumping {len(frame_rows)} frame vectors ({fmt}) + {len(segments)} segments...")
+    tbl_frames.add(frame_rows)
+    tbl_segments.add(segments)
+    print("🎉 Indexing Complete.")
+    return {table_name: len(frame_rows), segment_table_name(table_name): len(segments), META_TABLE: 1}
+
+
+def delete_video(db_path, video_id, table_name):
+    """Removes one video's rows from the frame, segment + metadata tables."""
+    import lancedb
+
+    db = lancedb.connect(db_path)
+    for name in (table_name, segment_table_name(table_name), META_TABLE):
+        if name in db.table_names():
+            db.open_table(name).delete(f"video_id = '{video_id}'")
+    print(f"🧹 Deleted vectors for {video_id}")
+
+
+def backfill_segments(db_path, table_name):
+    """
+    Builds segment rows for videos indexed before segments existed
+    (one video at a time, so memory stays bounded). Returns segments written.
+    """
+    import lancedb
+    from .compact import CODE_COLUMNS, decode, storage_format
+
+    db = lancedb.connect(db_path)
+    if table_name not in db.table_names():
+        return 0
+    dataset = db.open_table(table_name).to_lance()
+    tbl_segments = open_segment_table(db, table_name)
+    done = set(tbl_segments.to_lance().to_table(columns=["video_id"])["video_id"].to_pylist())
+    todo = set(dataset.to_table(columns=["video_id"])["video_id"].to_pylist()) - done
+
+    written = 0
+    fmt = storage_format(dataset.schema)
+    vector_columns = CODE_COLUMNS[fmt] if fmt != "float32" else ["vector"]
+    columns = vector_columns + ["video_id", "timestamp"] + (["span_end"] if "span_end" in dataset.schema.names else [])
+    for video_id in sorted(todo):
+        data = dataset.to_table(columns=columns, filter=f"video_id = '{video_id}'")
+        vectors = decode(data, fmt)
+        rows = [dict(row, vector=vector) for row, vector in
+                zip(data.drop(vector_columns).to_pylist(), vectors)]
+        segments = segment_rows(rows)
+        tbl_segments.add(segments)
+        written += len(segments)
+    print(f"🧩 Backfilled {written} segments for {len(todo)} videos")
+    return written
+
+
+def index_frames(frames_folder, db_path, video_id, table_name, title="", tags="", encoder=None,
+                 batch_size=32, precision="fp32", frames=None, sample_interval=0.5):
+    """
+    1. Indexes Visual Frames (Your Logic)
+    2. Indexes Title & Tags (New Logic)
+    embed_video() + write_video() in one go. Returns the embedding stats.
+    """
+    frame_rows, meta_row, stats = embed_video(frames_folder, video_id, title, tags, encoder,
+                                              batch_size, precision, frames, sample_interval)
+    write_video(db_path, video_id, table_name, frame_rows, meta_row)
+    return stats
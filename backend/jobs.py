@@ -0,0 +1,273 @@
+####################....... jobs.py
+# Durable ingest queue, kept in the shared state (modal.Dict, or store.LocalState locally):
+#   api.py enqueue()s -> ONE scheduler (VideoIndexer.drain_queue) claims packed batches,
+#   runs them on a warm GPU container and commits each batch to LanceDB once.
+import time
+import uuid
+from contextlib import contextmanager
+
+from . import metrics
+from .store import acquire, release, renew, write_lock
+
+QUEUE_KEY = "ingest_queue"          # {job_id: job}
+HISTORY_KEY = "ingest_history"      # finished jobs (wait + stage timings), newest last
+SCHEDULER_KEY = "ingest_scheduler"  # (worker, expires_at) of the one draining worker
+LAST_JOB_PREFIX = "ingest_job:"     # + video_id: that video's latest finished job (for /api/status)
+QUEUE_LOCK = "ingest_queue_lock"
+HISTORY_LOCK = "ingest_history_lock"
+MAX_HISTORY = 200
+
+PRIORITIES = {"upload": 0, "reindex": 10, "backfill": 20} # lower runs first
+PACK_BYTES = 512 * 1024 * 1024 # one batch = as many queued videos as fit (always >= 1)
+PACK_JOBS = 16
+JOB_LEASE = 300         # a claimed job goes back to the queue if its worker vanishes
+SCHEDULER_LEASE = 300   # a killed scheduler blocks new ones this long, at most
+HEARTBEAT_SECONDS = 60  # both leases are renewed this often while a batch runs
+MAX_ATTEMPTS = 3
+
+
+@contextmanager
+def _queue(state):
+    """Read-modify-write of the queue under a short lock (nothing is written on error)."""
+    with write_lock(state, QUEUE_LOCK, lease=30, poll=0.02):
+        queue = state.get(QUEUE_KEY, {})
+        yield queue
+        state.put(QUEUE_KEY, queue)
+
+
+def _claimable(job, now):
+    return job["status"] == "pending" or (job["status"] == "running" and job["lease_until"] < now)
+
+
+def enqueue(state, video_id, kind, params, size_bytes=0, now=None):
+    """
+    Queues (re)indexing of `video_id`. A job already WAITING for the same video
+    absorbs this one (highest priority, newest params, oldest enqueue time).
+    Returns (job, coalesced).
+    """
+    now = time.time() if now is None else now
+    priority = PRIORITIES[kind]
+    with _queue(state) as queue:
+        for job in queue.values():
+            if job["video_id"] == video_id and job["status"] == "pending":
+                if priority < job["priority"]:
+                    job.update(kind=kind, priority=priority)
+                job["params"] = dict(job["params"], **params)
+                job["size_bytes"] = size_bytes or job["size_bytes"]
+                job["coalesced"] += 1
+                return job, True
+        job = {"job_id": uuid.uuid4().hex, "video_id": video_id, "kind": kind, "priority": priority,
+               "params": params, "size_bytes": size_bytes, "enqueued_at": now, "status": "pending",
+               "attempts": 0, "worker": None, "lease_until": None, "coalesced": 0}
+        queue[job["job_id"]] = job
+        return job, False
+
+
+def claim(state, worker, pack_bytes=PACK_BYTES, pack_jobs=PACK_JOBS, now=None):
+    """
+    Takes the next batch: priority order, packed up to pack_bytes / pack_jobs.
+    Jobs of a vanished worker are claimed again (given up after MAX_ATTEMPTS).
+    Returns (batch, abandoned).
+    """
+    now = time.time() if now is None else now
+    batch, abandoned = [], []
+    with _queue(state) as queue:
+        for job_id, job in list(queue.items()):
+            if job["status"] == "running" and job["lease_until"] < now and job["attempts"] >= MAX_ATTEMPTS:
+                abandoned.append(queue.pop(job_id))
+        running = {job["video_id"] for job in queue.values() if job["status"] == "running" and job["lease_until"] >= now}
+        waiting = sorted((job for job in queue.values() if _claimable(job, now) and job["video_id"] not in running),
+                         key=lambda job: (job["priority"], job["enqueued_at"]))
+        total = 0
+        for job in waiting:
+            if batch and (len(batch) >= pack_jobs or total + job["size_bytes"] > pack_bytes):
+                break
+            if job["video_id"] in {claimed["video_id"] for claimed in batch}:
+                continue
+            job.update(status="running", worker=worker, lease_until=now + JOB_LEASE, attempts=job["attempts"] + 1,
+                       started_at=now)
+            batch.append(dict(job))
+            total += job["size_bytes"]
+    for job in abandoned:
+        _record(state, job, "failed", {}, now)
+    return batch, abandoned
+
+
+def finish(state, job, status, stages=None, counters=None, now=None):
+    """Drops a claimed job from the queue and logs its wait, stage timings and counters."""
+    now = time.time() if now is None else now
+    with _queue(state) as queue:
+        current = queue.get(job["job_id"])
+        if current and current["worker"] == job["worker"]:
+            queue.pop(job["job_id"])
+    return _record(state, job, status, stages or {}, now, counters)
+
+
+def _record(state, job, status, stages, now, counters=None):
+    record = {"job_id": job["job_id"], "video_id": job["video_id"], "kind": job["kind"], "status": status,
+              "attempts": job["attempts"], "coalesced": job["coalesced"],
+              "wait_seconds": round(job.get("started_at", now) - job["enqueued_at"], 3),
+              "stages": {name: round(seconds, 3) for name, seconds in stages.items()},
+              "counters": counters or {}, "finished_at": now}
+    # The scheduler AND process_video containers (record_direct) append
+    with write_lock(state, HISTORY_LOCK, lease=30, poll=0.02):
+        state.put(HISTORY_KEY, state.get(HISTORY_KEY, [])[-(MAX_HISTORY - 1):] + [record])
+    state.put(LAST_JOB_PREFIX + job["video_id"], record)
+    metrics.inc("chrono_ingest_jobs_total", kind=job["kind"], status=status)
+    metrics.observe("chrono_ingest_wait_seconds", record["wait_seconds"], kind=job["kind"])
+    return record
+
+
+def record_direct(state, video_id, status, stages=None, counters=None):
+    """History entry for a video indexed outside the queue (VideoIndexer.process_video)."""
+    now = time.time()
+    job = {"job_id": uuid.uuid4().hex, "video_id": video_id, "kind": "direct", "attempts": 1, "coalesced": 0,
+           "enqueued_at": now, "started_at": now}
+    return _record(state, job, status, stages or {}, now, counters)
+
+
+def pending_count(state, now=None):
+    now = time.time() if now is None else now
+    return sum(_claimable(job, now) for job in state.get(QUEUE_KEY, {}).values())
+
+
+# --- The single scheduler ---
+
+def scheduler_active(state, now=None):
+    holder = state.get(SCHEDULER_KEY)
+    return bool(holder) and holder[1] >= (time.time() if now is None else now)
+
+
+def renew_jobs(state, worker, batch, now=None):
+    """Pushes out the leases of `worker`'s claimed jobs (the others were taken over meanwhile)."""
+    now = time.time() if now is None else now
+    job_ids = {job["job_id"] for job in batch}
+    with _queue(state) as queue:
+        for job_id in job_ids & set(queue):
+            if queue[job_id]["worker"] == worker and queue[job_id]["status"] == "running":
+                queue[job_id]["lease_until"] = now + JOB_LEASE
+
+
+def _heartbeat(state, worker, batch, stop):
+    """Keeps the scheduler lease and the batch's job leases alive while run_batch works."""
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            if not renew(state, SCHEDULER_KEY, worker, SCHEDULER_LEASE):
+                print("⚠️ Lost the scheduler lease mid-batch")
+            renew_jobs(state, worker, batch)
+        except Exception as e:
+            print(f"⚠️ Lease heartbeat failed: {e}")
+
+
+def _run_with_heartbeat(state, worker, batch, run_batch):
+    import threading
+
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(state, worker, batch, stop), name="ingest-heartbeat", daemon=True)
+    beat.start()
+    try:
+        return run_batch(batch)
+    finally:
+        stop.set()
+        beat.join()
+
+
+def drain(state, run_batch, worker=None, pack_bytes=PACK_BYTES, pack_jobs=PACK_JOBS, on_abandoned=None,
+          budget=None):
+    """
+    Runs batches until the queue is empty, or (budget=seconds) until no new batch
+    should start any more: the caller re-spawns a scheduler for what is left.
+    If another scheduler is already draining, returns at once (it will pick our job up).
+    run_batch(batch) -> {job_id: (status, stages, counters)}; a raised error fails the batch.
+    Returns the finished job records.
+    """
+    worker = worker or uuid.uuid4().hex
+    started = time.monotonic()
+    finished = []
+    while acquire(state, SCHEDULER_KEY, worker, SCHEDULER_LEASE):
+        out_of_time = False
+        try:
+            while True:
+                if budget is not None and time.monotonic() - started >= budget:
+                    print(f"⏳ Drain budget ({budget:.0f}s) used up, handing over")
+                    out_of_time = True
+                    break
+                if not renew(state, SCHEDULER_KEY, worker, SCHEDULER_LEASE):
+                    print("⚠️ Scheduler lease taken over, stopping")
+                    return finished
+                batch, abandoned = claim(state, worker, pack_bytes, pack_jobs)
+                if abandoned and on_abandoned:
+                    on_abandoned(abandoned)
+                if not batch:
+                    break
+                print(f"📦 Batch of {len(batch)}: {', '.join(job['video_id'] for job in batch)}")
+                try:
+                    results = _run_with_heartbeat(state, worker, batch, run_batch)
+                except Exception as e:
+                    print(f"❌ Batch failed: {e}")
+                    results = {}
+                for job in batch:
+                    status, stages, counters = results.get(job["job_id"], ("failed", {}, {}))
+                    finished.append(finish(state, job, status, stages, counters))
+        finally:
+            release(state, SCHEDULER_KEY, worker)
+        # A job enqueued while we were letting go saw the lease still held and
+        # didn't start a scheduler: look once more before leaving
+        if out_of_time or not pending_count(state):
+            break
+    return finished
+
+
+# --- Visibility (/api/queue, /api/status) ---
+
+def job_status(state, video_id, now=None):
+    """
+    Where a video's ingest is: its queued/running job (state + wait so far), else
+    its latest finished job (wait, per-stage seconds, counters), else None.
+    """
+    now = time.time() if now is None else now
+    for job in state.get(QUEUE_KEY, {}).values():
+        if job["video_id"] == video_id:
+            queued = {"state": "pending" if _claimable(job, now) else "running", "kind": job["kind"],
+                      "attempts": job["attempts"], "coalesced": job["coalesced"]}
+            if queued["state"] == "running":
+                queued["wait_seconds"] = round(job["started_at"] - job["enqueued_at"], 3)
+                queued["running_seconds"] = round(now - job["started_at"], 1)
+            else:
+                queued["wait_seconds"] = round(now - job["enqueued_at"], 1)
+            return queued
+    record = state.get(LAST_JOB_PREFIX + video_id)
+    return dict(record, state="finished") if record else None
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": round(pick(0.50), 3), "p95": round(pick(0.95), 3), "max": round(ordered[-1], 3)}
+
+
+def stats(state, now=None):
+    """Queue depth per kind, oldest wait, and wait/stage timings of recent jobs."""
+    now = time.time() if now is None else now
+    queue = list(state.get(QUEUE_KEY, {}).values())
+    waiting = [job for job in queue if _claimable(job, now)]
+    history = state.get(HISTORY_KEY, [])
+    stage_names = sorted({name for record in history for name in record["stages"]})
+    return {
+        "depth": len(waiting),
+        "running": len(queue) - len(waiting),
+        "by_kind": {kind: sum(job["kind"] == kind for job in waiting) for kind in PRIORITIES},
+        "oldest_wait_seconds": round(now - min(job["enqueued_at"] for job in waiting), 1) if waiting else 0.0,
+        "scheduler_active": scheduler_active(state, now),
+        "recent": {
+            "jobs": len(history),
+            "failed": sum(record["status"] != "completed" for record in history),
+            "coalesced": sum(record["coalesced"] for record in history),
+            "wait_seconds": {kind: _percentiles([r["wait_seconds"] for r in history if r["kind"] == kind])
+                             for kind in PRIORITIES},
+            "stage_seconds": {name: _percentiles([r["stages"][name] for r in history if name in r["stages"]])
+                              for name in stage_names},
+        },
+    }
@@ -15,6 +15,7 @@ web_app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # keyset pagination for /api/feed + /api/my_videos
 )
 
 # 🛑 FIX: check_dir=False prevents Local Crash
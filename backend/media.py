@@ -0,0 +1,115 @@
+####################....... media.py
+import os
+import struct
+
+
+def top_level_atoms(path):
+    """Yields (type, offset, size) for the top-level MP4 boxes (ftyp, moov, mdat, ...)."""
+    with open(path, "rb") as f:
+        total = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + 8 <= total:
+            f.seek(offset)
+            header = f.read(16)
+            size, kind = struct.unpack(">I4s", header[:8])
+            if size == 1: # 64-bit size follows the type
+                size = struct.unpack(">Q", header[8:16])[0]
+            elif size == 0: # box runs to the end of the file
+                size = total - offset
+            if size < 8:
+                break # corrupt / not an MP4
+            yield kind.decode("latin-1"), offset, size
+            offset += size
+
+
+def is_faststart(path):
+    """True when moov comes before mdat (players can start after the first bytes)."""
+    first = {}
+    for kind, offset, _ in top_level_atoms(path):
+        first.setdefault(kind, offset)
+    return "moov" in first and first["moov"] < first.get("mdat", float("inf"))
+
+
+def faststart(path):
+    """
+    Remuxes `path` in place so moov sits at the front (ffmpeg -c copy, no re-encode).
+    Returns True if the file was rewritten, False if it already was fast-start.
+    """
+    import subprocess
+
+    if is_faststart(path):
+        return False
+    tmp_path = path + ".faststart.mp4"
+    try:
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", path, "-map", "0", "-c", "copy",
+                        "-ignore_unknown", "-movflags", "+faststart", tmp_path],
+                       check=True, capture_output=True)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+
+# --- HTTP caching / Range helpers for /api/stream ---
+
+def etag(st):
+    """Strong validator from size + mtime (changes whenever the file is replaced)."""
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def http_date(timestamp):
+    from email.utils import formatdate
+    return formatdate(timestamp, usegmt=True)
+
+
+def _parse_http_date(value):
+    from email.utils import parsedate_to_datetime
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def not_modified(headers, tag, mtime):
+    """RFC 9110 conditional GET: If-None-Match wins over If-Modified-Since."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+        return "*" in candidates or tag in candidates
+    since = _parse_http_date(headers.get("if-modified-since"))
+    return since is not None and int(mtime) <= since
+
+
+def range_applies(headers, tag, mtime):
+    """If-Range: only honour Range when the client's copy is still current."""
+    if_range = headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == tag
+    since = _parse_http_date(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def parse_range(header, size):
+    """
+    "bytes=a-b" / "bytes=a-" / "bytes=-n" -> (start, end) inclusive, or None
+    (no header, not bytes, or several ranges -> serve the whole file).
+    Raises ValueError when the range can't be satisfied (-> 416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start, end = max(0, size - int(last)), size - 1 # suffix: the last n bytes
+    except ValueError:
+        return None # malformed -> ignore, like most servers
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, end
@@ -0,0 +1,195 @@
+####################....... metrics.py
+# Per-stage timings + counters for ingest and search, served as Prometheus text by /api/metrics.
+# Each container records into its own Registry (memory only, nothing on the request path);
+# the deltas are merged into the shared state (modal.Dict) at most every FLUSH_SECONDS,
+# so whichever API container gets scraped reports the totals of the whole fleet.
+import threading
+import time
+
+from .store import write_lock
+
+METRICS_KEY = "metrics"        # {(name, labels): value} for counters, [bucket counts..., sum, count] for histograms
+METRICS_LOCK = "metrics_lock"
+FLUSH_SECONDS = 10.0
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+# name -> (type, help); anything recorded must be listed here
+METRICS = {
+    "chrono_ingest_stage_seconds": ("histogram", "Ingest time per video and stage (faststart, clone, extract, embed, thumbnails)"),
+    "chrono_ingest_commit_seconds": ("histogram", "Batch commit time per stage (lock_wait, write, ann_record, frame_cache, vol_commit; ann_lock_wait + ann_index for the IVF-PQ build after it)"),
+    "chrono_ingest_wait_seconds": ("histogram", "Time a job spent queued before a scheduler claimed it"),
+    "chrono_ingest_jobs_total": ("counter", "Finished ingest jobs by kind and status"),
+    "chrono_ingest_frames_total": ("counter", "Frames extracted (or cloned from an identical upload)"),
+    "chrono_ingest_vectors_written_total": ("counter", "Rows written to LanceDB by table"),
+    "chrono_ingest_bytes_total": ("counter", "Video bytes read by ingest"),
+    "chrono_upload_bytes_total": ("counter", "Upload bytes copied to the volume"),
+    "chrono_model_load_seconds": ("histogram", "Encoder load time per container start"),
+    "chrono_search_seconds": ("histogram", "Search time per request (result cache hits included)"),
+    "chrono_search_stage_seconds": ("histogram", "Search time per stage on result cache misses (encode, search, format)"),
+    "chrono_search_requests_total": ("counter", "Search requests by endpoint and result cache outcome"),
+    "chrono_cache_lookups_total": ("counter", "Cache lookups by cache (query_vectors, results, video_matrices, frame_cache) and result"),
+}
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Registry:
+    """Deltas since the last flush (thread-safe; searchers record from many request threads)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.seen = {} # last cumulative value per sync()ed series
+        self.flushed_at = time.monotonic()
+        self.flushing = False
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        import bisect
+        key = (name, _labels(labels))
+        with self.lock:
+            histogram = self.values.setdefault(key, [0] * (len(BUCKETS) + 3)) # buckets, +Inf, sum, count
+            histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def observe_stages(self, name, stages, **labels):
+        for stage, seconds in stages.items():
+            self.observe(name, seconds, stage=stage, **labels)
+
+    def sync(self, name, cumulative, **labels):
+        """Counts a stat another object keeps as a running total (e.g. LRUCache.stats() hits)."""
+        key = (name, _labels(labels))
+        with self.lock:
+            delta = cumulative - self.seen.get(key, 0)
+            self.seen[key] = cumulative
+        if delta > 0:
+            self.inc(name, delta, **labels)
+
+    def take(self):
+        with self.lock:
+            values, self.values = self.values, {}
+            self.flushed_at = time.monotonic()
+        return values
+
+    def flush(self, state):
+        """Merges the deltas into the shared totals (put back if that fails)."""
+        values = self.take()
+        if not values:
+            return
+        try:
+            with write_lock(state, METRICS_LOCK, lease=30, poll=0.02):
+                totals = state.get(METRICS_KEY, {})
+                for key, value in values.items():
+                    totals[key] = _merge(totals.get(key), value)
+                state.put(METRICS_KEY, totals)
+        except Exception as e:
+            print(f"⚠️ Metrics not flushed: {e}")
+            with self.lock:
+                for key, value in values.items():
+                    self.values[key] = _merge(self.values.get(key), value)
+
+    def maybe_flush(self, state, collect=None):
+        """Flushes on a background thread once FLUSH_SECONDS have passed (one flush at a time)."""
+        with self.lock:
+            if self.flushing or time.monotonic() - self.flushed_at < FLUSH_SECONDS:
+                return
+            self.flushing = True
+
+        def run():
+            try:
+                if collect:
+                    collect()
+                self.flush(state)
+            finally:
+                self.flushing = False
+        threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+
+def _merge(total, value):
+    if total is None:
+        return list(value) if isinstance(value, list) else value
+    if isinstance(value, list):
+        return [a + b for a, b in zip(total, value)]
+    return total + value
+
+
+REGISTRY = Registry() # one per container
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+observe_stages = REGISTRY.observe_stages
+sync = REGISTRY.sync
+
+
+class Stopwatch:
+    """
+    stopwatch.lap("extract") -> stages["extract"] = seconds since the previous lap,
+    also observed into the `metric` histogram (stage=name + labels).
+    """
+
+    def __init__(self, stages=None, metric=None, **labels):
+        self.stages = {} if stages is None else stages
+        self.metric = metric
+        self.labels = labels
+        self.clock = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.stages[name] = now - self.clock
+        self.clock = now
+        if self.metric:
+            observe(self.metric, self.stages[name], stage=name, **self.labels)
+        return self.stages[name]
+
+
+# --- Prometheus text format (/api/metrics) ---
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(totals, gauges=None):
+    """
+    Text exposition format 0.0.4. totals = the shared METRICS_KEY value;
+    gauges = {name: (help, value)} read at scrape time (queue depth, ...).
+    """
+    by_name = {}
+    for (name, labels), value in totals.items():
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name in sorted(by_name):
+        kind, text = METRICS.get(name, ("untyped", ""))
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+        for labels, value in sorted(by_name[name]):
+            if kind != "histogram":
+                lines.append(f"{_series(name, labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), value[:-2]):
+                cumulative += count
+                lines.append(f"{_series(name + '_bucket', labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{_series(name + '_sum', labels)} {_number(value[-2])}")
+            lines.append(f"{_series(name + '_count', labels)} {value[-1]}")
+    for name, (text, value) in sorted((gauges or {}).items()):
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+    return "\n".join(lines) + "\n"
+
+
+def snapshot(state):
+    return state.get(METRICS_KEY, {})
@@ -1,22 +1,24 @@
 
 ####################....... search.py
+import time
 
 
-def search_index(query, db_path, table_name, filter_video_id=None):
+def search_index(query, db_path, table_name, filter_video_id=None, encoder=None,
+                 nprobes=None, refine_factor=None, limit=10, timings=None):
     import lancedb
-    import torch
-    from transformers import AutoProcessor, AutoModel
+    import pandas as pd
+    from .compact import search_frames
+    from .encoder import get_encoder
     """
     Exact logic provided by user:
     - Encode Text
     - Normalize
     - Cosine Search
+    timings (optional dict) gets seconds per stage: encode, search, format
     """
-    # --- 1. LOAD THE BRAIN ---
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    
-    model = AutoModel.from_pretrained("google/siglip-so400m-patch14-384").to(device)
-    processor = AutoProcessor.from_pretrained("google/siglip-so400m-patch14-384")
+    timings = {} if timings is None else timings
+    # --- 1. THE BRAIN (resident per container, see encoder.py) ---
+    encoder = encoder or get_encoder()
 
     # --- 2. CONNECT TO DB ---
     db = lancedb.connect(db_path)
@@ -27,22 +29,19 @@ def search_index(query, db_path, table_name, filter_video_id=None):
 
     # --- 3. THE SEARCH LOGIC ---
     print(f"🔎 Searching for: '{query}'")
+    clock = time.perf_counter()
 
-    with torch.no_grad():
-        inputs = processor(text=[query], return_tensors="pt", padding="max_length").to(device)
-        text_outputs = model.get_text_features(**inputs)
-        # Normalize (CRITICAL per your code)
-        text_outputs = text_outputs / text_outputs.norm(p=2, dim=-1, keepdim=True)
-        query_vector = text_outputs[0].cpu().numpy()
-
-    # B. Search
-    search_job = tbl.search(query_vector).metric("cosine")
-    
-    if filter_video_id:
-        search_job = search_job.where(f"video_id = '{filter_video_id}'")
+    # Encode + Normalize (CRITICAL per your code)
+    query_vector = encoder.encode_query(query)
+    timings["encode"] = time.perf_counter() - clock
+
+    # B. Search (nprobes only matters once ann.py built an index; int8-only tables
+    # are scanned, refine_factor = how many candidates get a float32 rescore)
+    where = f"video_id = '{filter_video_id}'" if filter_video_id else None
         
-    # Get top 10 matches
-    results = search_job.limit(10).to_pandas()
+    # Get top 10 matches (by default)
+    results = search_frames(tbl, query_vector, limit, nprobes, refine_factor, where)
+    timings["search"] = time.perf_counter() - clock - timings["encode"]
 
     # --- 4. FORMAT RESULTS ---
     final_results = []
@@ -53,11 +52,99 @@ def search_index(query, db_path, table_name, filter_video_id=None):
         # Convert to % for UI display
         display_score = score * 100 
         
-        final_results.append({
+        hit = {
             "video_id": row['video_id'],
             "score": round(display_score, 1),
             "timestamp": row['timestamp'],
             "match_type": "Visual Match"
-        })
+        }
+        # Adaptive sampling: one row can stand for a whole scene
+        if 'span_end' in results.columns and pd.notna(row['span_end']):
+            hit["end_timestamp"] = row['span_end']
+        final_results.append(hit)
         
-    return sorted(final_results, key=lambda x: x['score'], reverse=True)
\ No newline at end of file
+    final_results = sorted(final_results, key=lambda x: x['score'], reverse=True)
+    timings["format"] = time.perf_counter() - clock - timings["encode"] - timings["search"]
+    return final_results
+
+
+class VideoMatrix:
+    """One video's frame vectors as a contiguous matrix + timestamp arrays."""
+
+    def __init__(self, vectors, timestamps, span_ends=None):
+        self.vectors = vectors
+        self.timestamps = timestamps
+        self.span_ends = span_ends
+
+    @property
+    def nbytes(self):
+        extra = self.span_ends.nbytes if self.span_ends is not None else 0
+        return self.vectors.nbytes + self.timestamps.nbytes + extra
+
+
+def load_video_matrix(db_path, table_name, video_id, dtype="float32"):
+    """
+    Reads ONE video's rows straight from the Lance dataset (filter pushdown,
+    vector column(s) only, compact tables decoded). float16 halves memory;
+    scores are still fp32 math.
+    """
+    import lancedb
+    import numpy as np
+    from .compact import CODE_COLUMNS, decode, storage_format
+
+    db = lancedb.connect(db_path)
+    if table_name not in db.table_names():
+        return None
+    tbl = db.open_table(table_name)
+    fmt = storage_format(tbl.schema)
+    columns = CODE_COLUMNS.get(fmt, ["vector"]) + ["timestamp"] + (["span_end"] if "span_end" in tbl.schema.names else [])
+    data = tbl.to_lance().to_table(columns=columns, filter=f"video_id = '{video_id}'")
+    if data.num_rows == 0:
+        return None
+
+    vectors = decode(data, fmt).astype(dtype, copy=False)
+    timestamps = data["timestamp"].to_numpy()
+    span_ends = data["span_end"].to_numpy() if "span_end" in columns else None
+    order = np.argsort(timestamps, kind="stable")
+    return VideoMatrix(np.ascontiguousarray(vectors[order]), timestamps[order],
+                       span_ends[order] if span_ends is not None else None)
+
+
+def search_video_matrix(query, matrix, video_id, encoder=None, limit=10, timings=None):
+    """
+    Deep Search inside one cached video: one matrix-vector product + argpartition.
+    Same result format (and cosine score) and timings as search_index.
+    """
+    import numpy as np
+    from .encoder import get_encoder
+
+    encoder = encoder or get_encoder()
+    timings = {} if timings is None else timings
+    clock = time.perf_counter()
+    print(f"🔎 Searching for: '{query}' (hot matrix, {len(matrix.timestamps)} frames)")
+    query_vector = encoder.encode_query(query)
+    timings["encode"] = time.perf_counter() - clock
+
+    if matrix.vectors.dtype == np.float32:
+        scores = matrix.vectors @ query_vector
+    else:
+        scores = matrix.vectors.astype(np.float32) @ query_vector
+
+    k = min(limit, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    timings["search"] = time.perf_counter() - clock - timings["encode"]
+
+    final_results = []
+    for i in top:
+        hit = {
+            "video_id": video_id,
+            "score": round(float(scores[i]) * 100, 1),
+            "timestamp": float(matrix.timestamps[i]),
+            "match_type": "Visual Match"
+        }
+        if matrix.span_ends is not None and not np.isnan(matrix.span_ends[i]):
+            hit["end_timestamp"] = float(matrix.span_ends[i])
+        final_results.append(hit)
+    timings["format"] = time.perf_counter() - clock - timings["encode"] - timings["search"]
+    return final_results
@@ -1,106 +1,199 @@
 ####################....... search_global.py
+import time
 
-def search_global_unified(query, db_path, frame_table_name):
+META_TABLE = "video_metadata_index"
+
+# "Title Match + Visuals" fusion rules (override per call with rules={...})
+DEFAULT_RULES = {
+    "title_min": 0.10,   # Skip strict garbage
+    "title_boost": 1.2,  # Titles are strong signals -> preference to metadata matches
+    "visual_min": 0.15,  # Your Honest Threshold
+    "both_bonus": 0.05,  # Matched BOTH title and visuals (once per video, not per frame)
+    "top_m": 1,          # Visual score of a video = mean of its best m frames (1 = best frame)
+}
+FRAMES_PER_RESULT = 8   # first frame fetch = k * this, grown until k distinct videos show up
+MAX_FRAME_FETCH = 4096
+SEGMENTS_PER_RESULT = 4 # mode="segments": candidate segments = k * this
+
+
+def fetch_frame_hits(tbl_frames, query_vector, k, visual_min, nprobes=None, refine_factor=None):
+    """
+    Over-fetches frames adaptively: one long video can fill a fixed limit(50)
+    on its own, so keep growing the limit (x4) until k distinct videos clear
+    visual_min, the table runs out, or MAX_FRAME_FETCH is hit.
+    int8-only tables are scanned (compact.scan_topk), so they are read ONCE at
+    MAX_FRAME_FETCH and the same growth steps are taken on that sorted result.
+    """
+    from .compact import ann_column, search_frames
+
+    scanned = None
+    if ann_column(tbl_frames.schema) is None:
+        scanned = search_frames(tbl_frames, query_vector, MAX_FRAME_FETCH, nprobes, refine_factor)
+    limit = k * FRAMES_PER_RESULT
+    while True:
+        if scanned is None:
+            hits = search_frames(tbl_frames, query_vector, limit, nprobes, refine_factor)
+        else:
+            hits = scanned.head(limit).copy() # sorted by score, best first
+        hits["score"] = 1 - hits["_distance"]
+        distinct = hits.loc[hits["score"] >= visual_min, "video_id"].nunique()
+        if distinct >= k or len(hits) < limit or limit >= MAX_FRAME_FETCH:
+            return hits
+        limit = min(limit * 4, MAX_FRAME_FETCH)
+
+
+def fetch_segment_frame_hits(db, frame_table_name, query_vector, k, nprobes=None, refine_factor=None):
+    """
+    Coarse-to-fine: top segments from the (much smaller) segment table, then an
+    exact rescore of ONLY those segments' frames. Returns frame hits shaped like
+    fetch_frame_hits(), so best_frames() / fuse() don't care which path ran.
+    """
+    import numpy as np
+    import pandas as pd
+    from .ann import tune
+    from .compact import CODE_COLUMNS, decode, has_full_vectors, storage_format
+    from .index import segment_table_name
+
+    # --- 1. COARSE: candidate segments ---
+    tbl_segments = db.open_table(segment_table_name(frame_table_name))
+    job = tune(tbl_segments.search(query_vector).metric("cosine"), nprobes, refine_factor)
+    segments = job.limit(k * SEGMENTS_PER_RESULT).select(["video_id", "start", "end"]).to_pandas()
+    if segments.empty:
+        return pd.DataFrame(columns=["video_id", "timestamp", "score", "_distance"])
+
+    # --- 2. FINE: load those segments' frames in one filtered scan ---
+    clauses = [f"(video_id = '{row.video_id}' AND timestamp >= {row.start} AND timestamp <= {row.end})"
+               for row in segments.itertuples()]
+    dataset = db.open_table(frame_table_name).to_lance()
+    fmt = storage_format(dataset.schema)
+    vector_columns = ["vector"] if has_full_vectors(dataset.schema) else CODE_COLUMNS[fmt]
+    columns = vector_columns + ["video_id", "timestamp"] + (["span_end"] if "span_end" in dataset.schema.names else [])
+    frames = dataset.to_table(columns=columns, filter=" OR ".join(clauses))
+
+    # --- 3. EXACT RESCORE (vectors are normalized -> cosine = dot; float32 when stored) ---
+    vectors = decode(frames, fmt, full=True)
+    hits = frames.drop(vector_columns).to_pandas()
+    hits["score"] = vectors @ np.asarray(query_vector, dtype=np.float32)
+    hits["_distance"] = 1 - hits["score"]
+    return hits
+
+
+def best_frames(frame_hits, visual_min, top_m=1):
+    """One row per video (vectorized): its best frame's timestamp + its visual score."""
+    hits = frame_hits[frame_hits["score"] >= visual_min].sort_values("score", ascending=False, kind="stable")
+    best = hits.drop_duplicates("video_id")
+    if top_m > 1:
+        top_mean = hits.groupby("video_id", sort=False).head(top_m).groupby("video_id")["score"].mean()
+        best = best.assign(score=best["video_id"].map(top_mean))
+    columns = ["video_id", "score", "timestamp"] + (["span_end"] if "span_end" in best.columns else [])
+    return best[columns].rename(columns={"score": "visual_score"})
+
+
+def fuse(meta_hits, frame_best, rules, k):
+    """Outer-joins title hits with per-video visual hits and applies the boosting rules."""
+    import numpy as np
+    import pandas as pd
+
+    meta = meta_hits.assign(title_score=1 - meta_hits["_distance"])
+    meta = meta.loc[meta["title_score"] >= rules["title_min"], ["video_id", "title", "title_score"]]
+    merged = meta.drop_duplicates("video_id").merge(frame_best, on="video_id", how="outer")
+    if merged.empty:
+        return []
+
+    has_title = merged["title_score"].notna().to_numpy()
+    has_visual = merged["visual_score"].notna().to_numpy()
+    merged["score"] = np.where(
+        has_title,
+        merged["title_score"].fillna(0) * rules["title_boost"] + np.where(has_visual, rules["both_bonus"], 0.0),
+        merged["visual_score"],
+    )
+    merged["match_type"] = np.select([has_title & has_visual, has_title],
+                                     ["Title Match + Visuals", "Title Match"], "Visual Match")
+    merged["title"] = merged["title"].fillna("Untitled (Visual Match)") # We might not have title here easily
+    merged = merged.sort_values("score", ascending=False, kind="stable").head(k)
+
+    results_list = []
+    for row in merged.to_dict("records"):
+        res = {
+            "video_id": row["video_id"],
+            "title": row["title"],
+            "score": float(row["score"]),
+            "match_type": row["match_type"],
+            # Jump to the best frame (or the start for title-only matches)
+            "timestamp": float(row["timestamp"]) if pd.notna(row["timestamp"]) else None,
+            "preview_url": f"/data/videos/{row['video_id']}.mp4",
+            "poster_url": f"/api/thumbs/{row['video_id']}/poster.jpg",
+        }
+        if pd.notna(row.get("span_end")):
+            res["end_timestamp"] = float(row["span_end"])
+        # Cap at 100, make small scores look readable
+        res["score_display"] = min(100, round(res["score"] * 100, 1))
+        results_list.append(res)
+    return results_list
+
+
+def search_global_unified(query, db_path, frame_table_name, encoder=None,
+                          nprobes=None, refine_factor=None, k=20, rules=None, mode="frames", timings=None):
     import lancedb
-    import torch
-    from transformers import AutoProcessor, AutoModel
     import pandas as pd
+    from concurrent.futures import ThreadPoolExecutor
+    from .ann import tune
+    from .encoder import get_encoder
+    from .index import segment_table_name
 
     """
     Hybrid Search Strategy:
-    1. Search Metadata (Titles/Tags)
-    2. Search Visual Content (Frames)
-    3. Merge and Rank results
+    1. Search Metadata (Titles/Tags)   } concurrently
+    2. Search Visual Content (Frames)  }
+       - mode="frames":   ANN over every frame
+       - mode="segments": ANN over segment vectors, exact rescore of their frames
+    3. Group frames per video + fuse with titles (vectorized), top k distinct videos
+    timings (optional dict) gets seconds per stage: encode, search (1 + 2), format (3)
     """
-    META_TABLE = "video_metadata_index"
-    
-    # --- 1. LOAD MODEL ---
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    # We load the model once to vectorise the query
-    model = AutoModel.from_pretrained("google/siglip-so400m-patch14-384").to(device)
-    processor = AutoProcessor.from_pretrained("google/siglip-so400m-patch14-384")
+    if mode not in ("frames", "segments"):
+        raise ValueError(f"Unknown search mode: {mode}")
+    rules = dict(DEFAULT_RULES, **(rules or {}))
+
+    # --- 1. MODEL (loaded once per container, see encoder.py) ---
+    encoder = encoder or get_encoder()
 
     # --- 2. VECTORIZE QUERY ---
     print(f"🌍 Hybrid Search for: '{query}'")
-    with torch.no_grad():
-        inputs = processor(text=[query], return_tensors="pt", padding="max_length").to(device)
-        text_outputs = model.get_text_features(**inputs)
-        text_outputs = text_outputs / text_outputs.norm(p=2, dim=-1, keepdim=True)
-        query_vector = text_outputs[0].cpu().numpy()
+    timings = {} if timings is None else timings
+    clock = time.perf_counter()
+    query_vector = encoder.encode_query(query)
+    timings["encode"] = time.perf_counter() - clock
 
     # --- 3. CONNECT DB ---
     db = lancedb.connect(db_path)
-    final_candidates = {} # Map: video_id -> {score, reason, timestamp}
+    table_names = db.table_names()
 
-    # ==========================================
     # 🕵️ STRATEGY A: METADATA SEARCH (Titles)
-    # ==========================================
-    if META_TABLE in db.table_names():
-        tbl_meta = db.open_table(META_TABLE)
-        meta_hits = tbl_meta.search(query_vector).metric("cosine").limit(20).to_pandas()
-        
-        for _, row in meta_hits.iterrows():
-            score = 1 - row['_distance']
-            if score < 0.10: continue # Skip strict garbage
-            
-            # Boost Title Matches (Titles are strong signals)
-            # We multiply by 1.2 to give preference to metadata matches
-            boosted_score = score * 1.2 
-            
-            final_candidates[row['video_id']] = {
-                "video_id": row['video_id'],
-                "title": row['title'],
-                "score": boosted_score,
-                "match_type": "Title Match",
-                "timestamp": None, # Jump to start
-                "preview_url": f"/data/videos/{row['video_id']}.mp4"
-            }
-
-    # ==========================================
-    # 👁️ STRATEGY B: VISUAL SEARCH (Frames)
-    # ==========================================
-    if frame_table_name in db.table_names():
-        tbl_frames = db.open_table(frame_table_name)
-        
-        # Search across ALL frames of ALL videos
-        frame_hits = tbl_frames.search(query_vector).metric("cosine").limit(50).to_pandas()
-        
-        for _, row in frame_hits.iterrows():
-            vid_id = row['video_id']
-            raw_score = 1 - row['_distance']
-            
-            # Use your Honest Threshold (0.15)
-            if raw_score < 0.15: continue
-            
-            # Check if we already found this video via Title
-            if vid_id in final_candidates:
-                # If visual score is SUPER high, maybe update the snippet?
-                # But generally, keep the Title match as primary.
-                # We slightly boost the existing score because it matched BOTH.
-                final_candidates[vid_id]['score'] += 0.05
-                final_candidates[vid_id]['match_type'] += " + Visuals"
-            else:
-                # New candidate found ONLY via visual
-                # We only keep the BEST frame for this video (Deduplication)
-                if vid_id not in final_candidates or raw_score > final_candidates[vid_id]['score']:
-                    final_candidates[vid_id] = {
-                        "video_id": vid_id,
-                        "title": "Untitled (Visual Match)", # We might not have title here easily
-                        "score": raw_score,
-                        "match_type": "Visual Match",
-                        "timestamp": row['timestamp'], # Jump to this moment
-                        "preview_url": f"/data/videos/{vid_id}.mp4"
-                    }
-
-    # --- 4. FORMAT & SORT ---
-    results_list = list(final_candidates.values())
-    
-    # Normalize scores for display (0.0 - 100.0)
-    for res in results_list:
-        # Cap at 100, make small scores look readable
-        res['score_display'] = min(100, round(res['score'] * 100, 1))
-        
-    # Sort by Score (Highest First)
-    results_list.sort(key=lambda x: x['score'], reverse=True)
-    
-    return results_list
\ No newline at end of file
+    def search_meta():
+        if META_TABLE not in table_names:
+            return pd.DataFrame(columns=["video_id", "title", "_distance"])
+        meta_job = tune(db.open_table(META_TABLE).search(query_vector).metric("cosine"), nprobes, refine_factor)
+        return meta_job.limit(max(20, k)).to_pandas()
+
+    # 👁️ STRATEGY B: VISUAL SEARCH (Frames, across ALL videos)
+    def search_frames():
+        if frame_table_name not in table_names:
+            return pd.DataFrame(columns=["video_id", "visual_score", "timestamp"])
+        if mode == "segments" and segment_table_name(frame_table_name) in table_names:
+            hits = fetch_segment_frame_hits(db, frame_table_name, query_vector, k, nprobes, refine_factor)
+        else:
+            # No segment table yet (run index.backfill_segments) -> plain frame search
+            hits = fetch_frame_hits(db.open_table(frame_table_name), query_vector, k, rules["visual_min"],
+                                    nprobes, refine_factor)
+        return best_frames(hits, rules["visual_min"], rules["top_m"])
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        meta_future = pool.submit(search_meta)
+        frame_future = pool.submit(search_frames)
+        meta_hits, frame_best = meta_future.result(), frame_future.result()
+    timings["search"] = time.perf_counter() - clock - timings["encode"]
+
+    # --- 4. FUSE, FORMAT & SORT ---
+    results = fuse(meta_hits, frame_best, rules, k)
+    timings["format"] = time.perf_counter() - clock - timings["encode"] - timings["search"]
+    return results
@@ -0,0 +1,174 @@
+####################....... store.py
+import time
+import uuid
+from contextlib import contextmanager
+
+
+class LocalState(dict):
+    """In-process stand-in for a modal.Dict (benchmarks, local runs)."""
+
+    def put(self, key, value, skip_if_exists=False):
+        if skip_if_exists and key in self:
+            return False
+        self[key] = value
+        return True
+
+
+GENERATION_KEY = "ingest_generation"
+CHANGES_KEY = "recent_changes" # [(generation, video_id)], newest last
+MAX_CHANGES = 1000
+FEED_VERSION_KEY = "feed_version" # random token, replaced whenever a listing changes (see api.py)
+
+
+def current_generation(state):
+    """Bumped on every committed change to the vector store (ingest or delete)."""
+    return state.get(GENERATION_KEY, 0)
+
+
+def bump_generation(state, video_id=None):
+    # Only called while holding write_lock, so read-then-put can't race
+    # video_id=None = store-wide change (e.g. a migration): logged so readers drop everything
+    generation = current_generation(state) + 1
+    changes = state.get(CHANGES_KEY, [])[-(MAX_CHANGES - 1):]
+    state.put(CHANGES_KEY, changes + [(generation, video_id)])
+    state.put(GENERATION_KEY, generation)
+    return generation
+
+
+def changed_videos(state, since_generation):
+    """
+    Video ids changed after `since_generation`, or None if the log no longer
+    reaches back that far (caller should then drop everything).
+    """
+    changes = state.get(CHANGES_KEY, [])
+    if since_generation < current_generation(state) and (not changes or changes[0][0] > since_generation + 1):
+        return None
+    changed = {video_id for generation, video_id in changes if generation > since_generation}
+    return None if None in changed else changed
+
+
+# --- Leases: (token, expires_at) entries in the shared state ---
+# modal.Dict has no compare-and-swap, only put(skip_if_exists=True), so these are
+# built from that plus re-reads. Used by write_lock and the ingest scheduler (jobs.py).
+TAKEOVER_CLAIM_SECONDS = 30.0 # a contender that dies mid-takeover blocks others this long, at most
+CLAIM_SETTLE_SECONDS = 0.1    # longer than one Dict round trip (see _claim)
+
+
+def acquire(state, name, token, lease):
+    """
+    One attempt at the lease `name`: free -> ours; expired -> taken over
+    (atomically, see _take_over); held -> False. Never waits.
+    """
+    if state.put(name, (token, time.time() + lease), skip_if_exists=True):
+        return True
+    holder = state.get(name)
+    if holder and holder[1] < time.time() and _take_over(state, name, holder[0], token, lease):
+        print(f"⏰ Lease {name} expired, took over from {holder[0][:6]}")
+        return True
+    return False
+
+
+def renew(state, name, token, lease):
+    """Pushes our lease out. False if it isn't ours any more (expired and taken over)."""
+    holder = state.get(name)
+    if not holder or holder[0] != token:
+        return False
+    state.put(name, (token, time.time() + lease))
+    return True
+
+
+def release(state, name, token):
+    holder = state.get(name)
+    if holder and holder[0] == token:
+        _drop(state, name)
+
+
+@contextmanager
+def write_lock(state, name="lancedb_writer", lease=900, poll=1.0):
+    """
+    One LanceDB writer at a time across ALL containers.
+    - `state` is a modal.Dict (or LocalState); the key holds (token, expires_at)
+    - A crashed holder can't wedge ingest forever: its lease expires
+    - A live holder renews its lease every lease/3 seconds, however long it holds the lock
+    """
+    import threading
+
+    token = uuid.uuid4().hex
+    waited = time.perf_counter()
+    while not acquire(state, name, token, lease):
+        time.sleep(poll)
+    waited = time.perf_counter() - waited
+    if waited > poll:
+        print(f"🔒 Waited {waited:.1f}s for the write lock")
+
+    released = threading.Event()
+    renewer = threading.Thread(target=_renew, args=(state, name, token, lease, released),
+                               name=f"lease-{name}", daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        released.set()
+        renewer.join()
+        release(state, name, token)
+
+
+def _take_over(state, name, stale, token, lease):
+    """
+    Replaces an expired (stale, expires_at) entry with ours, atomically across
+    containers: contenders first race for a claim on that stale token (_claim
+    picks one winner); only the winner swaps the entry, and only if it still
+    holds the stale token. The final re-read confirms we own it.
+    """
+    claim = f"{name}:takeover:{stale}"
+    if not _claim(state, claim, token):
+        return False
+    try:
+        holder = state.get(name)
+        if holder and holder[0] != stale:
+            return False # released or already taken over: back to the normal path
+        if holder:
+            state.put(name, (token, time.time() + lease))
+        elif not state.put(name, (token, time.time() + lease), skip_if_exists=True):
+            return False
+        holder = state.get(name)
+        return bool(holder) and holder[0] == token
+    finally:
+        release(state, claim, token)
+
+
+def _claim(state, claim, token):
+    """
+    The claim is itself a (token, expires_at) entry, so one left behind by a
+    contender that died mid-takeover expires after TAKEOVER_CLAIM_SECONDS.
+    Replacing an expired claim is write -> wait -> re-read (Fischer's mutual
+    exclusion): of several contenders that all saw it expired, the last writer
+    wins and the others read its token back after CLAIM_SETTLE_SECONDS.
+    """
+    if state.put(claim, (token, time.time() + TAKEOVER_CLAIM_SECONDS), skip_if_exists=True):
+        return True
+    held = state.get(claim)
+    if not held or held[1] >= time.time():
+        return False
+    state.put(claim, (token, time.time() + TAKEOVER_CLAIM_SECONDS))
+    time.sleep(CLAIM_SETTLE_SECONDS)
+    held = state.get(claim)
+    return bool(held) and held[0] == token
+
+
+def _renew(state, name, token, lease, released):
+    """Pushes the lease out while the lock is held (stops once `released` is set)."""
+    while not released.wait(lease / 3):
+        try:
+            if not renew(state, name, token, lease):
+                print(f"⚠️ Lost the {name} lease while holding it")
+                return
+        except Exception as e:
+            print(f"⚠️ Lease renewal failed ({name}): {e}")
+
+
+def _drop(state, name):
+    try:
+        state.pop(name)
+    except KeyError:
+        pass
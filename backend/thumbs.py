@@ -0,0 +1,119 @@
+####################....... thumbs.py
+import json
+import os
+import shutil
+
+THUMBS_DIR = "/data/thumbs" # /data/thumbs/{video_id}/poster.jpg, sprite_0.jpg, ..., sprites.json
+POSTER_SECONDS = 1.0        # skip the (often black) very first frame
+POSTER_WIDTH = 480
+TILE_WIDTH = 160
+TILE_INTERVAL = 2.0         # one sprite tile per 2 s of video
+SHEET_COLUMNS = 10
+SHEET_ROWS = 10             # 100 tiles (200 s) per sprite sheet
+JPEG_QUALITY = 80
+FILES = ("poster.jpg", "sprites.json") # + sprite_{n}.jpg
+
+
+class ThumbnailCollector:
+    """
+    Builds a poster + scrub sprite sheets from frames that are decoded anyway
+    (the 2 fps, 640px extraction pass), so thumbnails cost a resize, not a decode.
+    Use collector.tap as extract's `tap=`; call finish() once the pass is done.
+    """
+
+    def __init__(self, video_id, out_dir=THUMBS_DIR, interval=TILE_INTERVAL, tile_width=TILE_WIDTH,
+                 columns=SHEET_COLUMNS, rows=SHEET_ROWS):
+        self.video_id = video_id
+        self.out_dir = out_dir
+        self.interval = interval
+        self.tile_width = tile_width
+        self.columns = columns
+        self.rows = rows
+        self.poster = None # (timestamp, frame)
+        self.tiles = []    # [(timestamp, small frame)]
+        self.next_tile = 0.0
+
+    def observe(self, timestamp, frame):
+        import cv2
+
+        if self.poster is None or (self.poster[0] < POSTER_SECONDS and timestamp <= POSTER_SECONDS):
+            self.poster = (timestamp, frame)
+        if timestamp >= self.next_tile:
+            height = max(1, round(frame.shape[0] * self.tile_width / frame.shape[1]))
+            self.tiles.append((timestamp, cv2.resize(frame, (self.tile_width, height), interpolation=cv2.INTER_AREA)))
+            self.next_tile = (int(timestamp / self.interval) + 1) * self.interval
+
+    def tap(self, frames):
+        """Passes (timestamp, frame, ...) items through unchanged, watching each one."""
+        for item in frames:
+            self.observe(item[0], item[1])
+            yield item
+
+    def finish(self):
+        """Writes poster.jpg, sprite_{n}.jpg + sprites.json (replacing older ones). Returns the folder."""
+        import cv2
+        import numpy as np
+
+        if self.poster is None:
+            return None
+        folder = os.path.join(self.out_dir, self.video_id)
+        tmp_folder = folder + ".tmp"
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        os.makedirs(tmp_folder)
+        encode = lambda path, rgb: cv2.imwrite(path, cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR),
+                                               [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+
+        # 1. Poster
+        frame = self.poster[1]
+        height = max(1, round(frame.shape[0] * POSTER_WIDTH / frame.shape[1]))
+        encode(os.path.join(tmp_folder, "poster.jpg"),
+               cv2.resize(frame, (POSTER_WIDTH, height), interpolation=cv2.INTER_AREA) if frame.shape[1] > POSTER_WIDTH else frame)
+
+        # 2. Sprite sheets (row-major tiles) + timestamp index
+        tile_height = self.tiles[0][1].shape[0]
+        per_sheet = self.columns * self.rows
+        index = {"interval": self.interval, "tile_width": self.tile_width, "tile_height": tile_height,
+                 "columns": self.columns, "rows": self.rows, "sheets": [], "tiles": []}
+        for sheet_number, first in enumerate(range(0, len(self.tiles), per_sheet)):
+            chunk = self.tiles[first:first + per_sheet]
+            used_rows = -(-len(chunk) // self.columns)
+            sheet = np.zeros((used_rows * tile_height, min(len(chunk), self.columns) * self.tile_width, 3), np.uint8)
+            for i, (timestamp, tile) in enumerate(chunk):
+                x, y = (i % self.columns) * self.tile_width, (i // self.columns) * tile_height
+                sheet[y:y + tile.shape[0], x:x + self.tile_width] = tile[:tile_height]
+                index["tiles"].append({"t": round(float(timestamp), 3), "sheet": sheet_number, "x": x, "y": y})
+            name = f"sprite_{sheet_number}.jpg"
+            encode(os.path.join(tmp_folder, name), sheet)
+            index["sheets"].append(name)
+        with open(os.path.join(tmp_folder, "sprites.json"), "w") as f:
+            json.dump(index, f)
+
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp_folder, folder)
+        print(f"🖼️ Thumbnails: poster + {len(self.tiles)} tiles in {len(index['sheets'])} sheet(s)")
+        return folder
+
+
+def is_thumb_file(name):
+    """Whitelist for the /api/thumbs endpoint (no path tricks)."""
+    if name in FILES:
+        return True
+    number = name[len("sprite_"):-len(".jpg")] if name.startswith("sprite_") and name.endswith(".jpg") else ""
+    return number.isdigit()
+
+
+def remove(video_id, out_dir=THUMBS_DIR):
+    shutil.rmtree(os.path.join(out_dir, video_id), ignore_errors=True)
+
+
+def copy(source_video_id, video_id, out_dir=THUMBS_DIR):
+    """Thumbnails of a byte-identical upload (see dedup.py). False if the source has none."""
+    source = os.path.join(out_dir, source_video_id)
+    if not os.path.isdir(source):
+        return False
+    folder = os.path.join(out_dir, video_id)
+    shutil.rmtree(folder + ".tmp", ignore_errors=True)
+    shutil.copytree(source, folder + ".tmp")
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(folder + ".tmp", folder)
+    return True
@@ -72,6 +72,8 @@ export default function Home({ searchQuery }) {
               <div className="aspect-video bg-black relative flex items-center justify-center overflow-hidden">
                 <video 
                    src={api.getVideoUrl(video.video_id)} 
+                   poster={api.getPosterUrl(video.video_id)}
+                   preload="none"
                    className="w-full h-full object-cover opacity-80 group-hover:opacity-100 transition-opacity"
                    muted
                    onMouseOver={e => e.target.play()}
@@ -74,8 +74,9 @@ export default function Profile() {
                 <Link to={`/video/${video.video_id}`}>
                     <video 
                         src={api.getVideoUrl(video.video_id)} 
+                        poster={api.getPosterUrl(video.video_id)}
                         className="w-full h-full object-cover opacity-80 group-hover:opacity-100 transition-opacity"
-                        preload="metadata"
+                        preload="none"
                         // Note: We don't use 'controls' here to make it look like a clean thumbnail
                     />
                     
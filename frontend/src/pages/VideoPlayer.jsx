@@ -4,6 +4,36 @@ import { useParams } from 'react-router-dom';
 import { api } from '../services/api';
 import { Search, Loader2, Play, Sparkles, AlertCircle, RefreshCw, X, AlertTriangle } from 'lucide-react';
 
+const PREVIEW_WIDTH = 64; // px, the w-16 result thumbnail
+
+// Last sprite tile at or before `seconds` (tiles are in time order)
+function findTile(sprites, seconds) {
+  let found = null;
+  for (const tile of sprites.tiles) {
+    if (tile.t > seconds) break;
+    found = tile;
+  }
+  return found || sprites.tiles[0];
+}
+
+// 🖼️ One tile of a sprite sheet, scaled down to the result thumbnail
+function SpritePreview({ videoId, sprites, seconds }) {
+  const tile = findTile(sprites, seconds);
+  if (!tile) return null;
+  return (
+    <div
+      style={{
+        width: sprites.tile_width,
+        height: sprites.tile_height,
+        backgroundImage: `url(${api.getThumbUrl(videoId, sprites.sheets[tile.sheet])})`,
+        backgroundPosition: `-${tile.x}px -${tile.y}px`,
+        transform: `scale(${PREVIEW_WIDTH / sprites.tile_width})`,
+        transformOrigin: 'top left'
+      }}
+    />
+  );
+}
+
 export default function VideoPlayer() {
   const { videoId } = useParams();
   const [videoUrl, setVideoUrl] = useState('');
@@ -11,6 +41,7 @@ export default function VideoPlayer() {
   const [results, setResults] = useState([]);
   const [isIndexed, setIsIndexed] = useState(false);
   const [isSearching, setIsSearching] = useState(false);
+  const [sprites, setSprites] = useState(null);
   
   // 👇 NEW: State for the Custom Modal
   const [showRepairModal, setShowRepairModal] = useState(false);
@@ -25,6 +56,16 @@ export default function VideoPlayer() {
     return () => { isMountedRef.current = false; };
   }, [videoId]);
 
+  // 👇 Scrub sprites (written by the indexing pass) for the result previews
+  useEffect(() => {
+    if (!isIndexed) return;
+    let cancelled = false;
+    api.getSprites(videoId).then((data) => {
+      if (!cancelled) setSprites(data?.tiles?.length ? data : null);
+    });
+    return () => { cancelled = true; };
+  }, [videoId, isIndexed]);
+
   const checkIndexStatus = async () => {
     if (!isMountedRef.current) return;
     const meta = await api.getVideoStatus(videoId);
@@ -131,6 +172,7 @@ export default function VideoPlayer() {
           <video 
             ref={videoRef}
             src={videoUrl} 
+            poster={api.getPosterUrl(videoId)}
             controls 
             className="w-full h-full max-h-[90vh] object-contain"
             autoPlay
@@ -206,8 +248,13 @@ export default function VideoPlayer() {
               onClick={() => jumpToTimestamp(hit.timestamp)}
               className="w-full bg-black/20 hover:bg-zinc-800 border border-zinc-800 hover:border-purple-500/30 rounded-xl p-3 flex items-center gap-4 transition-all group text-left"
             >
-              <div className="w-16 h-12 bg-zinc-800 rounded-lg flex items-center justify-center group-hover:bg-purple-600/20 transition-colors shrink-0">
-                <Play className="w-5 h-5 text-zinc-500 group-hover:text-purple-400" />
+              <div className="w-16 h-12 bg-zinc-800 rounded-lg flex items-center justify-center group-hover:bg-purple-600/20 transition-colors shrink-0 relative overflow-hidden">
+                {sprites && (
+                  <div className="absolute inset-0">
+                    <SpritePreview videoId={videoId} sprites={sprites} seconds={hit.timestamp} />
+                  </div>
+                )}
+                <Play className="w-5 h-5 text-zinc-500 group-hover:text-purple-400 relative" />
               </div>
               
               <div>
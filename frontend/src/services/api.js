@@ -108,5 +108,19 @@ export const api = {
   },
 
   // 👇 UPDATED: Uses the Full Cloud URL to avoid Proxy Issues
-  getVideoUrl: (videoId) => `${CLOUD_URL}/api/stream/${videoId}`
+  getVideoUrl: (videoId) => `${CLOUD_URL}/api/stream/${videoId}`,
+
+  // 🖼️ Poster + scrub sprites made while indexing (cacheable, no video bytes needed)
+  getPosterUrl: (videoId) => `${CLOUD_URL}/api/thumbs/${videoId}/poster.jpg`,
+  getThumbUrl: (videoId, name) => `${CLOUD_URL}/api/thumbs/${videoId}/${name}`,
+
+  // Sprite index (tile positions per timestamp); null if the video has none yet
+  getSprites: async (videoId) => {
+    try {
+      const res = await api_client.get(`/thumbs/${videoId}/sprites.json`);
+      return res.data;
+    } catch (err) {
+      return null;
+    }
+  }
 };
\ No newline at end of file
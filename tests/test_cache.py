@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from backend import cache
+from backend.cache import LRUCache, QueryCache, ResultCache
+
+
+def _bytes(n):
+    return np.zeros(n, dtype=np.uint8)
+
+
+def test_evicts_least_recently_used_by_bytes():
+    lru = LRUCache(max_bytes=100)
+    lru.put("a", _bytes(40))
+    lru.put("b", _bytes(40))
+    assert lru.get("a") is not None # "b" is now the oldest
+    lru.put("c", _bytes(40))
+    assert lru.get("b") is None
+    assert lru.get("a") is not None and lru.get("c") is not None
+    assert lru.bytes == 80 and lru.evictions == 1
+
+
+def test_one_put_can_evict_several_entries():
+    lru = LRUCache(max_bytes=100)
+    for key in "abcd":
+        lru.put(key, _bytes(25))
+    lru.put("big", _bytes(90))
+    assert lru.stats()["entries"] == 1 and lru.bytes == 90 and lru.evictions == 4
+
+
+def test_oversized_value_is_not_stored():
+    lru = LRUCache(max_bytes=100)
+    lru.put("a", _bytes(50))
+    lru.put("huge", _bytes(101))
+    assert lru.get("huge") is None
+    assert lru.get("a") is not None and lru.bytes == 50
+
+
+def test_replacing_a_key_recounts_its_bytes():
+    lru = LRUCache(max_bytes=100)
+    lru.put("a", _bytes(60))
+    lru.put("a", _bytes(30))
+    assert lru.bytes == 30
+    lru.pop("a")
+    assert lru.bytes == 0 and lru.stats()["entries"] == 0
+
+
+def test_ttl_expires_entries(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: clock[0])
+    lru = LRUCache(max_bytes=100, ttl=10)
+    lru.put("a", _bytes(10))
+    clock[0] += 5
+    assert lru.get("a") is not None
+    clock[0] += 6
+    assert lru.get("a") is None
+    assert lru.expirations == 1 and lru.bytes == 0
+
+
+def test_stats_hit_rate():
+    lru = LRUCache(max_bytes=100)
+    lru.put("a", _bytes(10))
+    lru.get("a")
+    lru.get("missing")
+    stats = lru.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.5
+
+
+def test_query_cache_normalizes_and_resets_on_model_change():
+    calls = []
+
+    def encode(text):
+        calls.append(text)
+        return np.ones(4, dtype=np.float32)
+
+    queries = QueryCache(max_bytes=10_000)
+    first = queries.get_or_encode("m1", "  White   Sneakers ", encode)
+    assert queries.get_or_encode("m1", "white sneakers", encode) is first
+    assert calls == ["white sneakers"]
+    with pytest.raises(ValueError):
+        first[0] = 0 # shared between requests: read-only
+    queries.get_or_encode("m2", "white sneakers", encode)
+    assert len(calls) == 2
+
+
+def test_result_cache_keys_on_generation():
+    results = ResultCache(max_bytes=10_000)
+    assert results.get_or_search("global", "cat", 1, lambda: [{"id": 1}], k=5) == [{"id": 1}]
+    assert results.get_or_search("global", " CAT ", 1, lambda: [{"id": 2}], k=5) == [{"id": 1}]
+    assert results.get_or_search("global", "cat", 2, lambda: [{"id": 3}], k=5) == [{"id": 3}]
@@ -0,0 +1,66 @@
+import numpy as np
+import pyarrow as pa
+
+from backend.dedup import FrameCache
+
+
+class FakeTable:
+    """The slice of a LanceDB table FrameCache._evict touches."""
+
+    def __init__(self, added_at):
+        self.rows = pa.table({"key": [f"k{i}" for i in range(len(added_at))],
+                              "added_at": pa.array(added_at, type=pa.float64())})
+        self.version = 1
+        self.compacted = False
+
+    def count_rows(self):
+        return self.rows.num_rows
+
+    def to_lance(self):
+        return self
+
+    def to_table(self, columns=None):
+        return self.rows.select(columns) if columns else self.rows
+
+    def delete(self, where):
+        column, op, value = where.split()
+        assert (column, op) == ("added_at", "<=")
+        keep = self.rows.column("added_at").to_numpy() > float(value)
+        self.rows = self.rows.filter(pa.array(keep))
+        self.version += 1
+
+    def compact_files(self):
+        self.compacted = True
+
+
+def _cache(max_rows):
+    cache = FrameCache("/unused", max_rows=max_rows)
+    cache.keys, cache.version = {"k0"}, 1
+    return cache
+
+
+def test_evict_is_a_no_op_under_the_cap():
+    tbl = FakeTable([float(i) for i in range(10)])
+    cache = _cache(max_rows=10)
+    assert not cache._evict(tbl)
+    assert tbl.count_rows() == 10 and not tbl.compacted
+    assert cache.keys == {"k0"}
+
+
+def test_evict_drops_the_oldest_down_to_80_percent():
+    added_at = np.random.default_rng(0).permutation(15).astype(float)
+    tbl = FakeTable(list(added_at))
+    cache = _cache(max_rows=10)
+    assert cache._evict(tbl)
+    assert tbl.count_rows() == 8
+    assert sorted(tbl.rows.column("added_at").to_pylist()) == [float(t) for t in range(7, 15)]
+    assert tbl.compacted
+    assert cache.keys is None and cache.version is None # key set reloads from the new version
+
+
+def test_evict_drops_ties_at_the_cutoff_together():
+    # one add() stamps every row with the same added_at: a batch goes or stays as a whole
+    tbl = FakeTable([1.0] * 6 + [2.0] * 6)
+    cache = _cache(max_rows=10)
+    assert cache._evict(tbl)
+    assert tbl.rows.column("added_at").to_pylist() == [2.0] * 6
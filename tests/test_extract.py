@@ -0,0 +1,58 @@
+import shutil
+import subprocess
+
+import pytest
+
+from backend import extract
+
+pytestmark = pytest.mark.skipif(not (shutil.which("ffmpeg") and shutil.which("ffprobe")),
+                                reason="needs ffmpeg + ffprobe")
+
+START_TIME = 3.37 # not on the 0.5 s grid, so an offset bug moves frames between buckets
+
+
+def _clip(path, seconds=8, start_time=0.0):
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+                    "-i", f"testsrc=duration={seconds}:size=320x240:rate=30000/1001",
+                    "-c:v", "mpeg4", "-output_ts_offset", str(start_time), str(path)], check=True)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def offset_clip(tmp_path_factory):
+    return _clip(tmp_path_factory.mktemp("clips") / "offset.mkv", start_time=START_TIME)
+
+
+def _timestamps(frames):
+    return [timestamp for timestamp, _ in frames]
+
+
+def test_probe_reports_the_container_start_time(offset_clip):
+    assert extract._probe(offset_clip)[2] == pytest.approx(START_TIME, abs=1e-3)
+
+
+def test_full_pass_timestamps_are_zero_based(offset_clip, tmp_path):
+    timestamps = _timestamps(extract.iter_frames_ffmpeg(offset_clip))
+    plain = _timestamps(extract.iter_frames_ffmpeg(_clip(tmp_path / "plain.mkv")))
+    assert timestamps == plain
+    assert timestamps[0] == 0.0 and timestamps[-1] < 8
+    assert [int(t * 2) for t in timestamps] == list(range(16)) # one frame per 0.5 s bucket
+
+
+def test_ranges_match_the_full_pass(offset_clip):
+    full = _timestamps(extract.iter_frames_ffmpeg(offset_clip))
+    ranges = [(0.0, 2.5), (2.5, 5.0), (5.0, None)]
+    pieces = [_timestamps(extract.iter_frames_ffmpeg(offset_clip, start, end)) for start, end in ranges]
+    assert sum(pieces, []) == full
+    for (start, end), piece in zip(ranges, pieces):
+        assert all(start <= t and (end is None or t < end) for t in piece)
+
+
+@pytest.mark.parametrize("extractor", ["ffmpeg", "opencv"])
+def test_sharded_decoding_matches_one_pass_on_an_offset_start(offset_clip, extractor):
+    import numpy as np
+
+    single = list(extract.EXTRACTORS[extractor](offset_clip))
+    sharded = list(extract.iter_frames_sharded(offset_clip, workers=2, extractor=extractor, chunk_seconds=2.5))
+    assert _timestamps(sharded) == _timestamps(single)
+    assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(sharded, single))
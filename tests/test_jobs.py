@@ -0,0 +1,153 @@
+import time
+
+import pytest
+
+from backend import jobs, store
+from backend.store import LocalState
+
+
+@pytest.fixture(autouse=True)
+def fast_claims(monkeypatch):
+    monkeypatch.setattr(store, "CLAIM_SETTLE_SECONDS", 0.01)
+
+
+def _queue(state):
+    return state.get(jobs.QUEUE_KEY, {})
+
+
+def test_enqueue_coalesces_waiting_jobs_for_the_same_video():
+    state = LocalState()
+    first, coalesced = jobs.enqueue(state, "v1", "backfill", {"a": 1}, size_bytes=10, now=100)
+    assert not coalesced
+    job, coalesced = jobs.enqueue(state, "v1", "upload", {"b": 2}, now=200)
+    assert coalesced and job["job_id"] == first["job_id"]
+    queued = _queue(state)[first["job_id"]]
+    assert queued["kind"] == "upload" and queued["priority"] == jobs.PRIORITIES["upload"]
+    assert queued["params"] == {"a": 1, "b": 2}
+    assert queued["enqueued_at"] == 100 and queued["coalesced"] == 1
+
+
+def test_claim_packs_in_priority_order():
+    state = LocalState()
+    jobs.enqueue(state, "backfill", "backfill", {}, size_bytes=1, now=1)
+    jobs.enqueue(state, "reindex", "reindex", {}, size_bytes=1, now=2)
+    jobs.enqueue(state, "upload", "upload", {}, size_bytes=1, now=3)
+    batch, abandoned = jobs.claim(state, "w", pack_jobs=2, now=10)
+    assert [job["video_id"] for job in batch] == ["upload", "reindex"]
+    assert abandoned == []
+    assert all(job["lease_until"] == 10 + jobs.JOB_LEASE for job in batch)
+
+
+def test_claim_stops_at_pack_bytes_but_always_takes_one():
+    state = LocalState()
+    jobs.enqueue(state, "big", "upload", {}, size_bytes=100, now=1)
+    jobs.enqueue(state, "small", "upload", {}, size_bytes=1, now=2)
+    batch, _ = jobs.claim(state, "w", pack_bytes=50, now=10)
+    assert [job["video_id"] for job in batch] == ["big"]
+
+
+def test_expired_job_lease_is_claimed_again_then_abandoned():
+    state = LocalState()
+    jobs.enqueue(state, "v1", "upload", {}, now=0)
+    now = 10
+    for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+        batch, _ = jobs.claim(state, f"w{attempt}", now=now)
+        assert [job["attempts"] for job in batch] == [attempt]
+        assert jobs.claim(state, "other", now=now + 1) == ([], []) # still leased
+        now += jobs.JOB_LEASE + 1
+    batch, abandoned = jobs.claim(state, "last", now=now)
+    assert batch == [] and [job["video_id"] for job in abandoned] == ["v1"]
+    assert _queue(state) == {}
+    assert state.get(jobs.HISTORY_KEY)[-1]["status"] == "failed"
+
+
+def test_renew_jobs_only_touches_our_claims():
+    state = LocalState()
+    jobs.enqueue(state, "v1", "upload", {}, now=0)
+    batch, _ = jobs.claim(state, "w", now=0)
+    jobs.renew_jobs(state, "w", batch, now=100)
+    assert _queue(state)[batch[0]["job_id"]]["lease_until"] == 100 + jobs.JOB_LEASE
+    jobs.renew_jobs(state, "someone-else", batch, now=200)
+    assert _queue(state)[batch[0]["job_id"]]["lease_until"] == 100 + jobs.JOB_LEASE
+
+
+def test_drain_runs_everything_and_lets_go():
+    state = LocalState()
+    for video_id in ("v1", "v2", "v3"):
+        jobs.enqueue(state, video_id, "upload", {})
+    seen = []
+
+    def run_batch(batch):
+        seen.extend(job["video_id"] for job in batch)
+        return {job["job_id"]: ("completed", {"embed": 1.0}, {"frames": 2}) for job in batch}
+
+    finished = jobs.drain(state, run_batch, pack_jobs=2)
+    assert sorted(seen) == ["v1", "v2", "v3"]
+    assert [record["status"] for record in finished] == ["completed"] * 3
+    assert _queue(state) == {}
+    assert not jobs.scheduler_active(state)
+    assert jobs.job_status(state, "v2")["state"] == "finished"
+
+
+def test_drain_fails_the_batch_when_run_batch_raises():
+    state = LocalState()
+    jobs.enqueue(state, "v1", "upload", {})
+
+    def run_batch(batch):
+        raise RuntimeError("boom")
+
+    assert [record["status"] for record in jobs.drain(state, run_batch)] == ["failed"]
+    assert _queue(state) == {}
+
+
+def test_drain_returns_at_once_while_another_scheduler_is_active():
+    state = LocalState()
+    jobs.enqueue(state, "v1", "upload", {})
+    state.put(jobs.SCHEDULER_KEY, ("other", time.time() + 60))
+    assert jobs.drain(state, lambda batch: pytest.fail("ran a batch")) == []
+    assert jobs.pending_count(state) == 1
+
+
+def test_drain_takes_over_an_expired_scheduler():
+    state = LocalState()
+    jobs.enqueue(state, "v1", "upload", {})
+    state.put(jobs.SCHEDULER_KEY, ("dead", time.time() - 1))
+    finished = jobs.drain(state, lambda batch: {job["job_id"]: ("completed", {}, {}) for job in batch})
+    assert [record["video_id"] for record in finished] == ["v1"]
+    assert not jobs.scheduler_active(state)
+
+
+def test_drain_stops_at_its_budget_and_leaves_the_rest_pending():
+    state = LocalState()
+    jobs.enqueue(state, "v1", "upload", {})
+    assert jobs.drain(state, lambda batch: pytest.fail("ran a batch"), budget=0) == []
+    assert jobs.pending_count(state) == 1
+    assert not jobs.scheduler_active(state) # a new scheduler can start straight away
+
+
+def test_heartbeat_renews_leases_during_a_long_batch(monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_SECONDS", 0.05)
+    state = LocalState()
+    jobs.enqueue(state, "v1", "upload", {})
+    leases = []
+
+    def run_batch(batch):
+        claimed = _queue(state)[batch[0]["job_id"]]["lease_until"]
+        scheduler = state.get(jobs.SCHEDULER_KEY)[1]
+        time.sleep(0.2)
+        leases.append((_queue(state)[batch[0]["job_id"]]["lease_until"] > claimed,
+                       state.get(jobs.SCHEDULER_KEY)[1] > scheduler))
+        return {job["job_id"]: ("completed", {}, {}) for job in batch}
+
+    jobs.drain(state, run_batch)
+    assert leases == [(True, True)]
+
+
+def test_record_direct_appends_to_the_history():
+    state = LocalState()
+    jobs.record_direct(state, "v1", "completed", {"embed": 1.23456})
+    jobs.record_direct(state, "v2", "failed")
+    history = state.get(jobs.HISTORY_KEY)
+    assert [record["video_id"] for record in history] == ["v1", "v2"]
+    assert history[0]["stages"] == {"embed": 1.235}
+    assert jobs.job_status(state, "v1")["status"] == "completed"
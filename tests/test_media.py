@@ -0,0 +1,57 @@
+import pytest
+
+from backend.media import http_date, not_modified, parse_range, range_applies
+
+TAG = '"3e8-17d"'
+MTIME = 1_700_000_000.7
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),      # suffix longer than the file: all of it
+    ("bytes=900-5000", (900, 999)), # end clamped to the last byte
+    ("bytes=999-999", (999, 999)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [None, "", "items=0-1", "bytes=0-1,5-9", "bytes=a-b", "bytes=-"])
+def test_parse_range_ignored(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=50-10", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_not_modified_by_etag():
+    assert not_modified({"if-none-match": TAG}, TAG, MTIME)
+    assert not_modified({"if-none-match": f'"other", W/{TAG}'}, TAG, MTIME)
+    assert not_modified({"if-none-match": "*"}, TAG, MTIME)
+    assert not not_modified({"if-none-match": '"other"'}, TAG, MTIME)
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    headers = {"if-none-match": '"other"', "if-modified-since": http_date(MTIME + 60)}
+    assert not not_modified(headers, TAG, MTIME)
+
+
+def test_not_modified_by_date():
+    # HTTP dates have whole seconds: the same second as mtime counts as unchanged
+    assert not_modified({"if-modified-since": http_date(MTIME)}, TAG, MTIME)
+    assert not not_modified({"if-modified-since": http_date(MTIME - 60)}, TAG, MTIME)
+    assert not not_modified({"if-modified-since": "yesterday"}, TAG, MTIME)
+    assert not not_modified({}, TAG, MTIME)
+
+
+def test_range_applies():
+    assert range_applies({}, TAG, MTIME)
+    assert range_applies({"if-range": TAG}, TAG, MTIME)
+    assert not range_applies({"if-range": '"other"'}, TAG, MTIME)
+    assert range_applies({"if-range": http_date(MTIME)}, TAG, MTIME)
+    assert not range_applies({"if-range": http_date(MTIME - 60)}, TAG, MTIME)
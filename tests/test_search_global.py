@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from backend.search_global import DEFAULT_RULES, best_frames, fuse
+
+
+def _meta(*rows):
+    return pd.DataFrame(rows, columns=["video_id", "title", "_distance"])
+
+
+def _frames(*rows):
+    return pd.DataFrame(rows, columns=["video_id", "timestamp", "score"])
+
+
+def test_best_frames_keeps_each_videos_best_frame():
+    hits = _frames(("a", 1.0, 0.3), ("a", 2.0, 0.5), ("b", 3.0, 0.2), ("c", 4.0, 0.1))
+    best = best_frames(hits, visual_min=0.15)
+    assert best.to_dict("records") == [
+        {"video_id": "a", "visual_score": 0.5, "timestamp": 2.0},
+        {"video_id": "b", "visual_score": 0.2, "timestamp": 3.0},
+    ]
+
+
+def test_best_frames_top_m_averages_the_best_frames():
+    hits = _frames(("a", 1.0, 0.3), ("a", 2.0, 0.5), ("a", 3.0, 0.2))
+    best = best_frames(hits, visual_min=0.0, top_m=2)
+    assert best["visual_score"].tolist() == [pytest.approx(0.4)]
+    assert best["timestamp"].tolist() == [2.0] # still jumps to the single best frame
+
+
+def test_fuse_match_types_and_scores():
+    meta = _meta(("both", "Both", 0.5), ("title", "Title only", 0.6), ("weak", "Weak", 0.95))
+    frames = best_frames(_frames(("both", 4.0, 0.3), ("visual", 7.5, 0.9)), visual_min=0.15)
+    results = {r["video_id"]: r for r in fuse(meta, frames, DEFAULT_RULES, k=10)}
+
+    assert set(results) == {"both", "title", "visual"} # "weak" is under title_min
+    assert results["both"]["match_type"] == "Title Match + Visuals"
+    assert results["both"]["score"] == pytest.approx(0.5 * 1.2 + 0.05)
+    assert results["both"]["timestamp"] == 4.0
+    assert results["title"]["match_type"] == "Title Match"
+    assert results["title"]["score"] == pytest.approx(0.4 * 1.2)
+    assert results["title"]["timestamp"] is None
+    assert results["visual"]["match_type"] == "Visual Match"
+    assert results["visual"]["title"] == "Untitled (Visual Match)"
+    assert results["visual"]["score"] == pytest.approx(0.9)
+    assert results["visual"]["score_display"] == 90.0
+
+
+def test_fuse_orders_by_score_and_cuts_at_k():
+    meta = _meta(("t", "T", 0.5), ("t", "T again", 0.7)) # duplicate title rows count once
+    frames = best_frames(_frames(("v1", 1.0, 0.9), ("v2", 2.0, 0.2)), visual_min=0.15)
+    results = fuse(meta, frames, DEFAULT_RULES, k=2)
+    assert [r["video_id"] for r in results] == ["v1", "t"]
+    assert results[1]["title"] == "T"
+
+
+def test_fuse_caps_score_display_and_keeps_span_end():
+    frames = pd.DataFrame({"video_id": ["v"], "visual_score": [1.4], "timestamp": [3.0], "span_end": [5.0]})
+    [result] = fuse(_meta(), frames, DEFAULT_RULES, k=5)
+    assert result["score_display"] == 100
+    assert result["end_timestamp"] == 5.0
+
+
+def test_fuse_nothing_to_fuse():
+    assert fuse(_meta(), best_frames(_frames(), visual_min=0.15), DEFAULT_RULES, k=5) == []
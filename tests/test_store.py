@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from backend import store
+from backend.store import LocalState, acquire, write_lock
+
+
+class CountingState(LocalState):
+    def __init__(self):
+        super().__init__()
+        self.gets = 0
+
+    def get(self, key, default=None):
+        self.gets += 1
+        return super().get(key, default)
+
+
+@pytest.fixture(autouse=True)
+def fast_claims(monkeypatch):
+    monkeypatch.setattr(store, "CLAIM_SETTLE_SECONDS", 0.01)
+
+
+def test_lock_is_released():
+    state = LocalState()
+    with write_lock(state, "lock", poll=0.01):
+        assert "lock" in state
+    assert "lock" not in state
+
+
+def test_lease_is_renewed_while_held():
+    state = LocalState()
+    with write_lock(state, "lock", lease=0.3, poll=0.01):
+        first = state["lock"][1]
+        time.sleep(0.5)
+        assert state["lock"][1] > first
+        assert state["lock"][1] > time.time()
+
+
+def test_expired_lease_is_taken_over():
+    state = LocalState()
+    state["lock"] = ("dead", time.time() - 1)
+    with write_lock(state, "lock", poll=0.01):
+        assert state["lock"][0] != "dead"
+    assert list(state) == []
+
+
+def test_orphaned_expired_claim_does_not_wedge_the_lock():
+    state = LocalState()
+    state["lock"] = ("dead", time.time() - 1)
+    state["lock:takeover:dead"] = ("dead-contender", time.time() - 1)
+    with write_lock(state, "lock", poll=0.01):
+        assert state["lock"][0] not in ("dead", "dead-contender")
+    assert list(state) == []
+
+
+def test_orphaned_live_claim_waits_without_spinning():
+    state = CountingState()
+    state["lock"] = ("dead", time.time() - 1)
+    state["lock:takeover:dead"] = ("dead-contender", time.time() + 0.3)
+    assert not acquire(state, "lock", "me", 60)
+    acquired = threading.Event()
+
+    def take():
+        with write_lock(state, "lock", poll=0.05):
+            acquired.set()
+
+    start = time.time()
+    thread = threading.Thread(target=take)
+    thread.start()
+    thread.join(timeout=5)
+    assert acquired.is_set()
+    assert time.time() - start >= 0.25 # only once the claim expired
+    assert state.gets < 100            # polled, not busy-spun
+
+
+def test_one_holder_at_a_time_through_a_takeover():
+    state = LocalState()
+    state["lock"] = ("dead", time.time() - 1)
+    inside, most = [0], [0]
+    guard = threading.Lock()
+
+    def work():
+        for _ in range(10):
+            with write_lock(state, "lock", lease=5, poll=0.001):
+                with guard:
+                    inside[0] += 1
+                    most[0] = max(most[0], inside[0])
+                time.sleep(0.001)
+                with guard:
+                    inside[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert most[0] == 1
+    assert list(state) == []